@@ -1,18 +1,76 @@
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, Response, render_template, jsonify, request, send_from_directory
+import json
 import threading
 import time
 import os
-from storage import TaskManager
-from crawler import Crawler
-from exporter import export_task_to_excel, generate_filename
+from urllib.parse import quote
+from storage import TaskManager, CheckpointWriter, CHECKPOINT_INTERVAL, CHECKPOINT_MAX_DIRTY
+from search import SearchIndex
+from game_cache import GameCache, DEFAULT_CACHE_TTL_DAYS
+from html_cache import HtmlCache, reextract_task
+import similar
+import metrics
+from profiler import ProfilerManager, PROFILE_FILES, DEFAULT_INTERVAL, MAX_DURATION
+from crawler import CrawlerManager, FetchStats, MAX_CONCURRENCY, MAX_SHARDS, FETCH_STRATEGIES, EXTRACTORS, HTML_EXTRACTORS, PLACEHOLDER_TITLE
+from exporter import stream_export, generate_filename, available_formats, EXPORT_FORMATS
 
 app = Flask(__name__)
 
 # Global instances
-task_manager = TaskManager()
-crawler = Crawler()
+# 存储后端: json (默认) 或 sqlite；JSON 文件格式: json (默认) / compact / gzip / xz
+task_manager = TaskManager(backend=os.environ.get('TASK_BACKEND', 'json'),
+                           task_format=os.environ.get('TASK_FORMAT', 'json'))
+# 爬虫检查点在后台线程写入；CHECKPOINT_INTERVAL 秒内的多次保存合并为一次
+checkpoint_writer = CheckpointWriter(
+    task_manager,
+    interval=float(os.environ.get('CHECKPOINT_INTERVAL', CHECKPOINT_INTERVAL)),
+    max_dirty=int(os.environ.get('CHECKPOINT_MAX_DIRTY', CHECKPOINT_MAX_DIRTY)))
+# 跨任务的游戏记录缓存：启动时导入已有任务的记录
+game_cache = GameCache.in_dir(task_manager.tasks_dir)
+threading.Thread(target=game_cache.seed, args=(task_manager,),
+                 daemon=True).start()
+# 抓取到的原始 HTML（压缩保存，可离线重新解析），HTML_CACHE=0 关闭
+html_cache = HtmlCache.in_dir(task_manager.tasks_dir) \
+    if os.environ.get('HTML_CACHE', '1') != '0' else None
+# 每个任务一个爬虫，共享一个 Chromium、全局请求预算（每秒请求数）和记录缓存
+crawlers = CrawlerManager(global_rps=float(
+    os.environ.get('CRAWL_GLOBAL_RPS', 5.0)), game_cache=game_cache,
+    html_cache=html_cache)
 active_task_filename = None
 
+# 所有任务的全文索引：启动时在后台补建，之后随抓取增量更新
+search_index = SearchIndex(task_manager.tasks_dir)
+threading.Thread(target=search_index.sync, args=(task_manager,),
+                 daemon=True).start()
+# 描述相似度索引（需要 numpy/scipy），查询时按需构建
+similar_index = similar.SimilarityIndex(task_manager.tasks_dir)
+
+
+def profiled_threads():
+    """{线程ID: 标签}：运行中任务的爬虫线程和 Flask 请求线程。"""
+    threads = {}
+    for filename in crawlers.running_filenames():
+        crawler = crawlers.find(filename)
+        if crawler is None:
+            continue
+        for name, t in crawler.threads():
+            threads[t.ident] = f"{name}:{filename}"
+    for t in threading.enumerate():
+        if 'process_request_thread' in t.name:
+            threads[t.ident] = 'request'
+    threads[checkpoint_writer.thread.ident] = 'checkpoint'
+    return threads
+
+
+# 按需采样分析，结果保存在 tasks/profiles/
+profiler = ProfilerManager.in_dir(task_manager.tasks_dir, profiled_threads)
+
+
+def target_filename():
+    """/api/crawler/* 的目标任务：请求中的 filename 参数，默认为当前加载的任务。"""
+    body = request.get_json(silent=True) or {}
+    return request.args.get('filename') or body.get('filename') or active_task_filename
+
 
 @app.route('/')
 def index():
@@ -25,6 +83,7 @@ def list_tasks():
     # Mark which one is active
     for t in tasks:
         t['is_active'] = (t['filename'] == active_task_filename)
+        t['is_running'] = crawlers.is_running(t['filename'])
 
     return jsonify(tasks)
 
@@ -37,6 +96,10 @@ def create_task():
     start_page = data.get('start_page')
     end_page = data.get('end_page')
     name = data.get('name')
+    auto_range = bool(data.get('auto_range'))
+    if auto_range and end_page in (None, ''):
+        # 终止页在启动时自动确定
+        end_page = start_page
 
     if not task_type or not target_name or start_page is None or end_page is None:
         return jsonify({'error': 'Missing required parameters'}), 400
@@ -54,7 +117,7 @@ def create_task():
         return jsonify({'error': 'Start Page cannot be greater than End Page'}), 400
 
     result = task_manager.create_task(
-        task_type, target_name, start_page, end_page, name)
+        task_type, target_name, start_page, end_page, name, auto_range=auto_range)
     if result[0] is None:
         # Error occurred
         return jsonify(result[1]), 400
@@ -72,7 +135,7 @@ def rename_task(filename):
     if not new_name:
         return jsonify({'error': 'Missing name'}), 400
 
-    if active_task_filename == filename and crawler.running:
+    if crawlers.is_running(filename):
         return jsonify({'error': 'Cannot rename running task'}), 400
 
     new_filename, error = task_manager.rename_task(filename, new_name)
@@ -81,6 +144,9 @@ def rename_task(filename):
         return jsonify({'error': error}), 400
 
     # 如果重命名了当前活动任务，更新全局引用
+    crawlers.rename(filename, new_filename)
+    search_index.rename(filename, new_filename)
+    similar_index.rename(filename, new_filename)
     if active_task_filename == filename:
         active_task_filename = new_filename
 
@@ -92,7 +158,7 @@ def update_task(filename):
     global active_task_filename
 
     # 如果任务正在运行，阻止更新
-    if active_task_filename == filename and crawler.running:
+    if crawlers.is_running(filename):
         return jsonify({'error': 'Cannot update running task'}), 400
 
     data = request.json
@@ -162,6 +228,9 @@ def update_task(filename):
         if updated_logic:
             task_manager.save_task(new_filename, new_task)
 
+    crawlers.rename(filename, new_filename)
+    search_index.rename(filename, new_filename)
+    similar_index.rename(filename, new_filename)
     if active_task_filename == filename:
         active_task_filename = new_filename
 
@@ -179,12 +248,15 @@ def get_task(filename):
 @app.route('/api/tasks/<filename>', methods=['DELETE'])
 def delete_task(filename):
     global active_task_filename
+    if crawlers.is_running(filename):
+        return jsonify({'error': 'Cannot delete running task'}), 400
+    crawlers.discard(filename)
     if active_task_filename == filename:
-        if crawler.running:
-            return jsonify({'error': 'Cannot delete running task'}), 400
         active_task_filename = None
 
     if task_manager.delete_task(filename):
+        search_index.remove(filename)
+        similar_index.remove(filename)
         return jsonify({'status': 'deleted'})
     return jsonify({'error': 'Task not found'}), 404
 
@@ -193,9 +265,7 @@ def delete_task(filename):
 def load_task(filename):
     global active_task_filename
 
-    if crawler.running:
-        return jsonify({'error': 'Crawler is running. Stop it first.'}), 400
-
+    # 其它任务可以继续在后台运行
     task = task_manager.load_task(filename)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
@@ -206,138 +276,364 @@ def load_task(filename):
 
 @app.route('/api/tasks/<filename>/export', methods=['GET'])
 def export_task(filename):
-    task = task_manager.load_task(filename)
-    if not task:
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in available_formats():
+        return jsonify({'error': f'Unsupported format, expected one of {available_formats()}'}), 400
+
+    summary = task_manager.get_summary(filename)
+    if not summary:
         return jsonify({'error': 'Task not found'}), 404
 
-    excel_file = export_task_to_excel(task)
-    if not excel_file:
+    # 记录逐条写入响应，不在内存中构建整个文件
+    chunks = stream_export(lambda: task_manager.iter_records(filename), fmt)
+    if chunks is None:
         return jsonify({'error': 'No data to export'}), 400
 
-    download_name = generate_filename(task)
+    download_name = generate_filename(summary, fmt)
+    response = Response(chunks, mimetype=EXPORT_FORMATS[fmt][0])
+    response.headers['Content-Disposition'] = \
+        f"attachment; filename*=UTF-8''{quote(download_name)}"
+    return response
+
+
+@app.route('/api/tasks/<filename>/reextract', methods=['POST'])
+def reextract(filename):
+    """用缓存的 HTML 重新解析任务记录（不访问网络）。"""
+    if not html_cache:
+        return jsonify({'error': 'HTML cache is disabled'}), 400
+    if crawlers.is_running(filename):
+        return jsonify({'error': 'Cannot re-extract running task'}), 400
+
+    stats, updated = reextract_task(task_manager, filename, html_cache)
+    if stats is None:
+        return jsonify({'error': 'Task not found'}), 404
+    for item in updated:
+        search_index.add(filename, item)
+        game_cache.update_record(item)
+    if updated:
+        similar_index.mark_dirty(filename)
+    return jsonify({'status': 'done', **stats})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus 文本格式
+    return Response(metrics.REGISTRY.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=download_name
-    )
+
+@app.route('/api/profiler', methods=['GET'])
+def profiler_status():
+    status = profiler.status()
+    status['sessions'] = profiler.list_sessions()
+    return jsonify(status)
+
+
+@app.route('/api/profiler/start', methods=['POST'])
+def start_profiler():
+    data = request.json or {}
+    try:
+        interval = float(data.get('interval_ms', DEFAULT_INTERVAL * 1000)) / 1000
+        duration = float(data.get('duration', MAX_DURATION))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'interval_ms and duration must be numbers'}), 400
+
+    session = profiler.start(interval, duration)
+    if session is None:
+        return jsonify({'error': 'Profiler already running'}), 400
+    return jsonify({'status': 'started', 'session': session})
+
+
+@app.route('/api/profiler/stop', methods=['POST'])
+def stop_profiler():
+    info = profiler.stop()
+    if info is None:
+        return jsonify({'error': 'Profiler not running'}), 400
+    return jsonify({'status': 'stopped', 'session': info})
+
+
+@app.route('/api/profiler/<session>/<kind>', methods=['GET'])
+def download_profile(session, kind):
+    if kind not in PROFILE_FILES:
+        return jsonify({'error': 'Unknown profile file'}), 400
+    # send_from_directory 会拒绝目录之外的路径
+    return send_from_directory(os.path.abspath(profiler.dir), session + PROFILE_FILES[kind],
+                               as_attachment=True)
+
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Limit must be an integer'}), 400
+
+    return jsonify(search_index.search(
+        query, limit=limit, filename=request.args.get('filename')))
+
+
+@app.route('/api/similar', methods=['GET'])
+def similar_games():
+    if not similar.available():
+        return jsonify({'error': 'Similarity search requires numpy and scipy'}), 501
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Limit must be an integer'}), 400
+
+    start = time.monotonic()
+    hits = similar_index.similar(
+        task_manager, query, limit=limit, filename=request.args.get('filename'))
+    docs = search_index.lookup((fn, gid) for gid, _, fn in hits)
+    results = []
+    for gid, score, fn in hits:
+        title, url = docs.get((fn, gid), (None, None))
+        results.append({'ID': gid, 'Title': title, 'URL': url,
+                        'score': round(score, 4), 'task': fn})
+    return jsonify({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.monotonic() - start) * 1000, 2),
+    })
 
 # --- Crawler Control API ---
 
 
-def save_task_callback(task_data):
+def save_task_callback(task_data, final=False):
     # Use the filename from the task data if available, otherwise fall back to active_task_filename
+    filename = task_data.get('filename') or active_task_filename
+    if not filename:
+        return
+    if final:
+        # 爬虫结束：等待写完，之后从磁盘加载的状态是最新的
+        checkpoint_writer.flush(filename, task_data)
+    else:
+        checkpoint_writer.submit(filename, task_data)
+
+
+def record_task_callback(task_data, kind, value):
     filename = task_data.get('filename') or active_task_filename
     if filename:
-        task_manager.save_task(filename, task_data)
+        # 记录仍同步写入（journal/SQLite 后端崩溃时最多丢一条），搜索索引在后台更新
+        task_manager.record(filename, kind, value)
+        if kind == 'game':
+            checkpoint_writer.run_later(search_index.add, filename, value)
+            similar_index.mark_dirty(filename)
 
 
 @app.route('/api/crawler/start', methods=['POST'])
 def start_crawler():
-    global active_task_filename
-
-    if not active_task_filename:
+    filename = target_filename()
+    if not filename:
         return jsonify({'error': 'No task loaded'}), 400
 
-    task_data = task_manager.load_task(active_task_filename)
-    if not task_data:
-        return jsonify({'error': 'Task file missing'}), 404
+    crawler = crawlers.find(filename)
 
     # If crawler is already running, just return status
-    if crawler.running:
+    if crawler and crawler.running:
         if crawler.paused:
             crawler.resume()
             return jsonify({'status': 'resumed'})
         return jsonify({'status': 'already_running'})
 
+    task_data = task_manager.load_state(filename)
+    if not task_data:
+        return jsonify({'error': 'Task file missing'}), 404
+    crawler = crawlers.get(filename)
+
     # Start new crawl session
-    crawler.start(task_data, save_callback=save_task_callback)
+    crawler.start(task_data, save_callback=save_task_callback,
+                  record_callback=record_task_callback)
     return jsonify({'status': 'started'})
 
 
 @app.route('/api/crawler/pause', methods=['POST'])
 def pause_crawler():
-    crawler.pause()
+    crawler = crawlers.find(target_filename())
+    if crawler:
+        crawler.pause()
     return jsonify({'status': 'paused'})
 
 
 @app.route('/api/crawler/stop', methods=['POST'])
 def stop_crawler():
-    crawler.stop()
+    crawler = crawlers.find(target_filename())
+    if crawler:
+        crawler.stop()
     return jsonify({'status': 'stopped'})
 
 
-@app.route('/api/crawler/status', methods=['GET'])
-def crawler_status():
-    if not active_task_filename:
-        return jsonify({
+def build_status(filename):
+    """状态数据只来自内存：运行中取爬虫的 task_data，否则取任务索引摘要，不解析任务文件。"""
+    if not filename:
+        return {
             'active': False,
             'message': 'No task loaded'
-        })
+        }
 
-    # 从文件加载任务数据以确保持久化
-    td = task_manager.load_task(active_task_filename)
-    if not td:
-        return jsonify({'active': False, 'message': 'Task file not found'})
-
-    # 如果爬虫正在运行此任务，使用内存数据更新进度字段
-    # 这样可以提供流畅的UI更新，而无需频繁的磁盘I/O
-    if crawler.running and crawler.task_data and crawler.task_data.get('filename') == active_task_filename:
-        current_page = crawler.task_data.get('current_page')
-        count = len(crawler.task_data.get('data', []))
-        failed_count = len(crawler.task_data.get('failed_ids', []))
-        queue_size = len(crawler.task_data.get('custom_queue', []))
+    # 只查找不创建：客户端传入的任意文件名不会在管理器中留下爬虫
+    crawler = crawlers.find(filename)
+    running = bool(crawler and crawler.running)
+    running_this = running and crawler.task_data is not None
+
+    if running_this:
+        td = crawler.task_data
+        cq = td.get('custom_queue', [])
+        info = {
+            'current_page': td.get('current_page'),
+            'start_page': td.get('start_page'),
+            'end_page': td.get('end_page'),
+            'count': len(td.get('data', [])),
+            'failed_count': len(td.get('failed_ids', [])),
+            'retry_count': len(td.get('retry_schedule')),
+            'dead_count': len(td.get('dead_ids')),
+            'queue_size': len(cq),
+            'queue_head': cq[0] if cq else None,
+            'delay': td.get('delay', 1.0),
+            'concurrency': td.get('concurrency', 1),
+            'fetch_strategy': td.get('fetch_strategy', 'auto'),
+            'shards': td.get('shards', 1),
+            'extractor': td.get('extractor', 'auto'),
+            'adaptive_rate': bool(td.get('adaptive_rate')),
+            'auto_range': bool(td.get('auto_range')),
+            'cache_ttl_days': td.get('cache_ttl_days', DEFAULT_CACHE_TTL_DAYS),
+            'status': td.get('status')
+        }
     else:
-        current_page = td.get('current_page')
-        count = len(td.get('data', []))
-        failed_count = len(td.get('failed_ids', []))
-        queue_size = len(td.get('custom_queue', []))
+        info = task_manager.get_summary(filename)
+        if not info:
+            return {'active': False, 'message': 'Task file not found'}
 
     # 确定 display_id (显示为 "当前ID" 的内容)
     display_id = "-"
 
-    if crawler.running and crawler.task_data and crawler.task_data.get('filename') == active_task_filename:
-        if hasattr(crawler, 'processing_id') and crawler.processing_id is not None:
-            display_id = crawler.processing_id
-        else:
-            # 爬虫正在运行但尚未选取ID（启动阶段）
-            # 如果有自定义队列，显示其第一项
-            cq = crawler.task_data.get('custom_queue', [])
-            if cq:
-                display_id = cq[0]
-    elif not crawler.running:
-        # 如果已停止，且队列中有项目，显示第一项
-        custom_queue = td.get('custom_queue', [])
-        if custom_queue:
-            display_id = custom_queue[0]
-
-    status_data = {
+    if running_this and crawler.processing_id is not None:
+        display_id = crawler.processing_id
+    elif info['queue_head'] is not None:
+        # 爬虫正在运行但尚未选取ID（启动阶段），或已停止：
+        # 如果有自定义队列，显示其第一项
+        display_id = info['queue_head']
+
+    return {
         'active': True,
-        'filename': active_task_filename,
-        'running': crawler.running,
-        'paused': crawler.paused,
+        'filename': filename,
+        'running': running,
+        'paused': bool(crawler and crawler.paused),
 
         # 运行时信息（日志，当前活动）
-        'current_url': crawler.current_url if crawler.running else td.get('current_url', ''),
-        'current_title': crawler.current_title if crawler.running else td.get('current_title', ''),
-        'current_desc': crawler.current_desc if crawler.running else td.get('current_desc', ''),
-        'logs': crawler.logs,
-
-        # 进度信息（内存或文件）
-        'current_page': current_page,
+        'current_url': crawler.current_url if running else '',
+        'current_title': crawler.current_title if running else '',
+        'current_desc': crawler.current_desc if running else '',
+        'logs': crawler.logs if crawler else [],
+        'log_cursor': crawler.log_seq if crawler else 0,
+
+        # 进度信息（内存或索引）
+        'current_page': info['current_page'],
         'display_id': display_id,
-        'total_pages': td.get('end_page') - td.get('start_page') + 1,
-        'start_page': td.get('start_page'),
-        'end_page': td.get('end_page'),
-        'count': count,
-        'failed_count': failed_count,
-        'queue_size': queue_size,
-        'delay': td.get('delay', 1.0),
-        'status': td.get('status')
+        'total_pages': info['end_page'] - info['start_page'] + 1,
+        'start_page': info['start_page'],
+        'end_page': info['end_page'],
+        'count': info['count'],
+        'failed_count': info['failed_count'],
+        # 等待自动重试的ID数，以及失败次数过多、不再自动重试的ID数
+        'retry_count': info.get('retry_count', 0),
+        'dead_count': info.get('dead_count', 0),
+        'queue_size': info['queue_size'],
+        'delay': info['delay'],
+        'concurrency': info['concurrency'],
+        'fetch_strategy': info['fetch_strategy'],
+        'shards': info.get('shards', 1),
+        'extractor': info['extractor'],
+        'cache_ttl_days': info['cache_ttl_days'],
+        'adaptive_rate': info['adaptive_rate'],
+        'auto_range': info.get('auto_range', False),
+        # 当前实际速率（自适应模式下由控制器给出），仅运行中有值
+        'rate': crawler.rate_status() if running else None,
+        'fetch_stats': (crawler.fetch_stats if crawler else FetchStats()).summary(),
+        # 进程内所有任务的分阶段耗时、重试/超时/失败次数和存储写入（详见 /api/metrics）
+        'metrics': metrics.summary(),
+        'status': info['status'],
+        'running_tasks': crawlers.running_filenames()
     }
 
-    return jsonify(status_data)
+
+@app.route('/api/crawler/status', methods=['GET'])
+def crawler_status():
+    return jsonify(build_status(target_filename()))
+
+
+@app.route('/api/crawler/events', methods=['GET'])
+def crawler_events():
+    """Server-Sent Events：推送状态变化和游标之后的新日志。"""
+    try:
+        cursor = int(request.headers.get('Last-Event-ID')
+                     or request.args.get('cursor', 0))
+    except ValueError:
+        cursor = 0
+    # 未指定任务时跟随当前加载的任务
+    fixed_filename = request.args.get('filename')
+
+    def stream():
+        nonlocal cursor
+        last_payload = None
+        last_filename = None
+        last_sent = time.monotonic()
+        while True:
+            filename = fixed_filename or active_task_filename
+            if not filename:
+                yield f"data: {json.dumps(build_status(None))}\n\n"
+                time.sleep(1.0)
+                continue
+            crawler = crawlers.find(filename)
+            if last_filename is not None and filename != last_filename:
+                # 切换了任务，日志游标属于新的爬虫
+                cursor = 0
+            last_filename = filename
+
+            payload = build_status(filename)
+            payload.pop('logs', None)
+            new_logs, latest = crawler.logs_since(cursor) if crawler else ([], 0)
+
+            if payload != last_payload or new_logs:
+                last_payload = dict(payload)
+                payload['logs'] = new_logs
+                payload['log_cursor'] = latest
+                cursor = latest
+                last_sent = time.monotonic()
+                yield f"id: {latest}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            elif time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+
+            if crawler:
+                crawler.wait_for_update(timeout=1.0)
+            else:
+                # 任务还没启动过，没有可等待的爬虫
+                time.sleep(1.0)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def update_task_setting(key, value):
+    filename = target_filename()
+    if not filename:
+        return
+    crawler = crawlers.find(filename)
+    if crawler and crawler.running:
+        crawler.task_data[key] = value
+    else:
+        # Update file directly if not running
+        td = task_manager.load_task(filename)
+        if td:
+            td[key] = value
+            task_manager.save_task(filename, td)
 
 
 @app.route('/api/crawler/set_delay', methods=['POST'])
@@ -347,109 +643,174 @@ def set_delay():
     if new_delay < 0.1:
         new_delay = 0.1
 
-    if crawler.task_data:
-        crawler.task_data['delay'] = new_delay
-    elif active_task_filename:
-        # Update file directly if not running
-        td = task_manager.load_task(active_task_filename)
-        if td:
-            td['delay'] = new_delay
-            task_manager.save_task(active_task_filename, td)
-
+    update_task_setting('delay', new_delay)
     return jsonify({'status': 'updated', 'delay': new_delay})
 
 
+@app.route('/api/crawler/set_adaptive_rate', methods=['POST'])
+def set_adaptive_rate():
+    data = request.json
+    enabled = bool(data.get('enabled'))
+
+    # 开启后由控制器调整速率，delay 只用作初始值
+    update_task_setting('adaptive_rate', enabled)
+    return jsonify({'status': 'updated', 'adaptive_rate': enabled})
+
+
+@app.route('/api/crawler/set_auto_range', methods=['POST'])
+def set_auto_range():
+    data = request.json
+    enabled = bool(data.get('enabled'))
+
+    # 下次启动时查找最后一页并更新终止页
+    update_task_setting('auto_range', enabled)
+    return jsonify({'status': 'updated', 'auto_range': enabled})
+
+
+@app.route('/api/crawler/set_concurrency', methods=['POST'])
+def set_concurrency():
+    data = request.json
+    try:
+        new_concurrency = int(data.get('concurrency', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Concurrency must be an integer'}), 400
+    new_concurrency = max(1, min(new_concurrency, MAX_CONCURRENCY))
+
+    update_task_setting('concurrency', new_concurrency)
+    return jsonify({'status': 'updated', 'concurrency': new_concurrency})
+
+
+@app.route('/api/crawler/set_shards', methods=['POST'])
+def set_shards():
+    data = request.json
+    try:
+        new_shards = int(data.get('shards', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Shards must be an integer'}), 400
+    new_shards = max(1, min(new_shards, MAX_SHARDS))
+
+    # 分片数在下次启动时生效
+    update_task_setting('shards', new_shards)
+    return jsonify({'status': 'updated', 'shards': new_shards})
+
+
+@app.route('/api/crawler/set_cache_ttl', methods=['POST'])
+def set_cache_ttl():
+    data = request.json
+    try:
+        days = float(data.get('cache_ttl_days', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Cache TTL must be a number'}), 400
+    # 0 表示不使用缓存，总是重新抓取
+    days = max(0.0, days)
+
+    update_task_setting('cache_ttl_days', days)
+    return jsonify({'status': 'updated', 'cache_ttl_days': days})
+
+
+@app.route('/api/crawler/set_extractor', methods=['POST'])
+def set_extractor():
+    data = request.json
+    extractor = data.get('extractor')
+    if extractor not in EXTRACTORS:
+        return jsonify({'error': 'Unknown extractor'}), 400
+    if extractor not in HTML_EXTRACTORS and extractor not in ('auto', 'dom'):
+        return jsonify({'error': f'{extractor} is not installed'}), 400
+
+    update_task_setting('extractor', extractor)
+    return jsonify({'status': 'updated', 'extractor': extractor})
+
+
+@app.route('/api/crawler/set_fetch_strategy', methods=['POST'])
+def set_fetch_strategy():
+    data = request.json
+    strategy = data.get('fetch_strategy')
+    if strategy not in FETCH_STRATEGIES:
+        return jsonify({'error': 'Unknown fetch strategy'}), 400
+
+    update_task_setting('fetch_strategy', strategy)
+    return jsonify({'status': 'updated', 'fetch_strategy': strategy})
+
+
 @app.route('/api/crawler/check_integrity', methods=['POST'])
 def check_integrity():
-    if not active_task_filename:
+    filename = target_filename()
+    if not filename:
         return jsonify({'error': 'No task loaded'}), 400
 
     # 确定使用哪个数据源
-    if crawler.running and crawler.task_data and crawler.task_data.get('filename') == active_task_filename:
+    crawler = crawlers.find(filename)
+    if crawler and crawler.running:
         td = crawler.task_data
         using_memory = True
     else:
-        td = task_manager.load_task(active_task_filename)
+        td = task_manager.load_state(filename)
         using_memory = False
 
     if not td:
         return jsonify({'error': 'Task data not found'}), 404
 
-    data_list = td.get('data', [])
-    failed_ids = td.get('failed_ids', [])
-    discovered_ids = set(td.get('discovered_ids', []))
+    records = list(td.records.values())
 
     # 1. 查找缺失的ID (已发现但未抓取)
-    crawled_ids = set(item['ID'] for item in data_list)
-    missing_ids = discovered_ids - crawled_ids
+    missing_ids = [gid for gid in list(td.discovered)
+                   if not td.has_record(gid)]
 
     # 2. 查找无效项目（标题为空或特定错误标题）
     invalid_ids = set()
-    for item in data_list:
+    for item in records:
         title = item.get('Title', '').strip()
-        if not title or title == '老游戏在线玩':
+        if not title or title == PLACEHOLDER_TITLE:
             invalid_ids.add(item['ID'])
 
-    # 合并所有问题
-    new_failed = missing_ids.union(invalid_ids)
-
-    # 添加到 failed_ids 如果尚未存在
-    added_count = 0
-    for fid in new_failed:
-        if fid not in failed_ids:
-            failed_ids.append(fid)
-            added_count += 1
+    # 合并所有问题，添加到 failed_ids 如果尚未存在
+    added = [fid for fid in set(missing_ids).union(invalid_ids)
+             if td.add_failed(fid)]
 
     # 保存更改
     if using_memory:
-        pass
+        # 内存数据由爬虫的检查点保存，增量后端需要逐条记录
+        for fid in added:
+            task_manager.record(filename, 'failed', fid)
     else:
-        task_manager.save_task(active_task_filename, td)
+        task_manager.save_task(filename, td)
 
     return jsonify({
         'status': 'checked',
-        'added_count': added_count,
-        'total_failed': len(failed_ids),
+        'added_count': len(added),
+        'total_failed': len(td.failed),
         'invalid_removed': len(invalid_ids)
     })
 
 
 @app.route('/api/crawler/retry_failed', methods=['POST'])
 def retry_failed():
-    if not active_task_filename:
+    filename = target_filename()
+    if not filename:
         return jsonify({'error': 'No task loaded'}), 400
 
-    # 如果正在运行，更新实时数据
-    if crawler.running and crawler.task_data:
-        failed = crawler.task_data.get('failed_ids', [])
-        if not failed:
-            return jsonify({'status': 'no_failed_ids'})
-
-        # 添加到自定义队列
-        for fid in failed:
-            if fid not in crawler.task_data['custom_queue']:
-                crawler.task_data['custom_queue'].append(fid)
-
-        return jsonify({'status': 'added_to_queue', 'count': len(failed)})
+    # 如果正在运行，更新实时数据，否则更新文件
+    crawler = crawlers.find(filename)
+    using_memory = bool(crawler and crawler.running)
+    if using_memory:
+        td = crawler.task_data
     else:
-        # 更新文件
-        td = task_manager.load_task(active_task_filename)
-        if td:
-            failed = td.get('failed_ids', [])
-            if not failed:
-                return jsonify({'status': 'no_failed_ids'})
-
-            if 'custom_queue' not in td:
-                td['custom_queue'] = []
-
-            for fid in failed:
-                if fid not in td['custom_queue']:
-                    td['custom_queue'].append(fid)
-
-            task_manager.save_task(active_task_filename, td)
-            return jsonify({'status': 'added_to_queue', 'count': len(failed)})
-
-    return jsonify({'error': 'Unknown state'}), 500
+        td = task_manager.load_state(filename)
+        if not td:
+            return jsonify({'error': 'Unknown state'}), 500
+
+    failed = list(td.failed)
+    if not failed:
+        return jsonify({'status': 'no_failed_ids'})
+
+    # 添加到自定义队列，手动重试时重新计算失败次数（包括已放弃的ID）
+    td.enqueue(failed)
+    for gid in failed:
+        td.clear_retry(gid)
+
+    if not using_memory:
+        task_manager.save_task(filename, td)
+    return jsonify({'status': 'added_to_queue', 'count': len(failed)})
 
 
 if __name__ == '__main__':
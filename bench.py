@@ -0,0 +1,341 @@
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from crawler import Crawler, FETCH_STRATEGIES, MAX_CONCURRENCY
+
+# 资源占用采样间隔（秒）
+SAMPLE_INTERVAL = 0.05
+# 爬虫暂停后自动继续的最多次数，超过后停止并把本次结果标记为失败
+MAX_RESUMES = 10
+# 单次基准测试的最长时间（秒）
+RUN_TIMEOUT = 600
+
+_LIST_PATH = re.compile(r'^/(series|consoles)/[^/]+$')
+_GAME_PATH = re.compile(r'^/games/(\d+)$')
+
+
+def _list_html(page, ids):
+    links = ''.join(f'<li><a href="/games/{gid}">Game {gid}</a></li>' for gid in ids)
+    return f'<html><body><h1>Page {page}</h1><ul>{links}</ul></body></html>'
+
+
+def _game_html(gid):
+    return (f'<html><head><title>Game {gid}</title></head><body>'
+            f'<span class="game-title">Game {gid}</span>'
+            f'<div class="description-markdown-html"><p>Synthetic game {gid}.</p>'
+            f'<p>{"Lorem ipsum dolor sit amet. " * 20}</p></div></body></html>')
+
+
+class MockSite:
+    """本地模拟站点：列表页和详情页都在服务端渲染。
+
+    每页 per_page 个游戏，ID 从 1 开始连续编号，超出 pages 的列表页为空；
+    每个请求延迟 latency 秒（上下浮动 jitter 比例），并以 error_rate 的概率返回 503。
+    recorded 是真实详情页 HTML 列表（例如 HTML 缓存中的页面），设置后按 ID 轮流返回。
+    服务运行在单独的进程中，不计入爬虫进程的 CPU 占用。
+    """
+
+    def __init__(self, pages=10, per_page=30, latency=0.05, jitter=0.5,
+                 error_rate=0.0, recorded=None, seed=0):
+        self.config = {
+            'pages': pages,
+            'per_page': per_page,
+            'latency': latency,
+            'jitter': jitter,
+            'error_rate': error_rate,
+            'recorded': recorded or [],
+            'seed': seed,
+        }
+        self.process = None
+        self.base_url = None
+
+    def start(self, port=0):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve, args=(self.config, port, ready))
+        self.process.daemon = True
+        self.process.start()
+        self.base_url = f"http://127.0.0.1:{ready.get(timeout=10)}"
+        return self.base_url
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+
+def serve(config, port=0, ready=None):
+    """运行模拟站点直到进程结束；ready 不为 None 时把实际端口放进去。"""
+    rng = random.Random(config['seed'])
+    rng_lock = threading.Lock()
+    pages = config['pages']
+    per_page = config['per_page']
+    recorded = config['recorded']
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # 响应头和正文分两次写出，不关闭 Nagle 会多出约 40ms 的延迟确认
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=''):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            with rng_lock:
+                delay = config['latency'] * (1 + config['jitter'] * (2 * rng.random() - 1))
+                failed = rng.random() < config['error_rate']
+            time.sleep(max(0.0, delay))
+            if failed:
+                self._send(503, 'Service Unavailable')
+                return
+
+            url = urlparse(self.path)
+            if _LIST_PATH.match(url.path):
+                try:
+                    page = int(parse_qs(url.query).get('page', ['1'])[0])
+                except ValueError:
+                    page = 1
+                ids = range((page - 1) * per_page + 1, page * per_page + 1) \
+                    if 1 <= page <= pages else []
+                self._send(200, _list_html(page, ids))
+                return
+
+            match = _GAME_PATH.match(url.path)
+            if match and 1 <= int(match.group(1)) <= pages * per_page:
+                gid = int(match.group(1))
+                self._send(200, recorded[gid % len(recorded)] if recorded else _game_html(gid))
+                return
+            self._send(404, 'Not Found')
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class BenchCrawler(Crawler):
+    """记录每个成功抓取的游戏耗时。"""
+
+    def __init__(self):
+        super().__init__()
+        self.latencies = []
+
+    def _timed_fetch(self, session, target_id):
+        item, elapsed = super()._timed_fetch(session, target_id)
+        self.latencies.append(elapsed)
+        return item, elapsed
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # 非 Linux：只能取到进程启动以来的峰值
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, q):
+    """最近秩百分位数，values 为空时返回 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_benchmark(base_url, pages, strategy='http', concurrency=1, delay=0.1,
+                  adaptive_rate=False, extractor='auto', max_resumes=MAX_RESUMES,
+                  timeout=RUN_TIMEOUT):
+    """对模拟站点完整抓取一遍，返回吞吐量、延迟分布和资源占用。
+
+    CPU 和 RSS 只统计当前进程（浏览器策略下 Chromium 子进程不计入）。
+    持续出错（例如列表页总是失败）时，暂停超过 max_resumes 次或运行超过
+    timeout 秒就停止爬虫，结果中 error 不为 None。
+    """
+    task = {
+        'name': f'bench_{strategy}_c{concurrency}',
+        'filename': 'bench.json',
+        'task_type': 'series',
+        'target_name': 'bench',
+        'base_url': base_url,
+        'start_page': 1,
+        'end_page': pages,
+        'current_page': 1,
+        'status': 'ready',
+        'data': [],
+        'delay': delay,
+        'adaptive_rate': adaptive_rate,
+        'concurrency': concurrency,
+        'fetch_strategy': strategy,
+        'extractor': extractor,
+    }
+    crawler = BenchCrawler()
+
+    peak_rss = _rss_bytes()
+    resumes = 0
+    error = None
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss, resumes, error
+        while not done.wait(SAMPLE_INTERVAL):
+            peak_rss = max(peak_rss, _rss_bytes())
+            # 列表页出错时爬虫会暂停等人处理，基准测试中直接继续
+            if crawler.paused and crawler.running:
+                if resumes >= max_resumes:
+                    error = f'crawler paused more than {max_resumes} times'
+                    crawler.stop()
+                    return
+                crawler.resume()
+                resumes += 1
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    cpu_start = _cpu_seconds()
+    start = time.monotonic()
+    crawler.start(task)
+    crawler.thread.join(timeout)
+    if crawler.thread.is_alive():
+        error = error or f'timed out after {timeout}s'
+        crawler.stop()
+        crawler.thread.join(30)
+    elapsed = time.monotonic() - start
+    cpu = _cpu_seconds() - cpu_start
+    done.set()
+    sampler.join()
+
+    state = crawler.task_data
+    games = len(state.records)
+    stats = crawler.fetch_stats.summary()
+    p50 = percentile(crawler.latencies, 50)
+    p99 = percentile(crawler.latencies, 99)
+    return {
+        'strategy': strategy,
+        'concurrency': concurrency,
+        'games': games,
+        'failed': len(state.failed),
+        'seconds': round(elapsed, 3),
+        'games_per_sec': round(games / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+        'p99_ms': round(p99 * 1000, 1) if p99 is not None else None,
+        'cpu_seconds': round(cpu, 3),
+        'cpu_percent': round(cpu / elapsed * 100, 1) if elapsed else 0.0,
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        'http': stats['http'],
+        'browser': stats['browser'],
+        'resumes': resumes,
+        'status': state.get('status'),
+        'error': error,
+    }
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+if __name__ == '__main__':
+    import argparse
+    from storage import TASKS_DIR
+
+    parser = argparse.ArgumentParser(
+        description='Crawl a local mock site and report throughput, latency and resource use.')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--per-page', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds per request on the mock site')
+    parser.add_argument('--jitter', type=float, default=0.5,
+                        help='latency varies by +/- this fraction')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 503')
+    parser.add_argument('--strategies', default='http',
+                        help=f'comma separated, from {",".join(FETCH_STRATEGIES)}')
+    parser.add_argument('--concurrency', default='1,4,8', type=_int_list,
+                        help=f'comma separated, 1-{MAX_CONCURRENCY}')
+    parser.add_argument('--delay', type=float, default=0.1,
+                        help='task delay; the request rate is concurrency / delay')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='enable adaptive rate control')
+    parser.add_argument('--extractor', default='auto')
+    parser.add_argument('--recorded', action='store_true',
+                        help='serve game pages recorded in the HTML cache')
+    parser.add_argument('--limit', type=int, default=200,
+                        help='--recorded: number of cached pages to use')
+    parser.add_argument('--tasks-dir', default=TASKS_DIR)
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='only run the mock site on PORT (use it as a task base_url)')
+    parser.add_argument('--timeout', type=float, default=RUN_TIMEOUT,
+                        help='seconds before a single run is stopped and marked failed')
+    parser.add_argument('--json', metavar='PATH', help='also write results as JSON')
+    args = parser.parse_args()
+
+    recorded = None
+    if args.recorded:
+        from html_cache import HtmlCache
+        recorded = HtmlCache.in_dir(args.tasks_dir).sample_pages(limit=args.limit)
+        if not recorded:
+            parser.exit(1, 'No cached game pages: crawl with the HTML cache enabled first.\n')
+
+    config = MockSite(args.pages, args.per_page, args.latency, args.jitter,
+                      args.error_rate, recorded).config
+    if args.serve is not None:
+        print(f"Mock site on http://127.0.0.1:{args.serve} "
+              f"({args.pages} pages x {args.per_page} games)")
+        serve(config, args.serve)
+
+    site = MockSite(**config)
+    base_url = site.start()
+    print(f"Mock site {base_url}: {args.pages} pages x {args.per_page} games, "
+          f"latency {args.latency * 1000:.0f} ms +/-{args.jitter:.0%}, "
+          f"error rate {args.error_rate:.0%}")
+    print(f"{'strategy':8} {'conc':>4} {'games':>6} {'failed':>6} {'games/s':>8} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'cpu %':>6} {'rss MB':>7}")
+    results = []
+    try:
+        for strategy in args.strategies.split(','):
+            if strategy not in FETCH_STRATEGIES:
+                parser.error(f'unknown strategy: {strategy}')
+            for concurrency in args.concurrency:
+                result = run_benchmark(base_url, args.pages, strategy, concurrency,
+                                       args.delay, args.adaptive, args.extractor,
+                                       timeout=args.timeout)
+                results.append(result)
+                if result['error']:
+                    print(f"{strategy:8} {concurrency:>4} FAILED: {result['error']} "
+                          f"({result['games']} games)")
+                    continue
+                print(f"{strategy:8} {concurrency:>4} {result['games']:>6} {result['failed']:>6} "
+                      f"{result['games_per_sec']:>8.2f} {result['p50_ms'] or 0:>7.1f} "
+                      f"{result['p99_ms'] or 0:>7.1f} {result['cpu_percent']:>6.1f} "
+                      f"{result['peak_rss_mb']:>7.1f}")
+    finally:
+        site.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'site': {k: v for k, v in config.items() if k != 'recorded'},
+                       'results': results}, f, indent=2)
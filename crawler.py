@@ -1,36 +1,733 @@
+import math
+import random
+import re
 import time
+import queue
+import socket
 import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from playwright.sync_api import sync_playwright
+from task_state import TaskState
+from game_cache import GameCache, DEFAULT_CACHE_TTL_DAYS
+from html_cache import HtmlCache
+from site_urls import BASE_URL, game_url
+from metrics import (REGISTRY, STAGE_SECONDS, NAVIGATION_RETRIES, WAIT_TIMEOUTS,
+                     FAILURES, GAMES, RETRIES)
 
+# C 实现的 HTML 解析器是可选依赖，没有安装时使用 BeautifulSoup
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+MAX_CONCURRENCY = 16
+MAX_SHARDS = 8
+
+# 运行日志环形缓冲区大小
+LOG_BUFFER_SIZE = 100
+
+# 分片抓取的子进程启动方式（Playwright 与 fork 不兼容）
+SHARD_START_METHOD = 'spawn'
+
+# 抓取策略：auto = 先用 HTTP，标题不在服务端渲染的 HTML 中时回退到浏览器
+FETCH_STRATEGIES = ('auto', 'http', 'browser')
+
+# 网站的占位标题，说明页面内容尚未渲染
+PLACEHOLDER_TITLE = '老游戏在线玩'
+
+SITE_HOST = urlparse(BASE_URL).hostname
+
+# 精简浏览模式下拦截的资源类型，以及第三方广告/统计域名关键字
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font', 'stylesheet'}
+BLOCKED_HOST_KEYWORDS = ('google-analytics', 'googletagmanager', 'doubleclick',
+                         'googlesyndication', 'adservice', 'hm.baidu', 'cnzz',
+                         'umeng', 'clarity.ms', 'facebook', 'hotjar')
+
+# 自适应速率（AIMD）：健康时每 ADAPTIVE_WINDOW 次成功加 ADAPTIVE_INCREASE 次/秒，
+# 超时/连接错误/429/5xx 或延迟超过基线 ADAPTIVE_SLOW_FACTOR 倍时乘以 ADAPTIVE_DECREASE
+ADAPTIVE_MIN_RPS = 0.2
+ADAPTIVE_MAX_RPS = 20.0
+ADAPTIVE_INCREASE = 0.2
+ADAPTIVE_DECREASE = 0.5
+ADAPTIVE_WINDOW = 10
+ADAPTIVE_SLOW_FACTOR = 3.0
+# 两次降速之间的最短间隔（秒），避免同一波错误连续降速
+ADAPTIVE_COOLDOWN = 2.0
+
+# 失败的详情页自动重试：第 n 次失败后等待 RETRY_BASE_DELAY * 2^(n-1) 秒（不超过
+# RETRY_MAX_DELAY，带 ±50% 随机抖动），失败 RETRY_MAX_ATTEMPTS 次后移入死信，不再自动重试；
+# 到期的重试在两页之间每次最多处理 RETRY_BATCH 个
+RETRY_BASE_DELAY = 5.0
+RETRY_MAX_DELAY = 600.0
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BATCH = 32
+# 连续这么多次网络错误（可能已断网）才暂停爬虫
+NETWORK_ERROR_PAUSE = 10
+
+# 列表页预取：默认最多领先当前页 2 页，任务中 prefetch_pages = 0 关闭
+PREFETCH_PAGES = 2
+
+# 自动确定页数：指数 + 二分查找最后一个非空列表页，然后用 RANGE_SCAN_WORKERS 个线程
+# 并行扫描范围内的列表页；MAX_PROBE_PAGE 防止站点对任意页码都返回内容时无限查找
+RANGE_SCAN_WORKERS = 8
+MAX_PROBE_PAGE = 10000
+
+# 服务端 HTML 中的游戏链接
+GAME_LINK_RE = re.compile(r'href=["\']/games/(\d+)')
+
+# 每个会话最多缓存的空闲页面数
+PAGE_POOL_SIZE = 4
+
+# 详情页就绪条件：标题已出现，且简介已出现或文档已加载完成
+GAME_READY_JS = """() => !!document.querySelector('.game-title') &&
+    (!!document.querySelector('.description-markdown-html') ||
+     document.readyState === 'complete')"""
+
+
+# 所有提取器的文本规则与 BeautifulSoup get_text(strip=True) 一致：
+# 每个文本节点去掉首尾空白后直接拼接
+
+def _extract_bs4(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    title_tag = soup.find('span', class_='game-title')
+    desc_tag = soup.find('div', class_='description-markdown-html')
+    return (title_tag.get_text(strip=True) if title_tag else "",
+            desc_tag.get_text(strip=True) if desc_tag else "")
+
+
+def _extract_lxml(content):
+    root = lxml.html.fromstring(content)
+
+    def text(xpath):
+        nodes = root.xpath(xpath)
+        return ''.join(t.strip() for t in nodes[0].itertext()) if nodes else ""
+
+    return (text('//span[contains(concat(" ", normalize-space(@class), " "), " game-title ")]'),
+            text('//div[contains(concat(" ", normalize-space(@class), " "), " description-markdown-html ")]'))
+
+
+def _extract_selectolax(content):
+    tree = LexborHTMLParser(content)
+    title_tag = tree.css_first('span.game-title')
+    desc_tag = tree.css_first('div.description-markdown-html')
+    return (title_tag.text(deep=True, separator='', strip=True) if title_tag else "",
+            desc_tag.text(deep=True, separator='', strip=True) if desc_tag else "")
+
+
+# 可用的 HTML 提取器，按速度从快到慢
+HTML_EXTRACTORS = OrderedDict(
+    (name, fn) for name, fn in (
+        ('selectolax', _extract_selectolax if LexborHTMLParser else None),
+        ('lxml', _extract_lxml if lxml else None),
+        ('bs4', _extract_bs4),
+    ) if fn)
+
+# auto = 最快的可用 HTML 解析器；dom = 在浏览器中直接读取文本（不传输整页 HTML）
+EXTRACTORS = ('auto', 'selectolax', 'lxml', 'bs4', 'dom')
+
+# 在浏览器中提取标题和简介，文本规则与 HTML 提取器相同
+GAME_EXTRACT_JS = """() => {
+    const text = (el) => {
+        if (!el) return '';
+        const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+        const parts = [];
+        while (walker.nextNode()) parts.push(walker.currentNode.nodeValue.trim());
+        return parts.join('');
+    };
+    return [text(document.querySelector('span.game-title')),
+            text(document.querySelector('div.description-markdown-html'))];
+}"""
+
+
+def game_record(target_id, url, title, desc):
+    """组装游戏记录，找不到标题时抛出异常。"""
+    if not title:
+        raise Exception("Title not found")
+    return {
+        'ID': target_id,
+        'URL': url,
+        'Title': title,
+        'Description': desc
+    }
+
+
+def parse_game_html(content, target_id, url, extractor='auto'):
+    """从详情页 HTML 中提取游戏记录，找不到标题时抛出异常。"""
+    extract = HTML_EXTRACTORS.get(extractor) or next(
+        iter(HTML_EXTRACTORS.values()))
+    title, desc = extract(content)
+    return game_record(target_id, url, title, desc)
+
+
+class RateLimiter:
+    """所有抓取线程共享的全局请求速率预算，按固定间隔发放请求槽位。"""
+
+    def __init__(self, rate_fn):
+        # rate_fn 每次调用时重新读取，便于运行中调整延迟/并发
+        self.rate_fn = rate_fn
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        with self._lock:
+            rate = max(self.rate_fn(), 0.01)
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / rate
+        wait = slot - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+
+def is_overload_error(error):
+    """超时、连接错误、429 和 5xx 说明站点或网络承压（解析失败不算）。"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    # Playwright 的错误（以及分片进程传回的错误文本）只能按消息判断
+    msg = str(error)
+    return any(key in msg for key in (
+        'Timeout', 'timed out', 'net::ERR_', 'Too Many Requests', 'Server Error'))
+
+
+class AdaptiveRate:
+    """AIMD 速率控制器（线程安全）。
+
+    站点健康时加性提速（不超过 max_rate），出现超时、错误响应或延迟明显升高时乘性降速；
+    并按 Little 定律（并发 ≈ 速率 × 延迟）给出需要的并发数。
+    """
+
+    def __init__(self, rate, max_rate=ADAPTIVE_MAX_RPS):
+        self.max_rate = min(max(max_rate, ADAPTIVE_MIN_RPS), ADAPTIVE_MAX_RPS)
+        self.rate = min(max(rate, ADAPTIVE_MIN_RPS), self.max_rate)
+        self.latency = None  # 成功请求耗时的 EWMA（秒）
+        self.backoffs = 0
+        self._samples = 0
+        self._ok = 0
+        self._last_backoff = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed=None, error=None):
+        """记录一次请求结果，发生降速时返回 True。"""
+        with self._lock:
+            slow = (error is None and self._samples >= 5 and
+                    elapsed > self.latency * ADAPTIVE_SLOW_FACTOR)
+            if elapsed is not None and error is None:
+                self.latency = elapsed if self.latency is None else \
+                    0.9 * self.latency + 0.1 * elapsed
+                self._samples += 1
+
+            if error is not None or slow:
+                self._ok = 0
+                now = time.monotonic()
+                if now - self._last_backoff < ADAPTIVE_COOLDOWN:
+                    return False
+                self._last_backoff = now
+                self.rate = max(ADAPTIVE_MIN_RPS,
+                                self.rate * ADAPTIVE_DECREASE)
+                self.backoffs += 1
+                return True
+
+            self._ok += 1
+            if self._ok >= ADAPTIVE_WINDOW:
+                self._ok = 0
+                self.rate = min(self.max_rate,
+                                self.rate + ADAPTIVE_INCREASE)
+            return False
+
+    def set_max_rate(self, max_rate):
+        with self._lock:
+            self.max_rate = min(max(max_rate, ADAPTIVE_MIN_RPS), ADAPTIVE_MAX_RPS)
+            self.rate = min(self.rate, self.max_rate)
+
+    def concurrency(self, cap):
+        if self.latency is None:
+            return cap
+        return max(1, min(cap, math.ceil(self.rate * self.latency * 1.5)))
+
+
+class FairScheduler:
+    """多个任务共享的全局礼貌预算。
+
+    按固定间隔发放请求槽位，在有等待请求的任务之间轮转，
+    避免并发数高的任务占满整个站点的请求配额。
+    """
+
+    def __init__(self, rate_fn):
+        self.rate_fn = rate_fn
+        self._cond = threading.Condition()
+        self._waiting = OrderedDict()  # 任务 -> 等待中的请求数，按轮转顺序
+        self._next_slot = 0.0
+
+    def acquire(self, key):
+        with self._cond:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            while True:
+                now = time.monotonic()
+                turn = next(iter(self._waiting))
+                if turn == key and now >= self._next_slot:
+                    rate = max(self.rate_fn(), 0.01)
+                    self._next_slot = max(now, self._next_slot) + 1.0 / rate
+                    self._waiting[key] -= 1
+                    if self._waiting[key]:
+                        self._waiting.move_to_end(key)
+                    else:
+                        del self._waiting[key]
+                    self._cond.notify_all()
+                    return
+                self._cond.wait(max(self._next_slot - now, 0.05))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class SharedBrowser:
+    """多个任务共享的 Chromium 进程。
+
+    由一个专用线程启动并持有浏览器，其它线程通过 CDP 连接，
+    各自创建独立的 BrowserContext（sync API 对象不能跨线程共享）。
+    """
 
-class Crawler:
     def __init__(self):
+        self.endpoint = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._error = None
+
+    def start(self):
+        """启动浏览器（已启动时直接返回），返回 CDP 地址；启动失败时抛出异常。"""
+        # 多个任务/线程同时调用时只启动一个浏览器，其余调用等它就绪
+        with self._lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._ready.clear()
+                self._stop.clear()
+                self._error = None
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._ready.wait(60)
+            if self._error:
+                raise self._error
+            if self.endpoint is None:
+                raise Exception("Shared browser did not start")
+            return self.endpoint
+
+    def _run(self):
+        try:
+            port = _free_port()
+            with sync_playwright() as p:
+                browser = p.chromium.launch(
+                    headless=True, args=[f'--remote-debugging-port={port}'])
+                self.endpoint = f'http://127.0.0.1:{port}'
+                self._ready.set()
+                self._stop.wait()
+                browser.close()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+        finally:
+            self.endpoint = None
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+
+class BrowserSession:
+    """Playwright 浏览器会话。sync API 的对象只能在创建它的线程中使用。
+
+    block_resources 为 True 时启用精简浏览：拦截图片/媒体/字体/样式表
+    和第三方广告统计请求。页面用完后放回空闲池复用，而不是每次 new_page。
+    """
+
+    def __init__(self, stats=None, block_resources=True, cdp_endpoint=None,
+                 site_host=SITE_HOST):
+        self.stats = stats
+        self.block_resources = block_resources
+        self.site_host = site_host
+        # 设置后连接到共享的 Chromium，而不是自己启动一个；
+        # 可以是返回地址的函数，在第一次需要页面时才调用（启动共享浏览器）
+        self.cdp_endpoint = cdp_endpoint
+        self._playwright = None
+        self.browser = None
+        self.context = None
+        self._idle_pages = []
+
+    def open(self):
+        endpoint = self.cdp_endpoint
+        if callable(endpoint):
+            endpoint = endpoint()
+        self._playwright = sync_playwright().start()
+        if endpoint:
+            self.browser = self._playwright.chromium.connect_over_cdp(endpoint)
+        else:
+            self.browser = self._playwright.chromium.launch(headless=True)
+        self.context = self.browser.new_context(user_agent=USER_AGENT)
+        self.context.set_default_timeout(30000)
+        if self.block_resources:
+            self.context.route('**/*', self._route)
+        if self.stats:
+            self.context.on('requestfinished', self._on_request_finished)
+        return self.context
+
+    def _route(self, route):
+        request = route.request
+        host = urlparse(request.url).hostname or ''
+        first_party = host == self.site_host or host.endswith('.' + self.site_host)
+        if (request.resource_type in BLOCKED_RESOURCE_TYPES
+                or any(k in host for k in BLOCKED_HOST_KEYWORDS)
+                or (not first_party and request.resource_type not in ('document', 'script', 'xhr', 'fetch'))):
+            if self.stats:
+                self.stats.add('blocked')
+            route.abort()
+            return
+        route.continue_()
+
+    def _on_request_finished(self, request):
+        try:
+            sizes = request.sizes()
+            self.stats.add('bytes', sizes['responseBodySize'] +
+                           sizes['responseHeadersSize'])
+        except Exception:
+            pass
+
+    def acquire_page(self):
+        if self._idle_pages:
+            return self._idle_pages.pop()
+        return self.get_context().new_page()
+
+    def release_page(self, page, reuse=True):
+        """归还页面；出错的页面直接关闭，不再复用。"""
+        if reuse and len(self._idle_pages) < PAGE_POOL_SIZE and not page.is_closed():
+            self._idle_pages.append(page)
+            return
+        try:
+            page.close()
+        except Exception:
+            pass
+
+    def get_context(self):
+        """首次使用时才启动浏览器（纯 HTTP 抓取时不需要浏览器）。"""
+        if self.context is None:
+            self.open()
+        return self.context
+
+    def close(self):
+        try:
+            if self.context and self.cdp_endpoint:
+                # 共享浏览器：只关闭自己的 context 并断开连接
+                self.context.close()
+            if self.browser:
+                self.browser.close()
+        finally:
+            if self._playwright:
+                self._playwright.stop()
+            self._playwright = None
+            self.browser = None
+            self.context = None
+            self._idle_pages = []
+
+
+class HttpFetcher:
+    """带连接池的 keep-alive HTTP 客户端，每个线程一个 requests.Session。"""
+
+    def __init__(self, pool_size=MAX_CONCURRENCY, stats=None):
+        self.pool_size = pool_size
+        self.stats = stats
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4,
+                                  pool_maxsize=self.pool_size, max_retries=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            self._local.session = session
+        return session
+
+    def get(self, url, timeout=15):
+        resp = self._session().get(url, timeout=timeout)
+        resp.raise_for_status()
+        if self.stats:
+            self.stats.add('bytes', len(resp.content))
+        # 响应头没有声明 charset 时 requests 对 text/html 默认按 ISO-8859-1 解码，
+        # 中文会变成乱码；站点页面都是 UTF-8
+        if 'charset=' not in resp.headers.get('Content-Type', '').lower():
+            resp.encoding = 'utf-8'
+        return resp.text
+
+
+class FetchStats:
+    """抓取统计（线程安全）：各抓取方式的命中次数、流量和耗时。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'http': 0, 'browser': 0, 'failed': 0, 'cached': 0,
+                       'bytes': 0, 'blocked': 0, 'fetch_seconds': 0.0}
+
+    def record(self, key):
+        self.add(key)
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.counts[key] += amount
+
+    def drain(self):
+        """取出并清零计数（子进程向父进程汇报增量）。"""
+        with self._lock:
+            counts = dict(self.counts)
+            for key in self.counts:
+                self.counts[key] = 0
+        return counts
+
+    def merge(self, counts):
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = counts['http'] + counts['browser'] + counts['failed']
+        counts['http_hit_rate'] = round(
+            counts['http'] / total, 3) if total else 0.0
+        counts['avg_fetch_seconds'] = round(
+            counts['fetch_seconds'] / total, 3) if total else 0.0
+        counts['fetch_seconds'] = round(counts['fetch_seconds'], 3)
+        return counts
+
+
+class GameFetchPool:
+    """并发抓取详情页的工作线程池。
+
+    每个工作线程持有自己的 BrowserSession，只负责抓取和解析；
+    结果交回爬虫线程，由它统一写入 task_data（单写者）。
+    每批ID有自己的结果队列，中途放弃的一批不会把结果留给下一批。
+    """
+
+    def __init__(self, crawler, size):
+        self.crawler = crawler
+        self.size = size
+        # (ID, 该批的结果队列, 该批已放弃)
+        self._jobs = queue.Queue()
+        self._threads = []
+        for _ in range(size):
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def _worker(self):
+        session = self.crawler._new_browser_session()
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                target_id, results, abandoned = job
+
+                # 已停止或该批已放弃：跳过剩余任务（item 和 error 均为 None）
+                if abandoned.is_set() or not self.crawler.wait_until_runnable():
+                    results.put((target_id, None, None, None))
+                    continue
+
+                self.crawler.begin_fetch()
+                try:
+                    self.crawler.acquire_slot()
+                    self.crawler.processing_id = target_id
+                    item, elapsed = self.crawler._timed_fetch(
+                        session, target_id)
+                    results.put((target_id, item, None, elapsed))
+                except Exception as e:
+                    results.put((target_id, None, e, None))
+                finally:
+                    self.crawler.end_fetch()
+        finally:
+            session.close()
+
+    def run(self, ids):
+        """提交一批ID，按完成顺序产出 (id, item, error, elapsed)。
+
+        调用方中途退出时应 close() 生成器，尚未开始的抓取会被跳过。
+        """
+        results = queue.Queue()
+        abandoned = threading.Event()
+        for target_id in ids:
+            self._jobs.put((target_id, results, abandoned))
+        try:
+            for _ in ids:
+                yield results.get()
+        finally:
+            abandoned.set()
+
+    def close(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+        for t in self._threads:
+            t.join(timeout=10)
+
+
+class ListPrefetcher:
+    """在后台按顺序预先扫描后续列表页，最多领先 lookahead 页。
+
+    只负责扫描；已发现ID、失败页和 current_page 仍由爬虫线程在真正处理
+    该页时更新，所以暂停/停止时丢弃未处理的预取结果即可保持进度正确。
+    """
+
+    def __init__(self, crawler, first_page, last_page, lookahead):
+        self.crawler = crawler
+        self.next_page = first_page  # 爬虫线程下一次要取的页
+        self.last_page = last_page
+        self._results = queue.Queue(maxsize=lookahead)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(first_page,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, page):
+        session = self.crawler._new_browser_session()
+        try:
+            while page <= self.last_page and not self._stop.is_set():
+                if not self.crawler.wait_until_runnable():
+                    break
+                self.crawler.acquire_slot()
+                if self._stop.is_set():
+                    break
+                try:
+                    ids = self.crawler._list_page_ids(session, page)
+                    result = (page, ids, None)
+                except Exception as e:
+                    result = (page, None, e)
+
+                while not self._stop.is_set():
+                    try:
+                        self._results.put(result, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                # 出错或空页后不再继续，由爬虫线程决定如何处理
+                if result[2] is not None or not result[1]:
+                    break
+                page += 1
+        finally:
+            session.close()
+
+    def get(self):
+        """按顺序返回下一页的 (page, ids, error)；爬虫已停止时返回 None。"""
+        while True:
+            try:
+                result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if not self.crawler.running:
+                    return None
+                if not self._thread.is_alive() and self._results.empty():
+                    raise Exception("List prefetcher exited unexpectedly")
+                continue
+            self.next_page = result[0] + 1
+            return result
+
+    def close(self):
+        self._stop.set()
+        # 丢弃未处理的结果，让预取线程从 put 中退出
+        while True:
+            try:
+                self._results.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join(timeout=10)
+
+
+class Crawler:
+    def __init__(self, shared_browser=None, scheduler=None, game_cache=None,
+                 html_cache=None):
         self.thread = None
         self.running = False
         self.paused = False
         self.task_data = None
         self.save_callback = None
         self.log_callback = None
+        self.record_callback = None
 
         # 运行时状态（不保存到JSON）
         self.current_url = ""
         self.current_title = ""
         self.current_desc = ""
         self.processing_id = None
-        self.logs = []
+        # (序号, 日志) 环形缓冲区，序号单调递增，供 SSE 按游标推送增量
+        self.log_buffer = deque(maxlen=LOG_BUFFER_SIZE)
+        self.log_seq = 0
+        self.updated = threading.Condition()
+
+        self.limiter = RateLimiter(self._request_rate)
+        # 由 CrawlerManager 提供：多个任务共享的浏览器和全局礼貌预算
+        self.shared_browser = shared_browser
+        self.scheduler = scheduler
+        # 跨任务的游戏记录缓存（GameCache），为 None 时总是抓取
+        self.game_cache = game_cache
+        # 原始 HTML 缓存（HtmlCache），为 None 时不保存
+        self.html_cache = html_cache
+        self.fetch_pool = None
+        self.prefetcher = None
+        self.fetch_stats = FetchStats()
+        self.http = HttpFetcher(stats=self.fetch_stats)
+        # 自适应速率控制器（任务开启 adaptive_rate 时创建）和在途请求数
+        self.rate_control = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._in_flight_cond = threading.Condition()
+        # 自动确定页数时已扫描的列表页 {页码: ID列表}，主循环直接使用
+        self._listed = {}
+        # 列表页是否在服务端渲染（None 表示尚未探测）
+        self._http_listing = None
+        # 连续网络错误次数，抓取成功时清零
+        self._network_errors = 0
 
-    def start(self, task_data, save_callback=None, log_callback=None):
+    def start(self, task_data, save_callback=None, log_callback=None, record_callback=None):
         if self.running:
             return False
 
+        if not isinstance(task_data, TaskState):
+            task_data = TaskState(task_data)
         self.task_data = task_data
         self.save_callback = save_callback
         self.log_callback = log_callback
+        self.record_callback = record_callback
         self.running = True
         self.paused = False
-        self.logs = []  # 启动时清除运行时日志
+        self.log_buffer.clear()  # 启动时清除运行时日志
         self.processing_id = None
+        self.fetch_stats = FetchStats()
+        self.http.stats = self.fetch_stats
+        self.rate_control = None
+        self._listed = {}
+        self._http_listing = None
+        self._network_errors = 0
+        if self._rate_control():
+            # 先写入键，之后只更新值（保存线程可能同时在序列化任务头）
+            self.task_data['adaptive_rps'] = round(self.rate_control.rate, 3)
 
         self.thread = threading.Thread(target=self._crawl_loop)
         self.thread.daemon = True
@@ -49,12 +746,412 @@ class Crawler:
         self.running = False
         self.log("Stopping crawler...")
 
+    def wait_until_runnable(self):
+        """暂停时阻塞；返回 False 表示爬虫已停止。"""
+        while self.running and self.paused:
+            time.sleep(0.5)
+        return self.running
+
+    def threads(self):
+        """本爬虫仍在运行的线程 [(名称, Thread)]：主循环、抓取工作线程和列表页预取线程。"""
+        threads = [('crawl', self.thread)]
+        pool = self.fetch_pool
+        if pool:
+            threads += [('fetch', t) for t in pool._threads]
+        prefetcher = self.prefetcher
+        if prefetcher:
+            threads.append(('prefetch', prefetcher._thread))
+        return [(name, t) for name, t in threads if t is not None and t.is_alive()]
+
+    def _concurrency(self):
+        try:
+            n = int(self.task_data.get('concurrency', 1))
+        except (TypeError, ValueError):
+            n = 1
+        return max(1, min(n, MAX_CONCURRENCY))
+
+    def _fetch_strategy(self):
+        strategy = self.task_data.get('fetch_strategy', 'auto')
+        return strategy if strategy in FETCH_STRATEGIES else 'auto'
+
+    def _extractor(self):
+        extractor = self.task_data.get('extractor', 'auto')
+        return extractor if extractor in EXTRACTORS else 'auto'
+
+    def _shards(self):
+        try:
+            n = int(self.task_data.get('shards', 1))
+        except (TypeError, ValueError):
+            n = 1
+        return max(1, min(n, MAX_SHARDS))
+
+    def _cache_ttl(self):
+        """缓存有效期（秒），None 表示不使用缓存。"""
+        if not self.game_cache:
+            return None
+        try:
+            days = float(self.task_data.get(
+                'cache_ttl_days', DEFAULT_CACHE_TTL_DAYS))
+        except (TypeError, ValueError):
+            days = DEFAULT_CACHE_TTL_DAYS
+        return days * 86400 if days > 0 else None
+
+    def _cached_records(self, ids):
+        ttl = self._cache_ttl()
+        if ttl is None or not ids:
+            return {}
+        return self.game_cache.get_many(ids, ttl)
+
+    def _copy_cached(self, ids):
+        """把缓存中未过期的记录直接写入任务，返回仍需抓取的ID。"""
+        cached = self._cached_records(ids)
+        for gid in ids:
+            if gid in cached:
+                self._store_game(gid, cached[gid], from_cache=True)
+        return [gid for gid in ids if gid not in cached]
+
+    def _retry_max_attempts(self):
+        try:
+            n = int(self.task_data.get('retry_max_attempts', RETRY_MAX_ATTEMPTS))
+        except (TypeError, ValueError):
+            n = RETRY_MAX_ATTEMPTS
+        return max(1, n)
+
+    @staticmethod
+    def _retry_delay(attempts):
+        delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _schedule_retry(self, target_id):
+        max_attempts = self._retry_max_attempts()
+        now = time.time()
+        attempts, due = self.task_data.schedule_retry(
+            target_id, self._retry_delay, max_attempts, now)
+        if due is None:
+            RETRIES.inc(outcome='dead')
+            self.log(f"Giving up on {target_id} after {attempts} failed attempts.")
+        else:
+            RETRIES.inc(outcome='scheduled')
+            self.log(f"Retrying {target_id} in {due - now:.0f}s "
+                     f"(attempt {attempts + 1}/{max_attempts}).")
+
+    def _fixed_rate(self):
+        # 每个并发槽位（或分片进程）按 delay 节流
+        delay = max(float(self.task_data.get('delay', 1.0)), 0.1)
+        return max(self._concurrency(), self._shards()) / delay
+
+    def _rate_control(self):
+        """任务开启 adaptive_rate 时返回控制器（从上次的速率继续），否则 None。
+
+        速率上限是按 delay 计算的固定速率，自适应只在其下调整。
+        工作线程会同时调用，创建和开关都在锁内进行。
+        """
+        with self._lock:
+            if not self.task_data or not self.task_data.get('adaptive_rate'):
+                self.rate_control = None
+                return None
+            max_rate = self._fixed_rate()
+            if self.rate_control is None:
+                self.rate_control = AdaptiveRate(
+                    self.task_data.get('adaptive_rps') or max_rate, max_rate)
+            elif self.rate_control.max_rate != max_rate:
+                # delay 或并发数在运行中被修改
+                self.rate_control.set_max_rate(max_rate)
+            return self.rate_control
+
+    def _observe(self, elapsed=None, error=None):
+        control = self._rate_control()
+        if not control:
+            return
+        if control.observe(elapsed, error):
+            self.log(f"Site under pressure ({error or 'slow response'}). "
+                     f"Backing off to {control.rate:.2f} req/s.")
+        if 'adaptive_rps' in self.task_data:
+            self.task_data['adaptive_rps'] = round(control.rate, 3)
+
+    def _fetch_limit(self):
+        control = self._rate_control()
+        cap = self._concurrency()
+        return control.concurrency(cap) if control else cap
+
+    def begin_fetch(self):
+        """工作线程抓取前调用，在途请求数不超过当前并发上限。"""
+        with self._in_flight_cond:
+            while self._in_flight >= self._fetch_limit():
+                self._in_flight_cond.wait(0.5)
+            self._in_flight += 1
+
+    def end_fetch(self):
+        with self._in_flight_cond:
+            self._in_flight -= 1
+            self._in_flight_cond.notify()
+
+    def rate_status(self):
+        control = self._rate_control()
+        status = {
+            'mode': 'adaptive' if control else 'fixed',
+            'rps': round(self._request_rate(), 2),
+            'concurrency': self._fetch_limit(),
+        }
+        if control:
+            status['latency_ms'] = round(
+                control.latency * 1000) if control.latency else None
+            status['backoffs'] = control.backoffs
+        return status
+
+    def _request_rate(self):
+        # 全局每秒请求数：固定模式由 delay 和并发决定，自适应模式由控制器决定；max_rps 可设置硬上限
+        if not self.task_data:
+            return 1.0
+        control = self._rate_control()
+        rate = control.rate if control else self._fixed_rate()
+        max_rps = self.task_data.get('max_rps')
+        if max_rps:
+            rate = min(rate, float(max_rps))
+        return rate
+
+    def acquire_slot(self):
+        """每次请求前调用：先满足本任务的速率，再排队领取全局预算。"""
+        self.limiter.acquire()
+        if self.scheduler:
+            self.scheduler.acquire(self)
+
+    def _new_browser_session(self):
+        # 共享浏览器在会话第一次需要页面时才启动，纯 HTTP 抓取不会启动它
+        endpoint = self.shared_browser.start if self.shared_browser else None
+        return BrowserSession(stats=self.fetch_stats,
+                              block_resources=self.task_data.get(
+                                  'block_resources', True),
+                              cdp_endpoint=endpoint,
+                              site_host=urlparse(self._base_url()).hostname)
+
+    def _get_fetch_pool(self):
+        size = self._concurrency()
+        if self.fetch_pool and self.fetch_pool.size != size:
+            self.fetch_pool.close()
+            self.fetch_pool = None
+        if not self.fetch_pool:
+            self.fetch_pool = GameFetchPool(self, size)
+            self.log(f"Started {size} fetch workers.")
+        return self.fetch_pool
+
+    def _close_fetch_pool(self):
+        if self.fetch_pool:
+            self.fetch_pool.close()
+            self.fetch_pool = None
+
+    def _prefetch_pages(self):
+        try:
+            return max(0, int(self.task_data.get('prefetch_pages', PREFETCH_PAGES)))
+        except (TypeError, ValueError):
+            return PREFETCH_PAGES
+
+    def _next_list_page(self, session, page):
+        """扫描第 page 页，返回游戏ID列表；开启预取时从预取线程取结果。
+
+        爬虫已停止时返回 None。
+        """
+        ids = self._listed.pop(page, None)
+        if ids is not None:
+            return ids
+
+        lookahead = self._prefetch_pages()
+        if lookahead == 0:
+            self._close_prefetcher()
+            return self._list_page_ids(session, page)
+
+        # 页码不连续（失败重扫、暂停后继续）时重新开始预取
+        if self.prefetcher and self.prefetcher.next_page != page:
+            self._close_prefetcher()
+        if not self.prefetcher:
+            self.prefetcher = ListPrefetcher(
+                self, page, self.task_data.get('end_page'), lookahead)
+
+        result = self.prefetcher.get()
+        if result is None:
+            return None
+        _, ids, error = result
+        if error is not None:
+            raise error
+        return ids
+
+    def _close_prefetcher(self):
+        if self.prefetcher:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+    def _list_page_ids(self, session, page):
+        """扫描第 page 页的游戏ID：browser 策略总是用浏览器，其余先尝试 HTTP。"""
+        if self._fetch_strategy() == 'browser':
+            return self._scan_list_page(session, self._list_url(page))
+        return self._probe_list_page(session, page)
+
+    def _probe_list_page(self, session, page):
+        """扫描列表页，优先用 HTTP 读取服务端 HTML 中的游戏链接；
+        第一次探测发现 HTML 中没有链接时，之后都改用浏览器。"""
+        url = self._list_url(page)
+        if self._http_listing is not False:
+            try:
+                with STAGE_SECONDS.time(stage='list_http'):
+                    html = self.http.get(url)
+            except requests.HTTPError as e:
+                # 超出范围的页码可能直接返回 404
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                html = ''
+            ids = sorted({int(gid) for gid in GAME_LINK_RE.findall(html)})
+            if ids or self._http_listing:
+                self._http_listing = True
+                if html:
+                    self._cache_html(url, html, 'list')
+                return ids
+            self._http_listing = False
+            self.log("List pages are rendered by scripts; probing with the browser.")
+        return self._scan_list_page(session, url)
+
+    def _discover_range(self, session):
+        """指数 + 二分查找最后一个非空列表页并更新 end_page。
+
+        返回探测过的范围内列表页 {页码: ID列表}；被停止或探测出错时返回 None，
+        保留原来的 end_page。
+        """
+        start = self.task_data.get('start_page')
+        first = self.task_data.get('current_page') or start
+        probed = {}
+        started = time.monotonic()
+
+        def probe(page):
+            if page not in probed:
+                self.acquire_slot()
+                probed[page] = self._probe_list_page(session, page)
+            return probed[page]
+
+        def has_games(page):
+            ids = probe(page)
+            # 有的站点对超出范围的页码返回最后一页的内容：与前一页相同说明已超出范围
+            if ids and page > start and probe(page - 1) == ids:
+                return False
+            return bool(ids)
+
+        self.log(f"Auto range: probing list pages from page {first}...")
+        try:
+            if not self.wait_until_runnable():
+                return None
+            if not has_games(first):
+                last = first - 1
+            else:
+                # low 有游戏，high 为空（或尚未探测）
+                low, step = first, 1
+                high = first + step
+                while high <= MAX_PROBE_PAGE and self.wait_until_runnable() and has_games(high):
+                    low = high
+                    step *= 2
+                    high = low + step
+                high = min(high, MAX_PROBE_PAGE + 1)
+                while high - low > 1 and self.wait_until_runnable():
+                    mid = (low + high) // 2
+                    if has_games(mid):
+                        low = mid
+                    else:
+                        high = mid
+                last = low
+        except Exception as e:
+            self.log(f"Auto range failed: {e}. Keeping end page "
+                     f"{self.task_data.get('end_page')}.")
+            return None
+        if not self.running:
+            return None
+
+        old_end = self.task_data.get('end_page')
+        self.task_data['end_page'] = max(last, self.task_data.get('start_page'))
+        self.log(f"Auto range: last page is {last} ({len(probed)} probes in "
+                 f"{time.monotonic() - started:.1f}s), end page {old_end} -> "
+                 f"{self.task_data['end_page']}.")
+        return {p: ids for p, ids in probed.items() if first <= p <= last}
+
+    def _scan_inventory(self, listed):
+        """并行扫描剩余页码范围内尚未探测的列表页，先记录全部已发现ID。
+
+        扫描结果保存在 _listed 中，主循环处理到该页时不再重复请求；
+        扫描失败的页由主循环按原流程重新扫描。
+        """
+        first = self.task_data.get('current_page')
+        last = self.task_data.get('end_page')
+        todo = [p for p in range(first, last + 1) if p not in listed]
+        started = time.monotonic()
+
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+
+        def scan(page):
+            if not self.wait_until_runnable():
+                return page, None
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = self._new_browser_session()
+                with sessions_lock:
+                    sessions.append(session)
+            self.acquire_slot()
+            try:
+                return page, self._probe_list_page(session, page)
+            except Exception as e:
+                self.log(f"Warning: inventory scan of page {page} failed: {e}")
+                return page, None
+
+        if todo:
+            workers = min(RANGE_SCAN_WORKERS, len(todo))
+            try:
+                with ThreadPoolExecutor(workers) as executor:
+                    for page, ids in executor.map(scan, todo):
+                        if ids is not None:
+                            listed[page] = ids
+            finally:
+                for session in sessions:
+                    session.close()
+
+        state = self.task_data
+        found = 0
+        new_count = 0
+        for page in sorted(listed):
+            found += len(listed[page])
+            new_ids = state.add_discovered(listed[page])
+            if new_ids:
+                new_count += len(new_ids)
+                self._record('discovered', new_ids)
+        self._listed = listed
+        self.log(f"Inventory: {found} IDs on {len(listed)} of {last - first + 1} pages "
+                 f"({new_count} new) in {time.monotonic() - started:.1f}s.")
+
+    def _record(self, kind, value):
+        # 单条增量事件，供存储后端按行写入
+        if self.record_callback:
+            self.record_callback(self.task_data, kind, value)
+
+    @property
+    def logs(self):
+        return [msg for _, msg in list(self.log_buffer)]
+
+    def logs_since(self, cursor):
+        """返回序号大于 cursor 的日志及最新序号。"""
+        entries = [msg for seq, msg in list(self.log_buffer) if seq > cursor]
+        return entries, self.log_seq
+
+    def wait_for_update(self, timeout):
+        with self.updated:
+            self.updated.wait(timeout)
+
+    def notify_update(self):
+        with self.updated:
+            self.updated.notify_all()
+
     def log(self, message):
         timestamp = time.strftime("%H:%M:%S")
         log_msg = f"[{timestamp}] {message}"
-        self.logs.append(log_msg)
-        if len(self.logs) > 100:
-            self.logs.pop(0)
+        with self.updated:
+            self.log_seq += 1
+            self.log_buffer.append((self.log_seq, log_msg))
+            self.updated.notify_all()
         if self.log_callback:
             self.log_callback(log_msg)
 
@@ -62,47 +1159,45 @@ class Crawler:
         count_since_save = 0
 
         # 从 task_data 提取配置
-        task_type = self.task_data.get('task_type')
-        target_name = self.task_data.get('target_name')
         start_page = self.task_data.get('start_page')
         end_page = self.task_data.get('end_page')
 
-        # 确保数据结构存在
-        if 'data' not in self.task_data:
-            self.task_data['data'] = []
-        if 'failed_ids' not in self.task_data:
-            self.task_data['failed_ids'] = []
-        if 'failed_pages' not in self.task_data:
-            self.task_data['failed_pages'] = []
-        if 'custom_queue' not in self.task_data:
-            self.task_data['custom_queue'] = []
-        if 'discovered_ids' not in self.task_data:
-            self.task_data['discovered_ids'] = []
-
-        # 创建映射以便快速查找，避免重复
-        data_map = {item['ID']: item for item in self.task_data['data']}
-        discovered_set = set(self.task_data['discovered_ids'])
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            )
-            context.set_default_timeout(30000)
+        # 记录、已发现ID、失败ID等由 TaskState 维护索引，避免重复
+        state = self.task_data
+        state.requeue_in_flight()
+        # 遇到空列表页后不再翻页，只处理剩余的重试
+        pages_exhausted = False
+        waiting_retries = False
 
+        # 浏览器在第一次需要时才启动
+        session = self._new_browser_session()
+        try:
             self.log(f"Started crawling task: {self.task_data.get('name')}")
 
+            if self.task_data.get('auto_range'):
+                # 先确定真实页数并列出全部ID，再开始抓取详情页
+                listed = self._discover_range(session)
+                if listed is not None:
+                    self._scan_inventory(listed)
+                    if self.save_callback:
+                        self.save_callback(self.task_data)
+                end_page = self.task_data.get('end_page')
+
+            if self._shards() > 1:
+                # 分片进程处理页码范围和重试队列，剩余工作（失败页等）由下面的循环接手
+                self._crawl_sharded()
+
             while self.running:
                 if self.paused:
                     time.sleep(0.5)
                     continue
 
                 # 1. 优先处理自定义队列（重试失败的游戏ID）
-                if self.task_data['custom_queue']:
-                    target_id = self.task_data['custom_queue'].pop(0)
+                if state.queue:
+                    target_id = state.pop_queue()
                     self.processing_id = target_id
-                    self._crawl_game(context, target_id,
-                                     data_map, is_custom=True)
+                    self.acquire_slot()
+                    self._crawl_game(session, target_id, is_custom=True)
 
                     # 保存检查
                     count_since_save += 1
@@ -112,69 +1207,84 @@ class Crawler:
                         count_since_save = 0
                     continue
 
-                # 2. 正常流程：按页抓取
+                # 2. 到期的自动重试，穿插在两页之间
+                due_ids = state.pop_due_retries(time.time(), RETRY_BATCH)
+                if due_ids:
+                    self.log(f"Retrying {len(due_ids)} failed IDs.")
+                    self._fetch_ids(session, due_ids)
+                    if self.save_callback:
+                        self.save_callback(self.task_data)
+                    continue
+
+                # 3. 正常流程：按页抓取
                 current_page = self.task_data.get('current_page', start_page)
 
-                if current_page > end_page:
-                    self.log("Reached end of page range.")
+                if current_page > end_page or pages_exhausted:
+                    next_retry = state.next_retry_at()
+                    if next_retry is not None:
+                        # 页已抓完，等剩余的自动重试到期
+                        if not waiting_retries:
+                            self.log(f"All pages done. Waiting for {len(state.retries)} "
+                                     f"scheduled retries (next in {max(0, next_retry - time.time()):.0f}s).")
+                            waiting_retries = True
+                        time.sleep(min(max(next_retry - time.time(), 0.05), 0.5))
+                        continue
+                    if not pages_exhausted:
+                        self.log("Reached end of page range.")
                     self.running = False
                     self.task_data['status'] = 'completed'
                     break
 
                 # 构建列表页 URL
-                if task_type == 'series':
-                    list_url = f"https://zaixianwan.app/series/{target_name}?page={current_page}"
-                else:  # console
-                    list_url = f"https://zaixianwan.app/consoles/{target_name}?page={current_page}"
+                list_url = self._list_url(current_page)
 
                 self.current_url = list_url
                 self.log(f"Scanning Page {current_page}: {list_url}")
 
                 try:
-                    page_ids = self._scan_list_page(context, list_url)
+                    page_ids = self._next_list_page(session, current_page)
+                    if page_ids is None:
+                        # 等待预取结果时被停止
+                        break
 
                     if not page_ids:
                         self.log(
                             f"Page {current_page} returned no IDs. Stopping.")
-                        # 如果页面为空，可能已经超出了实际页数
-                        self.running = False
-                        self.task_data['status'] = 'completed'
-                        break
+                        # 如果页面为空，可能已经超出了实际页数（仍会等剩余的自动重试）
+                        pages_exhausted = True
+                        continue
 
                     # 更新已发现ID列表
-                    new_ids_count = 0
-                    for pid in page_ids:
-                        if pid not in discovered_set:
-                            self.task_data['discovered_ids'].append(pid)
-                            discovered_set.add(pid)
-                            new_ids_count += 1
+                    new_ids = state.add_discovered(page_ids)
+                    new_ids_count = len(new_ids)
+                    if new_ids:
+                        self._record('discovered', new_ids)
 
                     self.log(
                         f"Page {current_page}: Found {len(page_ids)} IDs ({new_ids_count} new).")
 
                     # 抓取本页的所有游戏
-                    for gid in page_ids:
-                        if not self.running:
-                            break
-                        if self.paused:
-                            while self.paused:
-                                time.sleep(0.5)
+                    # 如果已经在数据中，跳过（除非强制刷新，这里默认跳过）
+                    pending_ids = [
+                        gid for gid in page_ids if not state.has_record(gid)]
+                    # 其他任务已抓取过的直接复制
+                    pending_ids = self._copy_cached(pending_ids)
+                    self._fetch_ids(session, pending_ids)
 
-                        # 如果已经在数据中，跳过（除非强制刷新，这里默认跳过）
-                        if gid in data_map:
-                            continue
-
-                        self.processing_id = gid
-                        self._crawl_game(
-                            context, gid, data_map, is_custom=False)
+                    if not self.running:
+                        # 本页未抓完就被停止：不推进 current_page，下次从本页继续
+                        break
 
-                        # 每次抓取后稍微延迟
-                        delay = self.task_data.get('delay', 1.0)
-                        time.sleep(delay)
+                    stats = self.fetch_stats.summary()
+                    self.log(
+                        f"Fetch stats: http {stats['http']}, browser {stats['browser']}, "
+                        f"failed {stats['failed']}, cached {stats['cached']} "
+                        f"(http hit rate {stats['http_hit_rate']:.0%}), "
+                        f"{stats['bytes'] / 1024:.0f} KB transferred, {stats['blocked']} requests blocked, "
+                        f"avg {stats['avg_fetch_seconds']:.2f}s/game")
 
                     # 页面完成
-                    if current_page in self.task_data['failed_pages']:
-                        self.task_data['failed_pages'].remove(current_page)
+                    state.remove_failed_page(current_page)
 
                     self.task_data['current_page'] += 1
 
@@ -183,16 +1293,19 @@ class Crawler:
                         self.save_callback(self.task_data)
 
                 except Exception as e:
+                    FAILURES.inc(kind='list')
                     self.log(f"Error scanning page {current_page}: {e}")
-                    if current_page not in self.task_data['failed_pages']:
-                        self.task_data['failed_pages'].append(current_page)
+                    state.add_failed_page(current_page)
 
                     # 遇到页面错误，暂停还是继续？
                     # 这里选择暂停，防止网络问题导致连续翻页失败
                     self.paused = True
                     self.log("Page scan failed. Pausing.")
 
-            browser.close()
+        finally:
+            self._close_prefetcher()
+            self._close_fetch_pool()
+            session.close()
 
         self.running = False
 
@@ -203,26 +1316,208 @@ class Crawler:
             self.task_data['status'] = 'stopped'
 
         if self.save_callback:
-            self.save_callback(self.task_data)
+            # 最后一次保存要等写完，之后重新加载任务时才能看到最终状态
+            self.save_callback(self.task_data, final=True)
         self.log("Crawler stopped.")
 
-    def _scan_list_page(self, context, url):
+    def _base_url(self):
+        return (self.task_data.get('base_url') or BASE_URL).rstrip('/')
+
+    def _fetch_ids(self, session, ids):
+        """抓取一批游戏：并发数 > 1 时交给工作线程池，结果仍由爬虫线程写入。"""
+        if self._concurrency() > 1 and len(ids) > 1:
+            results = self._get_fetch_pool().run(ids)
+            try:
+                for gid, item, err, elapsed in results:
+                    if item:
+                        self._store_game(gid, item, elapsed)
+                    elif err:
+                        self._record_failure(gid, err, is_custom=False)
+            finally:
+                # 写入出错时放弃这一批剩余的抓取
+                results.close()
+            return
+
+        for gid in ids:
+            if not self.wait_until_runnable():
+                break
+
+            self.processing_id = gid
+            # 全局速率预算代替每次抓取后的固定延迟
+            self.acquire_slot()
+            self._crawl_game(session, gid, is_custom=False)
+
+    def _list_url(self, page):
+        target_name = self.task_data.get('target_name')
+        if self.task_data.get('task_type') == 'series':
+            return f"{self._base_url()}/series/{target_name}?page={page}"
+        # console
+        return f"{self._base_url()}/consoles/{target_name}?page={page}"
+
+    def _crawl_sharded(self):
+        """把剩余页码（交错分配）和重试队列分给多个子进程抓取。
+
+        子进程各自启动浏览器并解析页面，结果通过队列交回本线程写入 task_data，
+        仍按ID去重。请求令牌由本线程按任务速率和全局预算发放。
+        """
+        state = self.task_data
+        shards = self._shards()
+        start_page = state.get('current_page', state.get('start_page'))
+        pages = list(range(start_page, state.get('end_page') + 1))
+        # 队列中的ID在分片报告处理结果后才移除，中途停止时未处理的仍留在队列里
+        ids = list(state.queue)
+        pending_ids = set(ids)
+        if not pages and not ids:
+            return
+
+        ctx = multiprocessing.get_context(SHARD_START_METHOD)
+        results = ctx.Queue()
+        tokens = ctx.Queue(maxsize=shards)
+        stop = ctx.Event()
+        config = {
+            'header': state.to_dict(rows=False),
+            'known_ids': list(state.records),
+            'cache_path': self.game_cache.db_path if self.game_cache else None,
+            'html_cache_dir': self.html_cache.root if self.html_cache else None,
+        }
+        procs = []
+        for i in range(shards):
+            p = ctx.Process(target=run_shard, args=(
+                i, config, pages[i::shards], ids[i::shards], results, tokens, stop))
+            p.daemon = True
+            p.start()
+            procs.append(p)
+        self.log(f"Started {shards} shard processes for {len(pages)} pages.")
+
+        def feed_tokens():
+            while not stop.is_set():
+                if not self.wait_until_runnable():
+                    return
+                self.acquire_slot()
+                while not stop.is_set():
+                    try:
+                        tokens.put(1, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+
+        feeder = threading.Thread(target=feed_tokens)
+        feeder.daemon = True
+        feeder.start()
+
+        done_pages = set()
+        finished = 0
+        try:
+            while finished < shards:
+                if not self.running:
+                    stop.set()
+                try:
+                    msg = results.get(timeout=0.5)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in procs):
+                        break
+                    continue
+
+                kind = msg[0]
+                if kind == 'log':
+                    self.log(msg[1])
+                elif kind == 'page':
+                    _, page, page_ids = msg
+                    new_ids = state.add_discovered(page_ids)
+                    if new_ids:
+                        self._record('discovered', new_ids)
+                    self.log(
+                        f"Page {page}: Found {len(page_ids)} IDs ({len(new_ids)} new).")
+                elif kind == 'game':
+                    _, gid, item, elapsed = msg
+                    self.processing_id = gid
+                    self._observe(elapsed)
+                    self._store_game(gid, item, elapsed)
+                    if gid in pending_ids:
+                        pending_ids.discard(gid)
+                        state.remove_queued(gid)
+                elif kind == 'cached':
+                    _, gid, item = msg
+                    self._store_game(gid, item, from_cache=True)
+                elif kind == 'failed':
+                    _, gid, err, is_custom = msg
+                    if is_overload_error(err):
+                        self._observe(error=err)
+                    self._record_failure(gid, Exception(err), is_custom)
+                    if is_custom and gid in pending_ids:
+                        pending_ids.discard(gid)
+                        state.remove_queued(gid)
+                elif kind in ('page_done', 'page_empty'):
+                    page = msg[1]
+                    done_pages.add(page)
+                    state.remove_failed_page(page)
+                    if kind == 'page_empty':
+                        self.log(f"Page {page} returned no IDs.")
+                    # current_page 只推进到第一个未完成的页（低水位）
+                    current = state.get('current_page', start_page)
+                    while current in done_pages:
+                        current += 1
+                    state['current_page'] = current
+                    if self.save_callback:
+                        self.save_callback(state)
+                elif kind == 'page_failed':
+                    _, page, err = msg
+                    FAILURES.inc(kind='list')
+                    self.log(f"Error scanning page {page}: {err}")
+                    state.add_failed_page(page)
+                elif kind == 'stats':
+                    self.fetch_stats.merge(msg[1])
+                elif kind == 'metrics':
+                    REGISTRY.merge(msg[1])
+                elif kind == 'done':
+                    finished += 1
+        finally:
+            stop.set()
+            for p in procs:
+                p.join(timeout=10)
+            feeder.join(timeout=5)
+
+        if self.save_callback:
+            self.save_callback(state)
+        self.log(f"Shard processes finished ({len(done_pages)}/{len(pages)} pages).")
+        if pending_ids:
+            self.log(f"{len(pending_ids)} queued IDs were not processed and stay in the queue.")
+
+    def _cache_html(self, url, html, kind):
+        # 缓存失败不影响抓取
+        if not self.html_cache:
+            return
+        try:
+            self.html_cache.put(url, html, kind)
+        except Exception as e:
+            self.log(f"Warning: HTML cache write failed for {url}: {e}")
+
+    def _scan_list_page(self, session, url):
         import re
-        page = context.new_page()
+        page = session.acquire_page()
+        reuse = False
         try:
             # 使用 networkidle 确保动态内容已加载
-            page.goto(url, timeout=30000, wait_until='networkidle')
+            with STAGE_SECONDS.time(stage='list_goto'):
+                page.goto(url, timeout=30000, wait_until='networkidle')
 
             # 等待至少一个游戏链接出现
             try:
-                page.wait_for_selector('a[href^="/games/"]', timeout=5000)
+                with STAGE_SECONDS.time(stage='list_wait'):
+                    page.wait_for_selector('a[href^="/games/"]', timeout=5000)
             except:
+                WAIT_TIMEOUTS.inc(kind='list')
                 self.log(f"Warning: No game links found immediately on {url}")
 
             # 提取所有 /games/xxxxx 链接
             # 使用 evaluate 执行 JS 提取更稳健
-            links = page.eval_on_selector_all(
-                'a[href^="/games/"]', 'elements => elements.map(e => e.getAttribute("href"))')
+            with STAGE_SECONDS.time(stage='list_links'):
+                links = page.eval_on_selector_all(
+                    'a[href^="/games/"]', 'elements => elements.map(e => e.getAttribute("href"))')
+            if self.html_cache:
+                with STAGE_SECONDS.time(stage='list_content'):
+                    content = page.content()
+                self._cache_html(url, content, 'list')
 
             ids = []
             for link in links:
@@ -230,96 +1525,308 @@ class Crawler:
                 if match:
                     ids.append(int(match.group(1)))
 
+            reuse = True
             # 去重并保持顺序
             return sorted(list(set(ids)))
         finally:
-            page.close()
+            session.release_page(page, reuse)
 
-    def _crawl_game(self, context, target_id, data_map, is_custom=False):
-        url = f"https://zaixianwan.app/games/{target_id}"
-        self.current_url = url
+    def _crawl_game(self, session, target_id, is_custom=False):
+        try:
+            item, elapsed = self._timed_fetch(session, target_id)
+        except Exception as e:
+            self._record_failure(target_id, e, is_custom)
+            return
+        self._store_game(target_id, item, elapsed)
 
+    def _timed_fetch(self, session, target_id):
+        start = time.monotonic()
         try:
-            page = context.new_page()
+            item = self._fetch_game(session, target_id)
+        except Exception as e:
+            if is_overload_error(e):
+                self._observe(error=e)
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            self.fetch_stats.add('fetch_seconds', elapsed)
+        self._observe(elapsed)
+        return item, elapsed
+
+    def _fetch_game(self, session, target_id):
+        """按任务的抓取策略获取并解析详情页，不修改 task_data（可在工作线程中调用）。"""
+        url = game_url(target_id, self._base_url())
+        self.current_url = url
+        strategy = self._fetch_strategy()
+
+        if strategy != 'browser':
+            # 请求本身出错（429/5xx/超时等）直接算失败，交给速率控制和自动重试，
+            # 不在站点承压时再用浏览器多发一次请求
             try:
-                for attempt in range(3):
-                    try:
+                with STAGE_SECONDS.time(stage='game_http'):
+                    html = self.http.get(url)
+            except Exception:
+                self.fetch_stats.record('failed')
+                raise
+            self._cache_html(url, html, 'game')
+            try:
+                with STAGE_SECONDS.time(stage='parse'):
+                    item = parse_game_html(
+                        html, target_id, url, self._extractor())
+                if item['Title'] == PLACEHOLDER_TITLE:
+                    raise Exception("Placeholder title")
+                self.fetch_stats.record('http')
+                GAMES.inc(source='http')
+                return item
+            except Exception:
+                # 标题不在服务端 HTML 中：auto 策略回退到浏览器渲染
+                if strategy == 'http':
+                    self.fetch_stats.record('failed')
+                    raise
+
+        try:
+            item = self._fetch_game_browser(session, target_id, url)
+        except Exception:
+            self.fetch_stats.record('failed')
+            raise
+        self.fetch_stats.record('browser')
+        GAMES.inc(source='browser')
+        return item
+
+    def _fetch_game_browser(self, session, target_id, url):
+        page = session.acquire_page()
+        reuse = False
+        try:
+            for attempt in range(3):
+                try:
+                    with STAGE_SECONDS.time(stage='game_goto'):
                         page.goto(url, timeout=15000,
                                   wait_until='domcontentloaded')
-                        break
-                    except Exception as nav_err:
-                        if attempt == 2:
-                            raise nav_err
-                        time.sleep(2)
+                    break
+                except Exception as nav_err:
+                    if attempt == 2:
+                        raise nav_err
+                    NAVIGATION_RETRIES.inc(kind='game')
+                    time.sleep(2)
 
-                # 等待元素
-                try:
-                    page.wait_for_selector('.game-title', timeout=3000)
-                except:
-                    pass
-                try:
-                    page.wait_for_selector(
-                        '.description-markdown-html', timeout=2000)
-                except:
-                    pass
-
-                content = page.content()
-                soup = BeautifulSoup(content, 'html.parser')
-
-                # 提取数据
-                title = ""
-                title_tag = soup.find('span', class_='game-title')
-                if title_tag:
-                    title = title_tag.get_text(strip=True)
-
-                if not title:
-                    raise Exception("Title not found")
-
-                desc = ""
-                desc_tag = soup.find('div', class_='description-markdown-html')
-                if desc_tag:
-                    desc = desc_tag.get_text(strip=True)
-
-                self.current_title = title
-                self.current_desc = desc[:100] + \
-                    "..." if len(desc) > 100 else desc
-
-                item = {
-                    'ID': target_id,
-                    'URL': url,
-                    'Title': title,
-                    'Description': desc
-                }
-
-                # 更新数据
-                data_map[target_id] = item
-
-                # 更新列表中的数据
-                existing_index = next((i for i, x in enumerate(
-                    self.task_data['data']) if x['ID'] == target_id), -1)
-                if existing_index >= 0:
-                    self.task_data['data'][existing_index] = item
-                else:
-                    self.task_data['data'].append(item)
-
-                self.log(f"Fetched {target_id}: {title}")
-
-                if target_id in self.task_data['failed_ids']:
-                    self.task_data['failed_ids'].remove(target_id)
+            # 标题出现即返回（简介随后或同时渲染）
+            try:
+                with STAGE_SECONDS.time(stage='game_wait'):
+                    page.wait_for_function(GAME_READY_JS, timeout=5000)
+            except:
+                WAIT_TIMEOUTS.inc(kind='game')
 
-            finally:
-                page.close()
+            if self._extractor() == 'dom':
+                # 只取两段文本，不序列化整个 DOM（也就不写入 HTML 缓存）
+                with STAGE_SECONDS.time(stage='game_dom'):
+                    title, desc = page.evaluate(GAME_EXTRACT_JS)
+                content = None
+            else:
+                with STAGE_SECONDS.time(stage='game_content'):
+                    content = page.content()
+            reuse = True
+        finally:
+            session.release_page(page, reuse)
 
-        except Exception as e:
-            err_msg = str(e)
-            self.log(f"Error {target_id}: {err_msg}")
+        if content is None:
+            return game_record(target_id, url, title, desc)
+        self._cache_html(url, content, 'game')
+        with STAGE_SECONDS.time(stage='parse'):
+            return parse_game_html(content, target_id, url, self._extractor())
+
+    def _store_game(self, target_id, item, elapsed=None, from_cache=False):
+        """写入抓取结果，只在爬虫线程中调用。"""
+        with STAGE_SECONDS.time(stage='store'):
+            self._write_game(target_id, item, elapsed, from_cache)
+
+    def _write_game(self, target_id, item, elapsed, from_cache):
+        title = item['Title']
+        desc = item['Description']
+        self.current_title = title
+        self.current_desc = desc[:100] + \
+            "..." if len(desc) > 100 else desc
 
-            if "ERR_INTERNET_DISCONNECTED" in err_msg or "Connection refused" in err_msg:
+        # 更新数据（按ID覆盖旧记录）
+        self.task_data.upsert(item)
+
+        if from_cache:
+            self.fetch_stats.record('cached')
+            GAMES.inc(source='cache')
+            self.log(f"Cached {target_id}: {title}")
+        elif elapsed is not None:
+            self.log(f"Fetched {target_id}: {title} ({elapsed:.2f}s)")
+        else:
+            self.log(f"Fetched {target_id}: {title}")
+
+        self._record('game', item)
+        if self.game_cache and not from_cache:
+            self.game_cache.put(item)
+        if not from_cache:
+            self._network_errors = 0
+
+        self.task_data.clear_retry(target_id)
+        if self.task_data.remove_failed(target_id):
+            self._record('recovered', target_id)
+
+    def _record_failure(self, target_id, error, is_custom=False):
+        FAILURES.inc(kind='game')
+        err_msg = str(error)
+        self.log(f"Error {target_id}: {err_msg}")
+
+        if self.task_data.add_failed(target_id):
+            self._record('failed', target_id)
+        # 手动重试失败的ID同样按退避时间自动重试
+        self._schedule_retry(target_id)
+
+        if "ERR_INTERNET_DISCONNECTED" in err_msg or "Connection refused" in err_msg:
+            # 偶发的网络错误只按退避重试；连续出错说明可能已断网，暂停等待处理
+            self._network_errors += 1
+            if self._network_errors >= NETWORK_ERROR_PAUSE:
+                self._network_errors = 0
                 self.paused = True
-                self.log("Network error. Pausing.")
-                if is_custom:
-                    self.task_data['custom_queue'].insert(0, target_id)
-                return
+                self.log(f"{NETWORK_ERROR_PAUSE} network errors in a row. Pausing.")
+
+
+class CrawlerManager:
+    """同时运行多个任务：每个任务一个 Crawler，共享一个 Chromium 和全局礼貌预算。"""
+
+    def __init__(self, global_rps=5.0, game_cache=None, html_cache=None):
+        self.global_rps = global_rps
+        self.game_cache = game_cache
+        self.html_cache = html_cache
+        self.shared_browser = SharedBrowser()
+        self.scheduler = FairScheduler(lambda: self.global_rps)
+        self._crawlers = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """任务的爬虫，没有时创建（只在启动任务时调用）。"""
+        with self._lock:
+            crawler = self._crawlers.get(filename)
+            if crawler is None:
+                crawler = Crawler(shared_browser=self.shared_browser,
+                                  scheduler=self.scheduler,
+                                  game_cache=self.game_cache,
+                                  html_cache=self.html_cache)
+                self._crawlers[filename] = crawler
+            return crawler
+
+    def find(self, filename):
+        """已创建的爬虫，没有时返回 None（状态查询等只读路径使用，不创建）。"""
+        with self._lock:
+            return self._crawlers.get(filename)
+
+    def is_running(self, filename):
+        with self._lock:
+            crawler = self._crawlers.get(filename)
+        return bool(crawler and crawler.running)
+
+    def running_filenames(self):
+        with self._lock:
+            return [f for f, c in self._crawlers.items() if c.running]
+
+    def rename(self, old_filename, new_filename):
+        with self._lock:
+            crawler = self._crawlers.pop(old_filename, None)
+            if crawler is not None:
+                self._crawlers[new_filename] = crawler
+
+    def discard(self, filename):
+        with self._lock:
+            crawler = self._crawlers.get(filename)
+            if crawler and not crawler.running:
+                del self._crawlers[filename]
+
+
+class ShardCrawler(Crawler):
+    """分片子进程中的爬虫：只抓取和解析，结果通过队列交给父进程写入。"""
+
+    def __init__(self, shard, header, results, tokens, stop, game_cache=None,
+                 html_cache=None):
+        super().__init__(game_cache=game_cache, html_cache=html_cache)
+        self.shard = shard
+        self.task_data = TaskState(header)
+        self.results = results
+        self.tokens = tokens
+        self.stop_event = stop
+        self.running = True
+
+    def log(self, message):
+        self.results.put(('log', f"[shard {self.shard}] {message}"))
+
+    def wait_until_runnable(self):
+        return not self.stop_event.is_set()
+
+    def _observe(self, elapsed=None, error=None):
+        # 速率由父进程根据传回的结果调整
+        pass
+
+    def acquire_slot(self):
+        """等待父进程发放的请求令牌，停止时返回 False。"""
+        while not self.stop_event.is_set():
+            try:
+                self.tokens.get(timeout=0.5)
+                return True
+            except queue.Empty:
+                continue
+        return False
+
+    def _fetch_one(self, session, target_id, is_custom=False):
+        try:
+            item, elapsed = self._timed_fetch(session, target_id)
+            self.results.put(('game', target_id, item, elapsed))
+        except Exception as e:
+            self.results.put(('failed', target_id, str(e), is_custom))
+
+    def run(self, pages, ids, known_ids):
+        known = set(known_ids)
+        session = self._new_browser_session()
+        try:
+            for target_id in ids:
+                if not self.acquire_slot():
+                    return
+                self._fetch_one(session, target_id, is_custom=True)
+
+            for page in pages:
+                if not self.acquire_slot():
+                    return
+                try:
+                    page_ids = self._list_page_ids(session, page)
+                except Exception as e:
+                    self.results.put(('page_failed', page, str(e)))
+                    continue
+                if not page_ids:
+                    self.results.put(('page_empty', page))
+                    continue
+
+                self.results.put(('page', page, page_ids))
+                pending = [gid for gid in page_ids if gid not in known]
+                cached = self._cached_records(pending)
+                for target_id in pending:
+                    if target_id in cached:
+                        self.results.put(('cached', target_id, cached[target_id]))
+                        known.add(target_id)
+                        continue
+                    if not self.acquire_slot():
+                        return
+                    self._fetch_one(session, target_id)
+                    known.add(target_id)
+                self.results.put(('stats', self.fetch_stats.drain()))
+                self.results.put(('metrics', REGISTRY.drain()))
+                self.results.put(('page_done', page))
+        finally:
+            session.close()
+            self.results.put(('stats', self.fetch_stats.drain()))
+            self.results.put(('metrics', REGISTRY.drain()))
+            self.results.put(('done', self.shard))
+
 
-            if target_id not in self.task_data['failed_ids']:
-                self.task_data['failed_ids'].append(target_id)
+def run_shard(shard, config, pages, ids, results, tokens, stop):
+    """分片子进程入口（模块级函数，spawn 方式下可被导入）。"""
+    game_cache = GameCache(
+        config['cache_path']) if config['cache_path'] else None
+    html_cache = HtmlCache(
+        config['html_cache_dir']) if config['html_cache_dir'] else None
+    crawler = ShardCrawler(shard, config['header'], results, tokens, stop,
+                           game_cache, html_cache)
+    crawler.run(pages, ids, config['known_ids'])
@@ -0,0 +1,17 @@
+"""SQLite 连接的公共设置，任务后端、游戏缓存、HTML 缓存和搜索索引共用。"""
+import sqlite3
+
+
+def thread_connection(local, db_path):
+    """返回当前线程的连接，没有时创建。
+
+    sqlite3 连接不能跨线程使用，每个线程（以及每个分片子进程）一个连接，
+    保存在 threading.local 的 conn 属性上。WAL 模式下读不阻塞写。
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        local.conn = conn
+    return conn
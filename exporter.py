@@ -1,51 +1,189 @@
-import pandas as pd
-import os
+import csv
 import io
+import json
+import os
+import datetime
+import tempfile
+from itertools import chain
 
+from openpyxl import Workbook
 
-def export_task_to_excel(task_data):
-    """
-    Converts task data to an Excel file bytes object.
-    """
-    data_list = task_data.get('data', [])
+# pyarrow 是可选依赖，只有导出 Parquet 时需要
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
-    if not data_list:
-        return None
+EXPECTED_COLUMNS = ['ID', 'Title', 'URL', 'Description']
+
+# 格式 -> (MIME 类型, 扩展名)
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+CHUNK_SIZE = 64 * 1024
+PARQUET_BATCH_ROWS = 10000
+
+
+def available_formats():
+    return [f for f in EXPORT_FORMATS if f != 'parquet' or pa is not None]
+
+
+def _columns(records):
+    # Expected columns first, then any other keys present in the data,
+    # collected over all records (only the keys are kept, not the records)
+    keys = {}
+    for item in records:
+        keys.update(dict.fromkeys(item))
+    cols = [c for c in EXPECTED_COLUMNS if c in keys]
+    cols += [c for c in keys if c not in EXPECTED_COLUMNS]
+    return cols
+
+
+def _iter_file(f):
+    """Yields a temp file in chunks and removes it afterwards."""
+    try:
+        f.seek(0)
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def _iter_xlsx(records, cols):
+    # Write-only mode streams rows to disk instead of keeping cells in memory
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Games')
+    ws.append(cols)
+    for item in records:
+        ws.append([item.get(c) for c in cols])
+
+    f = tempfile.TemporaryFile()
+    wb.save(f)
+    yield from _iter_file(f)
 
-    df = pd.DataFrame(data_list)
 
-    # Reorder columns if needed, or ensure specific columns exist
-    expected_columns = ['ID', 'Title', 'URL', 'Description']
-    # Filter to only include expected columns if they exist, or all if not
-    cols = [c for c in expected_columns if c in df.columns]
-    # Add any other columns that might be in the data
-    cols += [c for c in df.columns if c not in expected_columns]
+def _iter_csv(records, cols):
+    buf = io.StringIO()
+    # BOM so Excel opens the UTF-8 file with the right encoding
+    buf.write('\ufeff')
+    writer = csv.writer(buf)
+    writer.writerow(cols)
+    for item in records:
+        writer.writerow([item.get(c) for c in cols])
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode('utf-8')
 
-    df = df[cols]
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Games')
+def _iter_jsonl(records, cols):
+    lines = []
+    size = 0
+    for item in records:
+        line = json.dumps(item, ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+            size = 0
+    yield ''.join(lines).encode('utf-8')
 
-    output.seek(0)
-    return output
 
+def _parquet_row(item, cols):
+    # The schema is fixed before the first row is written, so every column
+    # but ID is written as text (a stray int would abort the stream midway)
+    row = {}
+    for c in cols:
+        value = item.get(c)
+        if value is not None and c != 'ID' and not isinstance(value, str):
+            value = str(value)
+        row[c] = value
+    return row
 
-def generate_filename(task_data):
+
+def _iter_parquet(records, cols):
+    schema = pa.schema([(c, pa.int64() if c == 'ID' else pa.string())
+                        for c in cols])
+    f = tempfile.TemporaryFile()
+    writer = pq.ParquetWriter(f, schema)
+    try:
+        batch = []
+        for item in records:
+            batch.append(_parquet_row(item, cols))
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+    yield from _iter_file(f)
+
+
+# jsonl writes each record as is and needs no fixed header
+_NEEDS_COLUMNS = ('xlsx', 'csv', 'parquet')
+
+_WRITERS = {
+    'xlsx': _iter_xlsx,
+    'csv': _iter_csv,
+    'jsonl': _iter_jsonl,
+    'parquet': _iter_parquet,
+}
+
+
+def stream_export(records, fmt='xlsx'):
+    """
+    Streams task records in the given format as chunks of bytes.
+    records is an iterable, or a callable returning a fresh iterable so that
+    formats with a fixed header can make a first pass to collect the columns.
+    Returns None when there is no data to export.
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    if callable(records):
+        open_records = records
+    else:
+        if iter(records) is records:
+            # A one-shot iterator can't be read twice
+            records = list(records)
+        open_records = lambda: records
+
+    if fmt in _NEEDS_COLUMNS:
+        cols = _columns(open_records())
+        if not cols:
+            return None
+        return _WRITERS[fmt](open_records(), cols)
+
+    records = iter(open_records())
+    first = next(records, None)
+    if first is None:
+        return None
+    return _WRITERS[fmt](chain([first], records), None)
+
+
+def generate_filename(task_data, fmt='xlsx'):
     # Get the original filename without extension
     json_filename = task_data.get('filename', 'export')
-    if json_filename.endswith('.json'):
-        base_name = json_filename[:-5]
-    else:
-        base_name = json_filename
+    base_name, _ = os.path.splitext(json_filename)
 
     # Get created_at date part (YYYYMMDD)
-    created_at = task_data.get('created_at', '')
+    created_at = task_data.get('created_at') or ''
     if '_' in created_at:
         date_part = created_at.split('_')[0]
     else:
         # Fallback
-        import datetime
         date_part = datetime.datetime.now().strftime('%Y%m%d')
 
-    return f"{base_name}_{date_part}.xlsx"
+    return f"{base_name}_{date_part}.{EXPORT_FORMATS[fmt][1]}"
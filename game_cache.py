@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from db import thread_connection
+
+CACHE_DB_FILENAME = 'game_cache.db'
+
+# 默认有效期（天），任务中的 cache_ttl_days 可覆盖，0 表示总是重新抓取
+DEFAULT_CACHE_TTL_DAYS = 30
+
+_BATCH = 500
+
+
+class GameCache:
+    """跨任务共享的游戏记录缓存，按ID存储记录和抓取时间。
+
+    爬虫抓取列表页后先查缓存，未过期的记录直接复制进任务，不再请求详情页。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS games (
+        id INTEGER PRIMARY KEY,
+        record TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS seeded_tasks (
+        filename TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def in_dir(cls, tasks_dir):
+        return cls(os.path.join(tasks_dir, CACHE_DB_FILENAME))
+
+    def _conn(self):
+        return thread_connection(self._local, self.db_path)
+
+    def get_many(self, ids, max_age):
+        """返回 {ID: 记录}，只包含 max_age 秒内抓取的记录。"""
+        ids = list(ids)
+        min_fetched_at = time.time() - max_age
+        found = {}
+        conn = self._conn()
+        for i in range(0, len(ids), _BATCH):
+            batch = ids[i:i + _BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT id, record FROM games WHERE fetched_at >= ? AND id IN ({placeholders})',
+                [min_fetched_at] + batch)
+            for gid, record in rows:
+                found[gid] = json.loads(record)
+        return found
+
+    def put(self, item, fetched_at=None):
+        with self._conn() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO games (id, record, fetched_at) VALUES (?, ?, ?)',
+                (item['ID'], json.dumps(item, ensure_ascii=False),
+                 fetched_at or time.time()))
+
+    def update_record(self, item):
+        """替换记录内容但保留抓取时间（离线重新解析时使用）。"""
+        with self._conn() as conn:
+            conn.execute('UPDATE games SET record = ? WHERE id = ?',
+                         (json.dumps(item, ensure_ascii=False), item['ID']))
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def seed(self, task_manager):
+        """把已有任务中的记录导入缓存（不覆盖更新的记录）。
+
+        旧记录没有抓取时间，按任务创建时间计算。
+        """
+        conn = self._conn()
+        seeded = dict(conn.execute('SELECT filename, count FROM seeded_tasks'))
+        for task in task_manager.list_tasks():
+            filename = task['filename']
+            if seeded.get(filename) == task['count']:
+                continue
+            try:
+                fetched_at = datetime.strptime(
+                    task.get('created_at') or '', '%Y%m%d_%H%M%S').timestamp()
+            except ValueError:
+                fetched_at = 0
+            with conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO games (id, record, fetched_at) VALUES (?, ?, ?)',
+                    ((item['ID'], json.dumps(item, ensure_ascii=False), fetched_at)
+                     for item in task_manager.iter_records(filename)))
+                conn.execute(
+                    'INSERT OR REPLACE INTO seeded_tasks (filename, count) VALUES (?, ?)',
+                    (filename, task['count']))
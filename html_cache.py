@@ -0,0 +1,227 @@
+import hashlib
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from db import thread_connection
+
+HTML_CACHE_DIRNAME = 'html_cache'
+
+# 每个 worker 一次处理的页面数
+EXTRACT_CHUNKSIZE = 64
+
+
+class HtmlCache:
+    """抓取到的列表页/详情页原始 HTML 缓存。
+
+    HTML 按内容的 sha256 存为 zlib 压缩文件（相同内容只存一份），
+    index.db 记录每次抓取的 URL、时间和内容摘要，可以取某个 URL 最新的版本。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fetches (
+        url TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        digest TEXT NOT NULL,
+        kind TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS fetches_url ON fetches (url, fetched_at);
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def in_dir(cls, tasks_dir):
+        return cls(os.path.join(tasks_dir, HTML_CACHE_DIRNAME))
+
+    def _conn(self):
+        return thread_connection(self._local, os.path.join(self.root, 'index.db'))
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:] + '.z')
+
+    def put(self, url, html, kind):
+        """保存一次抓取结果，返回内容摘要。"""
+        raw = html.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(zlib.compress(raw, 6))
+            os.replace(tmp, path)
+        with self._conn() as conn:
+            conn.execute(
+                'INSERT INTO fetches (url, fetched_at, digest, kind) VALUES (?, ?, ?, ?)',
+                (url, time.time(), digest, kind))
+        return digest
+
+    def latest_digests(self, urls):
+        """{URL: 最新一次抓取的摘要}，没有缓存的 URL 不在结果中。"""
+        urls = list(urls)
+        found = {}
+        conn = self._conn()
+        for i in range(0, len(urls), 500):
+            batch = urls[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT url, digest FROM fetches WHERE url IN ({placeholders}) ORDER BY fetched_at',
+                batch)
+            for url, digest in rows:
+                found[url] = digest
+        return found
+
+    def sample_pages(self, kind='game', limit=200):
+        """最近抓取的若干页面 HTML（基准测试用），相同内容只取一次。"""
+        rows = self._conn().execute(
+            'SELECT digest FROM fetches WHERE kind = ? GROUP BY digest '
+            'ORDER BY MAX(fetched_at) DESC LIMIT ?',
+            (kind, limit)).fetchall()
+        return [read_object(self.object_path(r[0])) for r in rows]
+
+    def get(self, url):
+        digest = self.latest_digests([url]).get(url)
+        return read_object(self.object_path(digest)) if digest else None
+
+
+def read_object(path):
+    with open(path, 'rb') as f:
+        return zlib.decompress(f.read()).decode('utf-8')
+
+
+def _extract(job):
+    # 在 worker 进程中运行：读取缓存文件并解析，解析失败返回 None
+    from crawler import parse_game_html
+    target_id, url, path = job
+    try:
+        return target_id, parse_game_html(read_object(path), target_id, url)
+    except Exception:
+        return target_id, None
+
+
+def reextract_task(task_manager, filename, cache, workers=None):
+    """用缓存的详情页 HTML 重新解析任务中的记录和失败ID，不访问网络。
+
+    返回 (统计信息, 内容有变化的记录列表)。
+    """
+    from crawler import PLACEHOLDER_TITLE, game_url
+
+    state = task_manager.load_state(filename)
+    if state is None:
+        return None, []
+
+    base_url = state.get('base_url')
+    urls = {gid: item.get('URL') or game_url(gid, base_url)
+            for gid, item in state.records.items()}
+    for gid in state.failed:
+        urls.setdefault(gid, game_url(gid, base_url))
+    digests = cache.latest_digests(urls.values())
+    jobs = [(gid, url, cache.object_path(digests[url]))
+            for gid, url in urls.items() if url in digests]
+
+    updated = []
+    recovered = 0
+    errors = 0
+    retries_cleared = False
+    with ProcessPoolExecutor(workers) as executor:
+        for gid, item in executor.map(_extract, jobs, chunksize=EXTRACT_CHUNKSIZE):
+            if item is None or item['Title'] == PLACEHOLDER_TITLE:
+                errors += 1
+                continue
+            if state.records.get(gid) != item:
+                state.upsert(item)
+                updated.append(item)
+            # 恢复的ID同时清除自动重试计划和死信标记
+            if state.clear_retry(gid):
+                retries_cleared = True
+            if state.remove_failed(gid):
+                recovered += 1
+
+    if updated or recovered or retries_cleared:
+        task_manager.save_task(filename, state)
+    stats = {
+        'candidates': len(urls),
+        'cached': len(jobs),
+        'updated': len(updated),
+        'recovered': recovered,
+        'errors': errors,
+    }
+    return stats, updated
+
+
+def bench_extractors(pages, repeat=3):
+    """对每个可用的 HTML 提取器计时，并检查结果与 bs4 是否一致。"""
+    from crawler import HTML_EXTRACTORS
+
+    reference = [HTML_EXTRACTORS['bs4'](html) for html in pages]
+    results = {}
+    for name, extract in HTML_EXTRACTORS.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = [extract(html) for html in pages]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            'ms_per_page': round(best * 1000 / len(pages), 3),
+            'mismatches': sum(a != b for a, b in zip(output, reference)),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    from storage import TaskManager, TASKS_DIR
+    from search import SearchIndex
+    from game_cache import GameCache
+
+    parser = argparse.ArgumentParser(
+        description='Re-run the game page parser over cached HTML, or benchmark the parsers.')
+    parser.add_argument('command', choices=['reextract', 'bench'])
+    parser.add_argument('filenames', nargs='*',
+                        help='reextract: task files (default: all tasks); '
+                             'bench: sample .html files (default: cached game pages)')
+    parser.add_argument('--tasks-dir', default=TASKS_DIR)
+    parser.add_argument('--backend', default=os.environ.get('TASK_BACKEND', 'json'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--limit', type=int, default=200,
+                        help='bench: number of cached pages to use')
+    args = parser.parse_args()
+
+    cache = HtmlCache.in_dir(args.tasks_dir)
+    if args.command == 'bench':
+        if args.filenames:
+            pages = []
+            for path in args.filenames:
+                with open(path, 'r', encoding='utf-8') as f:
+                    pages.append(f.read())
+        else:
+            pages = cache.sample_pages(limit=args.limit)
+        if not pages:
+            parser.exit(1, 'No sample pages: crawl with the HTML cache enabled or pass .html files.\n')
+        print(f"{len(pages)} pages, avg {sum(map(len, pages)) // len(pages) // 1024} KB")
+        for name, result in bench_extractors(pages).items():
+            print(f"{name:12} {result['ms_per_page']:8.3f} ms/page  "
+                  f"{result['mismatches']} mismatches vs bs4")
+        parser.exit()
+
+    manager = TaskManager(args.tasks_dir, backend=args.backend)
+    search_index = SearchIndex(args.tasks_dir)
+    game_cache = GameCache.in_dir(args.tasks_dir)
+    filenames = args.filenames or [t['filename'] for t in manager.list_tasks()]
+    for filename in filenames:
+        stats, updated = reextract_task(manager, filename, cache, args.workers)
+        if stats is None:
+            print(f"{filename}: not found")
+            continue
+        for item in updated:
+            search_index.add(filename, item)
+            game_cache.update_record(item)
+        print(f"{filename}: {stats}")
@@ -0,0 +1,255 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增计数器，按标签值分别计数。"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def values(self):
+        """{标签值元组: 计数}"""
+        with self._lock:
+            return dict(self._values)
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        for key, value in sorted(self.values().items()):
+            yield f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+
+
+class Histogram:
+    """分桶直方图（每个桶存非累计计数，输出时再累加），按标签值分别统计。"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 标签值元组 -> [各桶计数..., +Inf 桶计数, 总和, 总数]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def _empty(self):
+        return [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = self._empty()
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时（块内抛出异常时同样记录）。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def values(self):
+        with self._lock:
+            return {key: list(entry) for key, entry in self._values.items()}
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, other in values.items():
+                key = tuple(key)
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = self._empty()
+                for i, amount in enumerate(other):
+                    entry[i] += amount
+
+    def quantile(self, entry, q):
+        """按桶线性插值估算分位数（与 Prometheus histogram_quantile 相同）。"""
+        total = entry[-1]
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, entry):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        # 落在 +Inf 桶：只能返回最大的有限边界
+        return self.buckets[-1]
+
+    def render(self):
+        for key, entry in sorted(self.values().items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                le = labels + [('le', _format_value(bound))]
+                yield f"{self.name}_bucket{_format_labels(le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(entry[-2])}"
+            yield f"{self.name}_count{_format_labels(labels)} {entry[-1]}"
+
+
+class Registry:
+    """进程内的指标集合，输出 Prometheus 文本格式。
+
+    分片子进程定期 drain() 自己的增量并发回主进程 merge()，
+    所以主进程的 /api/metrics 也包含分片中的抓取耗时。
+    """
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def drain(self):
+        return {name: metric.drain() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshot):
+        for name, values in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric:
+                metric.merge(values)
+
+
+REGISTRY = Registry()
+
+# 爬虫各阶段耗时：list_* 为列表页，game_* 为详情页，parse 为 HTML 解析，
+# store 为写入一条结果（含存储后端和索引）
+STAGE_SECONDS = REGISTRY.histogram(
+    'crawler_stage_seconds', 'Time spent in each crawl stage.', ('stage',))
+NAVIGATION_RETRIES = REGISTRY.counter(
+    'crawler_navigation_retries_total', 'Browser navigations that were retried.', ('kind',))
+WAIT_TIMEOUTS = REGISTRY.counter(
+    'crawler_wait_timeouts_total', 'Waits for rendered content that timed out.', ('kind',))
+FAILURES = REGISTRY.counter(
+    'crawler_failures_total', 'Failed list page scans and game fetches.', ('kind',))
+RETRIES = REGISTRY.counter(
+    'crawler_retries_total', 'Failed games scheduled for retry or dead-lettered.', ('outcome',))
+GAMES = REGISTRY.counter(
+    'crawler_games_total', 'Games stored, by source (http, browser or cache).', ('source',))
+STORAGE_SECONDS = REGISTRY.histogram(
+    'storage_write_seconds', 'Task storage write time.', ('backend', 'op'))
+STORAGE_BYTES = REGISTRY.counter(
+    'storage_bytes_written_total', 'Bytes written by task storage.', ('backend',))
+CHECKPOINTS = REGISTRY.counter(
+    'storage_checkpoints_total',
+    'Crawler checkpoint requests, by outcome (written, deferred, timed or coalesced).', ('outcome',))
+
+
+def summary():
+    """状态接口用的摘要：各阶段次数/平均/p95 耗时和各计数器。"""
+    stages = {}
+    for (stage,), entry in STAGE_SECONDS.values().items():
+        p95 = STAGE_SECONDS.quantile(entry, 0.95)
+        stages[stage] = {
+            'count': entry[-1],
+            'avg_ms': round(entry[-2] / entry[-1] * 1000, 1) if entry[-1] else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+    writes = 0
+    write_seconds = 0.0
+    for entry in STORAGE_SECONDS.values().values():
+        writes += entry[-1]
+        write_seconds += entry[-2]
+
+    def flat(counter):
+        return {key[0]: value for key, value in counter.values().items()}
+
+    return {
+        'stages': stages,
+        'retries': flat(NAVIGATION_RETRIES),
+        'timeouts': flat(WAIT_TIMEOUTS),
+        'failures': flat(FAILURES),
+        'scheduled_retries': flat(RETRIES),
+        'games': flat(GAMES),
+        'storage': {
+            'writes': writes,
+            'avg_ms': round(write_seconds / writes * 1000, 2) if writes else None,
+            'bytes': sum(STORAGE_BYTES.values().values()),
+            'checkpoints': flat(CHECKPOINTS),
+        },
+    }
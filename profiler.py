@@ -0,0 +1,256 @@
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+PROFILES_DIRNAME = 'profiles'
+
+# 默认采样间隔（秒）和单次最长采样时间，超时自动停止并写出结果
+DEFAULT_INTERVAL = 0.01
+MIN_INTERVAL = 0.001
+MAX_DURATION = 600
+# 最多保留的会话数，更早的结果文件会被删除
+PROFILE_RETENTION = 20
+# 每隔多少秒重新获取要采样的线程
+THREAD_REFRESH = 1.0
+# 元数据中列出的最热函数数量
+TOP_FUNCTIONS = 20
+
+# 每个会话写出的文件：折叠栈（flamegraph.pl / speedscope 可直接打开）、
+# pstats 格式统计（pstats / snakeviz 可打开）和会话信息
+PROFILE_FILES = {
+    'collapsed': '.collapsed',
+    'prof': '.prof',
+    'json': '.json',
+}
+
+
+def _frame_key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _frame_label(key):
+    filename, lineno, name = key
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def _stack(frame):
+    """从最外层到当前函数的 (文件, 起始行, 函数名) 元组。"""
+    keys = []
+    while frame is not None:
+        keys.append(_frame_key(frame.f_code))
+        frame = frame.f_back
+    keys.reverse()
+    return tuple(keys)
+
+
+def collapse(samples):
+    """折叠栈文本：每行 “线程;外层函数;...;当前函数 样本数”。"""
+    lines = []
+    for (label, stack), count in samples.most_common():
+        frames = [label] + [_frame_label(k).replace(';', ':') for k in stack]
+        lines.append(f"{';'.join(frames)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def to_pstats(samples, interval):
+    """把采样结果换算成 cProfile 的统计格式（可用 pstats.Stats 加载）。
+
+    调用次数记为样本数；自身时间 = 位于栈顶的样本数 × 间隔，
+    累计时间 = 出现在栈中的样本数 × 间隔（递归只计一次）。
+    """
+    stats = {}
+
+    def entry(key):
+        if key not in stats:
+            stats[key] = [0, 0, 0.0, 0.0, {}]
+        return stats[key]
+
+    for (_, stack), count in samples.items():
+        if not stack:
+            continue
+        seconds = count * interval
+        entry(stack[-1])[2] += seconds
+        for key in set(stack):
+            e = entry(key)
+            e[0] += count
+            e[1] += count
+            e[3] += seconds
+        for i in range(1, len(stack)):
+            callers = entry(stack[i])[4]
+            cc, nc, tt, ct = callers.get(stack[i - 1], (0, 0, 0.0, 0.0))
+            own = seconds if i == len(stack) - 1 else 0.0
+            callers[stack[i - 1]] = (cc + count, nc + count, tt + own, ct + seconds)
+
+    return {key: (cc, nc, tt, ct, callers)
+            for key, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+class SamplingProfiler:
+    """定时读取指定线程的调用栈（sys._current_frames），不插桩，开销只与采样频率有关。
+
+    threads_fn 返回 {线程ID: 标签}，标签作为折叠栈的根，区分爬虫线程和请求线程。
+    """
+
+    def __init__(self, threads_fn, interval=DEFAULT_INTERVAL, duration=MAX_DURATION,
+                 on_finish=None):
+        self.threads_fn = threads_fn
+        self.interval = interval
+        self.duration = duration
+        self.on_finish = on_finish
+        self.samples = Counter()
+        self.sample_count = 0
+        self.labels = set()
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        start = time.monotonic()
+        threads = {}
+        refreshed = 0.0
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            if now - start >= self.duration:
+                break
+            if now - refreshed >= THREAD_REFRESH:
+                threads = self.threads_fn()
+                refreshed = now
+            frames = sys._current_frames()
+            for ident, label in threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[(label, _stack(frame))] += 1
+                    self.labels.add(label)
+            self.sample_count += 1
+            del frames
+        self.elapsed = time.monotonic() - start
+        if self.on_finish:
+            self.on_finish(self)
+
+
+class ProfilerManager:
+    """按需启动/停止采样分析，每次会话的结果保存在 profiles 目录下。"""
+
+    def __init__(self, profiles_dir, threads_fn, retention=PROFILE_RETENTION):
+        self.dir = profiles_dir
+        self.threads_fn = threads_fn
+        self.retention = retention
+        self.current = None
+        self.current_id = None
+        self.last_session = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def in_dir(cls, tasks_dir, threads_fn, retention=PROFILE_RETENTION):
+        return cls(os.path.join(tasks_dir, PROFILES_DIRNAME), threads_fn, retention)
+
+    def path(self, session_id, kind):
+        return os.path.join(self.dir, session_id + PROFILE_FILES[kind])
+
+    def start(self, interval=DEFAULT_INTERVAL, duration=MAX_DURATION):
+        """开始采样，已有会话在运行时返回 None。"""
+        interval = max(MIN_INTERVAL, float(interval))
+        duration = max(1.0, min(float(duration), MAX_DURATION))
+        with self._lock:
+            if self.current and self.current.running:
+                return None
+            self.current_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            self.current = SamplingProfiler(
+                self.threads_fn, interval, duration, on_finish=self._finish)
+            self.current.start()
+            return self.current_id
+
+    def stop(self):
+        """停止当前会话并返回其信息；没有正在运行的会话时返回 None。"""
+        profiler = self.current
+        if not profiler or not profiler.running:
+            return None
+        profiler.stop()
+        return self.last_session
+
+    def status(self):
+        profiler = self.current
+        if profiler and profiler.running:
+            return {
+                'running': True,
+                'session': self.current_id,
+                'interval_ms': profiler.interval * 1000,
+                'duration': profiler.duration,
+                'samples': profiler.sample_count,
+                'elapsed': round(time.time() - profiler.started_at, 1),
+            }
+        return {'running': False}
+
+    def _finish(self, profiler):
+        # 在采样线程中调用（手动停止或达到最长时间）
+        session_id = self.current_id
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self.path(session_id, 'collapsed'), 'w', encoding='utf-8') as f:
+            f.write(collapse(profiler.samples))
+        stats = to_pstats(profiler.samples, profiler.interval)
+        with open(self.path(session_id, 'prof'), 'wb') as f:
+            marshal.dump(stats, f)
+
+        top = sorted(stats.items(), key=lambda kv: -kv[1][2])[:TOP_FUNCTIONS]
+        info = {
+            'session': session_id,
+            'started_at': datetime.fromtimestamp(profiler.started_at).isoformat(timespec='seconds'),
+            'seconds': round(profiler.elapsed, 2),
+            'interval_ms': profiler.interval * 1000,
+            'samples': profiler.sample_count,
+            'threads': sorted(profiler.labels),
+            'top_self': [
+                {'function': _frame_label(key), 'self_seconds': round(s[2], 3),
+                 'total_seconds': round(s[3], 3)}
+                for key, s in top if s[2] > 0
+            ],
+        }
+        with open(self.path(session_id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        self.last_session = info
+        self._prune()
+
+    def list_sessions(self):
+        """已保存的会话信息，最新的在前。"""
+        if not os.path.isdir(self.dir):
+            return []
+        sessions = []
+        for name in sorted(os.listdir(self.dir), reverse=True):
+            if not name.endswith(PROFILE_FILES['json']):
+                continue
+            try:
+                with open(os.path.join(self.dir, name), 'r', encoding='utf-8') as f:
+                    sessions.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sessions
+
+    def _prune(self):
+        ids = sorted({os.path.splitext(name)[0] for name in os.listdir(self.dir)},
+                     reverse=True)
+        for session_id in ids[self.retention:]:
+            for kind in PROFILE_FILES:
+                path = self.path(session_id, kind)
+                if os.path.exists(path):
+                    os.remove(path)
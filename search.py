@@ -0,0 +1,251 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from db import thread_connection
+
+SEARCH_DB_FILENAME = 'search.db'
+
+# trigram 分词按 3 个字符切分，对中文同样适用；更短的词用 LIKE 过滤
+MIN_MATCH_LENGTH = 3
+MAX_LIMIT = 100
+SNIPPET_CHARS = 40
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace(
+        '%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def make_snippet(text, terms, width=SNIPPET_CHARS):
+    """在文本中截取第一个命中词附近的片段，命中词用 <mark> 标出。"""
+    text = text or ''
+    lower = text.lower()
+    pos = -1
+    for term in terms:
+        pos = lower.find(term.lower())
+        if pos >= 0:
+            break
+    start = max(0, pos - width // 2) if pos >= 0 else 0
+    end = min(len(text), start + width)
+    snippet = text[start:end]
+    if terms:
+        pattern = re.compile('|'.join(re.escape(t) for t in terms), re.I)
+        snippet = pattern.sub(lambda m: f'<mark>{m.group(0)}</mark>', snippet)
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+
+
+class SearchIndex:
+    """所有任务游戏标题/简介的全文索引（SQLite FTS5，trigram 分词）。
+
+    docs 表存原文，docs_fts 是外部内容 FTS 表，由触发器同步，
+    因此按 (filename, ID) upsert 一条记录就能增量更新索引。
+    SQLite 早于 3.34 时没有 trigram 分词，退化为只用 LIKE 查询 docs 表。
+    表在第一次使用时才创建。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        rowid INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        game_id INTEGER NOT NULL,
+        title TEXT,
+        description TEXT,
+        url TEXT,
+        UNIQUE (filename, game_id)
+    );
+    """
+
+    FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+        title, description, content='docs', content_rowid='rowid',
+        tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+        INSERT INTO docs_fts(rowid, title, description)
+        VALUES (new.rowid, new.title, new.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+        INSERT INTO docs_fts(docs_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+        INSERT INTO docs_fts(docs_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+        INSERT INTO docs_fts(rowid, title, description)
+        VALUES (new.rowid, new.title, new.description);
+    END;
+    """
+
+    UPSERT = """
+    INSERT INTO docs (filename, game_id, title, description, url)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (filename, game_id) DO UPDATE SET
+        title = excluded.title,
+        description = excluded.description,
+        url = excluded.url
+    """
+
+    def __init__(self, tasks_dir, db_filename=SEARCH_DB_FILENAME):
+        self.db_path = os.path.join(tasks_dir, db_filename)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        # 是否可用 FTS5 trigram，None 表示尚未建表
+        self.fts = None
+
+    def _conn(self):
+        conn = thread_connection(self._local, self.db_path)
+        if self.fts is None:
+            self._create_schema(conn)
+        return conn
+
+    def _create_schema(self, conn):
+        with self._init_lock:
+            if self.fts is not None:
+                return
+            with conn:
+                conn.executescript(self.SCHEMA)
+            try:
+                with conn:
+                    conn.executescript(self.FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError as e:
+                print(f"Warning: full-text search unavailable on SQLite "
+                      f"{sqlite3.sqlite_version} ({e}); falling back to LIKE.")
+                self.fts = False
+
+    @staticmethod
+    def _row(filename, item):
+        return (filename, item['ID'], item.get('Title'),
+                item.get('Description'), item.get('URL'))
+
+    # --- 写入 ---
+
+    def add(self, filename, item):
+        """爬虫保存一条记录时调用。"""
+        with self._conn() as conn:
+            conn.execute(self.UPSERT, self._row(filename, item))
+
+    def reindex(self, filename, records):
+        """重建某个任务的索引（records 可以是生成器）。"""
+        with self._conn() as conn:
+            conn.execute('DELETE FROM docs WHERE filename = ?', (filename,))
+            conn.executemany(
+                self.UPSERT, (self._row(filename, item) for item in records))
+
+    def remove(self, filename):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM docs WHERE filename = ?', (filename,))
+
+    def rename(self, old_filename, new_filename):
+        with self._conn() as conn:
+            conn.execute('UPDATE docs SET filename = ? WHERE filename = ?',
+                         (new_filename, old_filename))
+
+    def sync(self, task_manager):
+        """补建记录数与任务不一致的索引，删除已不存在的任务。"""
+        rows = self._conn().execute(
+            'SELECT filename, COUNT(*) FROM docs GROUP BY filename').fetchall()
+        indexed = dict(rows)
+        for task in task_manager.list_tasks():
+            filename = task['filename']
+            if indexed.pop(filename, None) != task['count']:
+                self.reindex(filename, task_manager.iter_records(filename))
+        for filename in indexed:
+            self.remove(filename)
+
+    # --- 查询 ---
+
+    def lookup(self, keys):
+        """按 (filename, ID) 取标题和链接，供其他查询补全结果。"""
+        conn = self._conn()
+        found = {}
+        for filename, game_id in keys:
+            row = conn.execute(
+                'SELECT title, url FROM docs WHERE filename = ? AND game_id = ?',
+                (filename, game_id)).fetchone()
+            if row:
+                found[(filename, game_id)] = row
+        return found
+
+    def search(self, query, limit=20, filename=None):
+        """按相关度返回命中的游戏，同一ID在多个任务中只返回一次。"""
+        start = time.monotonic()
+        terms = query.split()
+        conn = self._conn()
+        if self.fts:
+            long_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+            short_terms = [t for t in terms if len(t) < MIN_MATCH_LENGTH]
+        else:
+            long_terms = []
+            short_terms = terms
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        where = []
+        params = []
+        if long_terms:
+            where.append('docs_fts MATCH ?')
+            params.append(' '.join(_fts_phrase(t) for t in long_terms))
+        for term in short_terms:
+            where.append(
+                "(d.title LIKE ? ESCAPE '\\' OR d.description LIKE ? ESCAPE '\\')")
+            params += [_like_pattern(term)] * 2
+        if filename:
+            where.append('d.filename = ?')
+            params.append(filename)
+
+        results = []
+        if terms:
+            if long_terms:
+                # bm25 越小越相关，标题权重高于简介
+                sql = f"""
+                SELECT d.game_id, d.filename, d.title, d.url, d.description,
+                       -bm25(docs_fts, 10.0, 1.0) AS score
+                FROM docs_fts JOIN docs d ON d.rowid = docs_fts.rowid
+                WHERE {' AND '.join(where)}
+                ORDER BY score DESC LIMIT ?
+                """
+            else:
+                sql = f"""
+                SELECT d.game_id, d.filename, d.title, d.url, d.description,
+                       (d.title LIKE ? ESCAPE '\\') AS score
+                FROM docs d
+                WHERE {' AND '.join(where)}
+                ORDER BY score DESC, d.game_id LIMIT ?
+                """
+                params.insert(0, _like_pattern(short_terms[0]))
+            # 多取一些，合并重复ID后仍能凑满 limit
+            params.append(limit * 3)
+            rows = conn.execute(sql, params).fetchall()
+
+            by_id = {}
+            for game_id, fn, title, url, desc, score in rows:
+                hit = by_id.get(game_id)
+                if hit:
+                    hit['tasks'].append(fn)
+                    continue
+                if len(results) >= limit:
+                    continue
+                hit = {
+                    'ID': game_id,
+                    'Title': title,
+                    'URL': url,
+                    'title_html': make_snippet(title, terms, width=len(title or '')),
+                    'snippet': make_snippet(desc, terms),
+                    'score': round(score, 3),
+                    'tasks': [fn],
+                }
+                by_id[game_id] = hit
+                results.append(hit)
+
+        return {
+            'query': query,
+            'results': results,
+            'took_ms': round((time.monotonic() - start) * 1000, 2),
+        }
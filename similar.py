@@ -0,0 +1,218 @@
+import os
+import re
+import threading
+import zlib
+
+# numpy / scipy 是可选依赖，只有 /api/similar 需要
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+SIMILAR_DIRNAME = '.similar'
+
+# 字符 n-gram 用哈希映射到固定维度，增量加入新记录时不需要词表
+NGRAM_RANGE = (2, 3)
+HASH_DIM = 1 << 20
+MAX_LIMIT = 100
+
+_SPACES = re.compile(r'\s+')
+
+
+def available():
+    return np is not None
+
+
+def _text(item):
+    text = f"{item.get('Title') or ''} {item.get('Description') or ''}"
+    return _SPACES.sub(' ', text.lower()).strip()
+
+
+def _checksum(text):
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def _ngram_counts(text):
+    counts = {}
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        for i in range(len(text) - n + 1):
+            h = zlib.crc32(text[i:i + n].encode('utf-8')) % HASH_DIM
+            counts[h] = counts.get(h, 0) + 1
+    return counts
+
+
+def vectorize(texts):
+    """文本 -> 词频矩阵（CSR，次线性 tf = 1 + log(tf)）。"""
+    indptr = [0]
+    indices = []
+    data = []
+    for text in texts:
+        counts = _ngram_counts(text)
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    tf = sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32),
+         np.array(indptr, dtype=np.int64)),
+        shape=(len(texts), HASH_DIM))
+    tf.data = 1 + np.log(tf.data)
+    return tf
+
+
+class TaskVectors:
+    """一个任务的词频矩阵、行对应的游戏ID和文本校验和。"""
+
+    def __init__(self, tf=None, ids=None, checksums=None):
+        self.tf = tf if tf is not None else sparse.csr_matrix(
+            (0, HASH_DIM), dtype=np.float32)
+        self.ids = ids if ids is not None else np.zeros(0, dtype=np.int64)
+        self.checksums = checksums if checksums is not None else np.zeros(
+            0, dtype=np.int64)
+        self._weighted = None
+        self._idf = None
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            tf = sparse.csr_matrix(
+                (f['data'], f['indices'], f['indptr']), shape=(len(f['ids']), HASH_DIM))
+            return cls(tf, f['ids'], f['checksums'])
+
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, data=self.tf.data, indices=self.tf.indices,
+                            indptr=self.tf.indptr, ids=self.ids,
+                            checksums=self.checksums)
+        os.replace(tmp, path)
+
+    def update(self, records):
+        """与任务记录对比，只向量化新增或内容变化的记录，返回变化条数。"""
+        known = dict(zip(self.ids.tolist(), self.checksums.tolist()))
+        new_ids, new_sums, new_texts = [], [], []
+        seen = set()
+        for item in records:
+            text = _text(item)
+            checksum = _checksum(text)
+            seen.add(item['ID'])
+            if known.get(item['ID']) != checksum:
+                new_ids.append(item['ID'])
+                new_sums.append(checksum)
+                new_texts.append(text)
+
+        # 去掉已变化或已从任务中删除的行
+        changed = set(new_ids)
+        keep = np.array([gid in seen and gid not in changed
+                         for gid in self.ids.tolist()], dtype=bool)
+        removed = len(keep) - int(keep.sum())
+        if not new_ids and not removed:
+            return 0
+
+        self.tf = sparse.vstack(
+            [self.tf[keep], vectorize(new_texts)], format='csr')
+        self.ids = np.concatenate(
+            [self.ids[keep], np.array(new_ids, dtype=np.int64)])
+        self.checksums = np.concatenate(
+            [self.checksums[keep], np.array(new_sums, dtype=np.int64)])
+        self._weighted = None
+        return len(new_ids) + removed
+
+    def weighted(self):
+        """TF-IDF 矩阵（行已 L2 归一化），缓存到下次更新。"""
+        if self._weighted is None:
+            n = self.tf.shape[0]
+            df = np.bincount(self.tf.indices, minlength=HASH_DIM)
+            self._idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+            w = self.tf.multiply(self._idf.reshape(1, -1)).tocsr()
+            norms = np.sqrt(np.asarray(w.multiply(w).sum(axis=1))).ravel()
+            norms[norms == 0] = 1
+            self._weighted = sparse.diags(1 / norms).dot(w).tocsr()
+        return self._weighted, self._idf
+
+    def query(self, text, limit):
+        if self.tf.shape[0] == 0:
+            return []
+        weighted, idf = self.weighted()
+        q = vectorize([_SPACES.sub(' ', text.lower()).strip()])
+        q = q.multiply(idf.reshape(1, -1)).tocsr()
+        norm = np.sqrt(q.multiply(q).sum())
+        if norm == 0:
+            return []
+        scores = np.asarray(weighted.dot(q.T).todense()).ravel() / norm
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+class SimilarityIndex:
+    """按任务构建的字符 n-gram TF-IDF 相似度索引，持久化在 tasks/.similar/。
+
+    第一次查询某个任务时构建并保存；之后只有记录有变化（爬虫写入新记录，
+    或启动后记录数与索引不符）时才增量向量化变化的部分。
+    """
+
+    def __init__(self, tasks_dir):
+        self.dir = os.path.join(tasks_dir, SIMILAR_DIRNAME)
+        self._vectors = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        return os.path.join(self.dir, filename + '.npz')
+
+    def mark_dirty(self, filename):
+        """爬虫保存记录后调用，下次查询时刷新。"""
+        self._dirty.add(filename)
+
+    def remove(self, filename):
+        with self._lock:
+            self._vectors.pop(filename, None)
+            self._dirty.discard(filename)
+            if os.path.exists(self._path(filename)):
+                os.remove(self._path(filename))
+
+    def rename(self, old_filename, new_filename):
+        with self._lock:
+            if old_filename in self._vectors:
+                self._vectors[new_filename] = self._vectors.pop(old_filename)
+            if os.path.exists(self._path(old_filename)):
+                os.replace(self._path(old_filename), self._path(new_filename))
+
+    def _get(self, task_manager, filename):
+        vectors = self._vectors.get(filename)
+        if vectors is None:
+            path = self._path(filename)
+            vectors = TaskVectors.load(path) if os.path.exists(
+                path) else TaskVectors()
+            self._vectors[filename] = vectors
+
+        summary = task_manager.get_summary(filename)
+        if summary is None:
+            return None
+        if filename in self._dirty or summary['count'] != len(vectors.ids):
+            self._dirty.discard(filename)
+            if vectors.update(task_manager.iter_records(filename)):
+                os.makedirs(self.dir, exist_ok=True)
+                vectors.save(self._path(filename))
+        return vectors
+
+    def similar(self, task_manager, text, limit=20, filename=None):
+        """返回 [(ID, 相似度, 任务文件名)]，同一ID只保留最高分。"""
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        filenames = [filename] if filename else [
+            t['filename'] for t in task_manager.list_tasks()]
+
+        best = {}
+        with self._lock:
+            for fn in filenames:
+                vectors = self._get(task_manager, fn)
+                if vectors is None:
+                    continue
+                for gid, score in vectors.query(text, limit):
+                    if gid not in best or score > best[gid][0]:
+                        best[gid] = (score, fn)
+
+        hits = sorted(best.items(), key=lambda x: -x[1][0])[:limit]
+        return [(gid, score, fn) for gid, (score, fn) in hits]
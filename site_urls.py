@@ -0,0 +1,8 @@
+"""站点地址与详情页 URL 规则，爬虫与存储层共用（不依赖 Playwright）。"""
+
+# 站点地址，任务中的 base_url 可覆盖（例如指向本地模拟站点做基准测试）
+BASE_URL = 'https://zaixianwan.app'
+
+
+def game_url(target_id, base_url=None):
+    return f"{(base_url or BASE_URL).rstrip('/')}/games/{target_id}"
@@ -1,42 +1,640 @@
+import gzip
 import json
+import lzma
 import os
+import threading
 import time
+from collections import deque
 from datetime import datetime
+from task_state import ROW_FIELDS, TaskState
+from game_cache import DEFAULT_CACHE_TTL_DAYS
+from metrics import STORAGE_SECONDS, STORAGE_BYTES, CHECKPOINTS
+from site_urls import game_url
+from db import thread_connection
 
 TASKS_DIR = 'tasks'
+DB_FILENAME = 'tasks.db'
+INDEX_FILENAME = '.task_index'
+# 爬虫检查点：距上次写入至少间隔这么多秒，或积累这么多次保存才写一次
+CHECKPOINT_INTERVAL = 2.0
+CHECKPOINT_MAX_DIRTY = 20
+# 摘要字段变化时递增，旧索引自动作废
+INDEX_VERSION = 8
+
+# JSON 任务文件的写入格式，读取时按文件头自动识别：
+# json 为带缩进的 JSON（默认，可直接查看）；compact 为不带空白的 JSON；
+# gzip / xz 为压缩后的 compact。除 json 外都省略可由 ID 推出的 URL 字段
+TASK_FORMATS = ('json', 'compact', 'gzip', 'xz')
+_GZIP_MAGIC = b'\x1f\x8b'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+def summarize_task(filename, data):
+    return {
+        'filename': filename,
+        'name': data.get('name', 'Unknown'),
+        'task_type': data.get('task_type', 'unknown'),
+        'target_name': data.get('target_name', ''),
+        'start_page': data.get('start_page'),
+        'end_page': data.get('end_page'),
+        'current_page': data.get('current_page'),
+        'status': data.get('status', 'unknown'),
+        'created_at': data.get('created_at'),
+        'count': len(data.get('data', [])),
+        'failed_count': len(data.get('failed_ids', [])),
+        'retry_count': len(data.get('retry_schedule') or {}),
+        'dead_count': len(data.get('dead_ids') or []),
+        'queue_size': len(data.get('custom_queue', [])),
+        # 爬虫线程可能同时从队列头取出ID，不用下标访问
+        'queue_head': next(iter(data.get('custom_queue') or ()), None),
+        'delay': data.get('delay', 1.0),
+        'concurrency': data.get('concurrency', 1),
+        'fetch_strategy': data.get('fetch_strategy', 'auto'),
+        'shards': data.get('shards', 1),
+        'extractor': data.get('extractor', 'auto'),
+        'adaptive_rate': bool(data.get('adaptive_rate')),
+        'auto_range': bool(data.get('auto_range')),
+        'cache_ttl_days': data.get('cache_ttl_days', DEFAULT_CACHE_TTL_DAYS)
+    }
+
+
+def detect_format(raw):
+    """按文件头判断任务文件格式：gzip、xz 或 json（含 compact）。"""
+    if raw.startswith(_GZIP_MAGIC):
+        return 'gzip'
+    if raw.startswith(_XZ_MAGIC):
+        return 'xz'
+    return 'json'
+
+
+def encode_task(data, task_format='json'):
+    """把任务序列化为指定格式的字节串。"""
+    if task_format == 'json':
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+    base_url = data.get('base_url')
+    packed = dict(data)
+    if 'data' in data:
+        # URL 与按 ID 生成的一致时不保存，加载时再补上
+        packed['data'] = [
+            {k: v for k, v in item.items()
+             if k != 'URL' or v != game_url(item.get('ID'), base_url)}
+            for item in data['data']]
+    raw = json.dumps(packed, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if task_format == 'gzip':
+        return gzip.compress(raw, compresslevel=6, mtime=0)
+    if task_format == 'xz':
+        return lzma.compress(raw, preset=6)
+    return raw
+
+
+def decode_task(raw):
+    """解析任意格式的任务文件内容，补回省略的 URL。"""
+    task_format = detect_format(raw)
+    if task_format == 'gzip':
+        raw = gzip.decompress(raw)
+    elif task_format == 'xz':
+        raw = lzma.decompress(raw)
+    data = json.loads(raw.decode('utf-8'))
+
+    missing = [item for item in data.get('data', []) if 'URL' not in item]
+    if missing:
+        base_url = data.get('base_url')
+        for item in missing:
+            item['URL'] = game_url(item['ID'], base_url)
+    return data
+
+
+class JsonBackend:
+    """每个任务一个 JSON 文件（默认），格式见 TASK_FORMATS。"""
+
+    name = 'json'
+    incremental = False
+
+    def __init__(self, tasks_dir, task_format='json'):
+        if task_format not in TASK_FORMATS:
+            raise ValueError(f"Unknown task format: {task_format}")
+        self.tasks_dir = tasks_dir
+        self.task_format = task_format
+
+    def _get_file_path(self, filename):
+        return os.path.join(self.tasks_dir, filename)
+
+    def list_filenames(self):
+        return [f for f in os.listdir(self.tasks_dir) if f.endswith('.json')]
+
+    def exists(self, filename):
+        return os.path.exists(self._get_file_path(filename))
+
+    def stat_key(self, filename):
+        """任务文件的 (mtime, size)，用于判断索引中的摘要是否过期。"""
+        st = os.stat(self._get_file_path(filename))
+        return [st.st_mtime_ns, st.st_size]
+
+    def summarize(self, filename):
+        return summarize_task(filename, self.load(filename))
+
+    def load(self, filename):
+        path = self._get_file_path(filename)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return decode_task(f.read())
+        return None
+
+    def _write(self, path, data):
+        # 写入临时文件，调用方负责 os.replace
+        raw = encode_task(data, self.task_format)
+        with open(path, 'wb') as f:
+            f.write(raw)
+        STORAGE_BYTES.inc(len(raw), backend=self.name)
+
+    def iter_records(self, filename):
+        """按ID顺序逐条返回游戏记录（导出用）。JSON 文件只能整体解析。"""
+        data = self.load(filename)
+        if data is None:
+            return
+        yield from sorted(data.get('data', []), key=lambda x: x.get('ID', 0))
+
+    def save(self, filename, data):
+        path = self._get_file_path(filename)
+        # 保存前确保数据按ID排序
+        if 'data' in data and isinstance(data['data'], list):
+            data['data'].sort(key=lambda x: x.get('ID', 0))
+
+        # 原子写入：写入临时文件然后重命名
+        temp_path = path + '.tmp'
+        try:
+            self._write(temp_path, data)
+
+            # 重命名在POSIX上是原子的，在Windows上也是原子替换 (Python 3.3+)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Error saving task {filename}: {e}")
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except:
+                    pass
+
+    def checkpoint(self, filename, data):
+        self.save(filename, data)
+
+    def record(self, filename, kind, value):
+        pass
+
+    def delete(self, filename):
+        path = self._get_file_path(filename)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+
+class SqliteBackend:
+    """所有任务存放在一个 SQLite 数据库中，抓取结果按行 upsert。
+
+    checkpoint 只写任务头、失败页和重试队列，游戏记录、已发现ID和失败ID
+    通过 record 增量写入，因此检查点开销与任务大小无关。
+    """
+
+    name = 'sqlite'
+
+    incremental = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        filename TEXT PRIMARY KEY,
+        header TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS games (
+        filename TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        record TEXT NOT NULL,
+        PRIMARY KEY (filename, id)
+    );
+    CREATE TABLE IF NOT EXISTS discovered_ids (
+        filename TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        PRIMARY KEY (filename, id)
+    );
+    CREATE TABLE IF NOT EXISTS failed_ids (
+        filename TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        PRIMARY KEY (filename, id)
+    );
+    CREATE TABLE IF NOT EXISTS failed_pages (
+        filename TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        PRIMARY KEY (filename, page)
+    );
+    CREATE TABLE IF NOT EXISTS queue (
+        filename TEXT NOT NULL,
+        pos INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        PRIMARY KEY (filename, pos)
+    );
+    """
+
+    def __init__(self, tasks_dir, db_filename=DB_FILENAME):
+        self.db_path = os.path.join(tasks_dir, db_filename)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        return thread_connection(self._local, self.db_path)
+
+    def list_filenames(self):
+        rows = self._conn().execute('SELECT filename FROM tasks').fetchall()
+        return [r[0] for r in rows]
+
+    def exists(self, filename):
+        return self._conn().execute(
+            'SELECT 1 FROM tasks WHERE filename = ?', (filename,)).fetchone() is not None
+
+    def stat_key(self, filename):
+        # 摘要直接由 SQL 计数得到，不需要索引
+        return None
+
+    def summarize(self, filename):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT header FROM tasks WHERE filename = ?', (filename,)).fetchone()
+        summary = summarize_task(filename, json.loads(row[0]))
+        summary['count'] = conn.execute(
+            'SELECT COUNT(*) FROM games WHERE filename = ?', (filename,)).fetchone()[0]
+        summary['failed_count'] = conn.execute(
+            'SELECT COUNT(*) FROM failed_ids WHERE filename = ?', (filename,)).fetchone()[0]
+        queue = self._ids('queue', 'id', filename)
+        summary['queue_size'] = len(queue)
+        summary['queue_head'] = queue[0] if queue else None
+        return summary
+
+    def _ids(self, table, column, filename):
+        # 按插入顺序返回
+        rows = self._conn().execute(
+            f'SELECT {column} FROM {table} WHERE filename = ? ORDER BY rowid', (filename,)).fetchall()
+        return [r[0] for r in rows]
+
+    def load(self, filename):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT header FROM tasks WHERE filename = ?', (filename,)).fetchone()
+        if not row:
+            return None
+        data = json.loads(row[0])
+        data['data'] = [json.loads(r[0]) for r in conn.execute(
+            'SELECT record FROM games WHERE filename = ? ORDER BY id', (filename,))]
+        data['discovered_ids'] = self._ids('discovered_ids', 'id', filename)
+        data['failed_ids'] = self._ids('failed_ids', 'id', filename)
+        data['failed_pages'] = self._ids('failed_pages', 'page', filename)
+        data['custom_queue'] = [r[0] for r in conn.execute(
+            'SELECT id FROM queue WHERE filename = ? ORDER BY pos', (filename,))]
+        return data
+
+    def iter_records(self, filename):
+        # 游标逐行读取，不把整个任务载入内存
+        cursor = self._conn().execute(
+            'SELECT record FROM games WHERE filename = ? ORDER BY id', (filename,))
+        for row in cursor:
+            yield json.loads(row[0])
+
+    def _write_header(self, conn, filename, data):
+        header = json.dumps({k: v for k, v in data.items()
+                            if k not in ROW_FIELDS}, ensure_ascii=False)
+        # 写入量按序列化后的记录大小估算（不含索引和页开销）
+        STORAGE_BYTES.inc(len(header.encode('utf-8')), backend=self.name)
+        conn.execute('INSERT OR REPLACE INTO tasks (filename, header) VALUES (?, ?)',
+                     (filename, header))
+        conn.execute(
+            'DELETE FROM failed_pages WHERE filename = ?', (filename,))
+        conn.executemany('INSERT OR IGNORE INTO failed_pages (filename, page) VALUES (?, ?)',
+                         [(filename, p) for p in data.get('failed_pages', [])])
+        conn.execute('DELETE FROM queue WHERE filename = ?', (filename,))
+        conn.executemany('INSERT INTO queue (filename, pos, id) VALUES (?, ?, ?)',
+                         [(filename, i, gid) for i, gid in enumerate(data.get('custom_queue', []))])
+
+    def save(self, filename, data):
+        """完整写入（API 修改任务时使用）。"""
+        with self._conn() as conn:
+            self._write_header(conn, filename, data)
+            for table in ('games', 'discovered_ids', 'failed_ids'):
+                conn.execute(
+                    f'DELETE FROM {table} WHERE filename = ?', (filename,))
+            rows = [(filename, item['ID'], json.dumps(item, ensure_ascii=False))
+                    for item in data.get('data', [])]
+            STORAGE_BYTES.inc(sum(len(r[2].encode('utf-8'))
+                                  for r in rows), backend=self.name)
+            conn.executemany('INSERT OR REPLACE INTO games (filename, id, record) VALUES (?, ?, ?)',
+                             rows)
+            conn.executemany('INSERT OR IGNORE INTO discovered_ids (filename, id) VALUES (?, ?)',
+                             [(filename, gid) for gid in data.get('discovered_ids', [])])
+            conn.executemany('INSERT OR IGNORE INTO failed_ids (filename, id) VALUES (?, ?)',
+                             [(filename, gid) for gid in data.get('failed_ids', [])])
+
+    def checkpoint(self, filename, data):
+        with self._conn() as conn:
+            self._write_header(conn, filename, data)
+
+    def record(self, filename, kind, value):
+        """增量写入单条抓取事件。"""
+        with self._conn() as conn:
+            if kind == 'game':
+                record = json.dumps(value, ensure_ascii=False)
+                STORAGE_BYTES.inc(len(record.encode('utf-8')), backend=self.name)
+                conn.execute('INSERT OR REPLACE INTO games (filename, id, record) VALUES (?, ?, ?)',
+                             (filename, value['ID'], record))
+            elif kind == 'discovered':
+                conn.executemany('INSERT OR IGNORE INTO discovered_ids (filename, id) VALUES (?, ?)',
+                                 [(filename, gid) for gid in value])
+            elif kind == 'failed':
+                conn.execute('INSERT OR IGNORE INTO failed_ids (filename, id) VALUES (?, ?)',
+                             (filename, value))
+            elif kind == 'recovered':
+                conn.execute('DELETE FROM failed_ids WHERE filename = ? AND id = ?',
+                             (filename, value))
+
+    def delete(self, filename):
+        if not self.exists(filename):
+            return False
+        with self._conn() as conn:
+            for table in ('tasks', 'games', 'discovered_ids', 'failed_ids', 'failed_pages', 'queue'):
+                conn.execute(
+                    f'DELETE FROM {table} WHERE filename = ?', (filename,))
+        return True
+
+
+def replay_records(data, records):
+    """把日志记录依次应用到任务快照上。记录都是幂等的，重复回放结果不变。"""
+    for field in ROW_FIELDS:
+        data.setdefault(field, [])
+    index = {item['ID']: i for i, item in enumerate(data['data'])}
+    discovered = set(data['discovered_ids'])
+    failed = set(data['failed_ids'])
+
+    for record in records:
+        kind, value = record['k'], record['v']
+        if kind == 'game':
+            if value['ID'] in index:
+                data['data'][index[value['ID']]] = value
+            else:
+                index[value['ID']] = len(data['data'])
+                data['data'].append(value)
+        elif kind == 'discovered':
+            for gid in value:
+                if gid not in discovered:
+                    discovered.add(gid)
+                    data['discovered_ids'].append(gid)
+        elif kind == 'failed':
+            if value not in failed:
+                failed.add(value)
+                data['failed_ids'].append(value)
+        elif kind == 'recovered':
+            if value in failed:
+                failed.discard(value)
+                data['failed_ids'].remove(value)
+        elif kind == 'header':
+            data.update(value)
+    return data
+
+
+class JournalBackend(JsonBackend):
+    """JSON 快照 + 追加写日志。
+
+    抓取事件和检查点作为一行 JSONL 追加到任务文件旁的 <task>.journal，
+    后台线程定期把日志合并进快照（仍通过 os.replace 原子替换），
+    该线程在第一次追加日志时才启动，只读写快照的命令行工具不会启动它。
+    load 时回放 快照 + 日志，崩溃最多丢失一条记录。
+    """
+
+    name = 'journal'
+    incremental = True
+    COMPACT_INTERVAL = 60
+
+    def __init__(self, tasks_dir, task_format='json'):
+        super().__init__(tasks_dir, task_format)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._compactor = None
+
+    def _start_compactor(self):
+        with self._locks_guard:
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._compact_loop)
+                self._compactor.daemon = True
+                self._compactor.start()
+
+    def _lock(self, filename):
+        with self._locks_guard:
+            return self._locks.setdefault(filename, threading.Lock())
+
+    def _journal_path(self, filename):
+        return self._get_file_path(filename) + '.journal'
+
+    def _append(self, filename, kind, value):
+        if self._compactor is None:
+            self._start_compactor()
+        line = json.dumps({'k': kind, 'v': value}, ensure_ascii=False) + '\n'
+        with self._lock(filename):
+            with open(self._journal_path(filename), 'a', encoding='utf-8') as f:
+                f.write(line)
+        STORAGE_BYTES.inc(len(line.encode('utf-8')), backend=self.name)
+
+    def _read_journal(self, path):
+        records = []
+        if not os.path.exists(path):
+            return records
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时写了一半的行，跳过
+                    continue
+        return records
+
+    def summarize(self, filename):
+        # 索引只按快照文件失效；日志中的进度由 checkpoint_task 同步到索引
+        return summarize_task(filename, self.load(filename))
+
+    def load(self, filename):
+        data = super().load(filename)
+        if data is None:
+            return None
+        # 先回放正在合并的旧日志，再回放当前日志
+        journal = self._journal_path(filename)
+        records = self._read_journal(journal + '.compacting')
+        records += self._read_journal(journal)
+        return replay_records(data, records)
+
+    def save(self, filename, data):
+        """完整写入快照并清空日志（API 修改任务时使用）。"""
+        journal = self._journal_path(filename)
+        with self._lock(filename):
+            super().save(filename, data)
+            for path in (journal, journal + '.compacting'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def checkpoint(self, filename, data):
+        header = {k: v for k, v in data.items() if k not in (
+            'data', 'discovered_ids', 'failed_ids')}
+        self._append(filename, 'header', header)
+
+    def record(self, filename, kind, value):
+        self._append(filename, kind, value)
+
+    def delete(self, filename):
+        journal = self._journal_path(filename)
+        with self._lock(filename):
+            for path in (journal, journal + '.compacting'):
+                if os.path.exists(path):
+                    os.remove(path)
+            return super().delete(filename)
+
+    def compact(self, filename):
+        journal = self._journal_path(filename)
+        compacting = journal + '.compacting'
+        # 只在持锁时轮换日志文件，合并期间新的记录写入新日志，不阻塞爬虫
+        with self._lock(filename):
+            if not os.path.exists(compacting):
+                if not os.path.exists(journal) or os.path.getsize(journal) == 0:
+                    return
+                os.replace(journal, compacting)
+
+        data = JsonBackend.load(self, filename)
+        if data is None:
+            return
+        replay_records(data, self._read_journal(compacting))
+        data['data'].sort(key=lambda x: x.get('ID', 0))
+
+        path = self._get_file_path(filename)
+        temp_path = path + '.compact.tmp'
+        with STORAGE_SECONDS.time(backend=self.name, op='compact'):
+            self._write(temp_path, data)
+        with self._lock(filename):
+            if os.path.exists(compacting):
+                os.replace(temp_path, path)
+                os.remove(compacting)
+            else:
+                # 合并期间任务被完整保存过，放弃这次合并结果
+                os.remove(temp_path)
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.COMPACT_INTERVAL)
+            for filename in self.list_filenames():
+                try:
+                    self.compact(filename)
+                except Exception as e:
+                    print(f"Error compacting task {filename}: {e}")
+
+
+BACKENDS = {
+    'json': JsonBackend,
+    'journal': JournalBackend,
+    'sqlite': SqliteBackend,
+}
+
+
+class TaskIndex:
+    """任务摘要索引，持久化在 tasks/.task_index，按文件名 + (mtime, size) 失效。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION:
+                self.entries = index['entries']
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}
+
+    def get(self, filename, key):
+        with self._lock:
+            entry = self.entries.get(filename)
+            if entry and entry['key'] == key:
+                return dict(entry['summary'])
+        return None
+
+    def put(self, filename, key, summary):
+        with self._lock:
+            self.entries[filename] = {'key': key, 'summary': summary}
+            self._save()
+
+    def remove(self, filename):
+        with self._lock:
+            if self.entries.pop(filename, None) is not None:
+                self._save()
+
+    def prune(self, filenames):
+        with self._lock:
+            stale = set(self.entries) - set(filenames)
+            for filename in stale:
+                del self.entries[filename]
+            if stale:
+                self._save()
+
+    def _save(self):
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'entries': self.entries},
+                          f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Error saving task index: {e}")
 
 
 class TaskManager:
-    def __init__(self, tasks_dir=TASKS_DIR):
+    def __init__(self, tasks_dir=TASKS_DIR, backend='json', task_format='json'):
         self.tasks_dir = tasks_dir
         if not os.path.exists(self.tasks_dir):
             os.makedirs(self.tasks_dir)
+        backend_cls = BACKENDS[backend]
+        # task_format 只对 JSON 文件后端有效，SQLite 后端忽略
+        if issubclass(backend_cls, JsonBackend):
+            self.backend = backend_cls(tasks_dir, task_format)
+        else:
+            self.backend = backend_cls(tasks_dir)
+        self.index = TaskIndex(os.path.join(tasks_dir, INDEX_FILENAME))
 
-    def _get_file_path(self, filename):
-        return os.path.join(self.tasks_dir, filename)
+    def _summary(self, filename):
+        key = self.backend.stat_key(filename)
+        if key is None:
+            return self.backend.summarize(filename)
+        summary = self.index.get(filename, key)
+        if summary is None:
+            # 只有磁盘上发生变化的文件才重新解析
+            summary = self.backend.summarize(filename)
+            self.index.put(filename, key, summary)
+        return summary
+
+    def _update_index(self, filename, data, summary=None):
+        try:
+            key = self.backend.stat_key(filename)
+        except OSError:
+            return
+        if key is not None:
+            self.index.put(filename, key, summary or summarize_task(filename, data))
+
+    def get_summary(self, filename):
+        """单个任务的摘要（优先取索引，不解析未变化的任务文件）。"""
+        if not self.backend.exists(filename):
+            return None
+        return self._summary(filename)
 
     def list_tasks(self):
-        files = [f for f in os.listdir(self.tasks_dir) if f.endswith('.json')]
+        filenames = self.backend.list_filenames()
         tasks = []
-        for f in files:
+        for f in filenames:
             try:
-                with open(self._get_file_path(f), 'r', encoding='utf-8') as file:
-                    data = json.load(file)
-                    tasks.append({
-                        'filename': f,
-                        'name': data.get('name', 'Unknown'),
-                        'task_type': data.get('task_type', 'unknown'),
-                        'target_name': data.get('target_name', ''),
-                        'start_page': data.get('start_page'),
-                        'end_page': data.get('end_page'),
-                        'current_page': data.get('current_page'),
-                        'status': data.get('status', 'unknown'),
-                        'created_at': data.get('created_at'),
-                        'count': len(data.get('data', [])),
-                        'failed_count': len(data.get('failed_ids', []))
-                    })
+                tasks.append(self._summary(f))
             except Exception as e:
                 print(f"Error reading task {f}: {e}")
+        self.index.prune(filenames)
 
         # 按创建时间降序排序
         tasks.sort(key=lambda x: x.get('created_at', ''), reverse=True)
@@ -49,7 +647,8 @@ class TaskManager:
                 return task
         return None
 
-    def create_task(self, task_type, target_name, start_page, end_page, name=None):
+    def create_task(self, task_type, target_name, start_page, end_page, name=None,
+                    auto_range=False):
         # 任务类型: 'series' 或 'console'
         # 目标名称: 'mario', 'nes' 等
 
@@ -61,8 +660,9 @@ class TaskManager:
         safe_name = "".join([c for c in name if c.isalnum() or c in (
             ' ', '-', '_')]).strip().replace(' ', '_')
 
-        # 文件名: Name_pStart_pEnd.json
-        filename = f"{safe_name}_p{start_page}_p{end_page}.json"
+        # 文件名: Name_pStart_pEnd.json（自动确定页数时为 Name_pStart_pauto.json）
+        end_label = 'auto' if auto_range else end_page
+        filename = f"{safe_name}_p{start_page}_p{end_label}.json"
 
         task_data = {
             'name': name,
@@ -79,7 +679,15 @@ class TaskManager:
             'failed_ids': [],     # 失败的游戏ID
             'failed_pages': [],   # 失败的列表页
             'custom_queue': [],
-            'delay': 1.0
+            'delay': 1.0,
+            'adaptive_rate': False,  # 按延迟/超时/错误在 delay 对应的速率以下自动调整
+            'auto_range': bool(auto_range),  # 启动时查找最后一页并更新 end_page
+            'concurrency': 1,     # 并发抓取的详情页数量
+            'fetch_strategy': 'auto',  # auto / http / browser
+            'extractor': 'auto',  # auto / selectolax / lxml / bs4 / dom（浏览器内提取）
+            'shards': 1,          # 分片进程数（>1 时页码范围分给多个子进程）
+            'cache_ttl_days': DEFAULT_CACHE_TTL_DAYS,  # 其他任务抓过且不超过此天数的记录直接复制，0 表示总是抓取
+            'block_resources': True    # 浏览器不加载图片/字体/样式表/第三方统计
         }
 
         self.save_task(filename, task_data)
@@ -117,7 +725,7 @@ class TaskManager:
             return old_filename, None
 
         # 检查新文件名是否已存在
-        if os.path.exists(self._get_file_path(new_filename)):
+        if self.backend.exists(new_filename):
             return None, "A task with this configuration already exists"
 
         # 更新数据中的文件名
@@ -132,37 +740,245 @@ class TaskManager:
         return new_filename, None
 
     def load_task(self, filename):
-        path = self._get_file_path(filename)
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return None
+        return self.backend.load(filename)
+
+    def load_state(self, filename):
+        data = self.load_task(filename)
+        return TaskState(data) if data is not None else None
+
+    def iter_records(self, filename):
+        return self.backend.iter_records(filename)
 
     def save_task(self, filename, data):
-        path = self._get_file_path(filename)
-        # 保存前确保数据按ID排序
-        if 'data' in data and isinstance(data['data'], list):
-            data['data'].sort(key=lambda x: x.get('ID', 0))
+        with STORAGE_SECONDS.time(backend=self.backend.name, op='save'):
+            if isinstance(data, TaskState):
+                self.backend.save(filename, data.to_dict())
+            else:
+                self.backend.save(filename, data)
+            self._update_index(filename, data)
 
-        # 原子写入：写入临时文件然后重命名
-        temp_path = path + '.tmp'
-        try:
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+    def checkpoint_task(self, filename, data, summary=None):
+        """爬虫的周期性保存。增量后端只写任务头，JSON 后端完整写入。
 
-            # 重命名在POSIX上是原子的，在Windows上也是原子替换 (Python 3.3+)
-            os.replace(temp_path, path)
-        except Exception as e:
-            print(f"Error saving task {filename}: {e}")
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
+        data 为快照时（可能不含记录行），摘要由调用方传入。
+        """
+        with STORAGE_SECONDS.time(backend=self.backend.name, op='checkpoint'):
+            if isinstance(data, TaskState):
+                self.backend.checkpoint(filename, data.to_dict(
+                    rows=not self.backend.incremental))
+            else:
+                self.backend.checkpoint(filename, data)
+            self._update_index(filename, data, summary)
+
+    def record(self, filename, kind, value):
+        """爬虫的单条事件：game / discovered / failed / recovered。"""
+        with STORAGE_SECONDS.time(backend=self.backend.name, op='record'):
+            self.backend.record(filename, kind, value)
 
     def delete_task(self, filename):
-        path = self._get_file_path(filename)
-        if os.path.exists(path):
-            os.remove(path)
-            return True
-        return False
+        self.index.remove(filename)
+        return self.backend.delete(filename)
+
+
+class CheckpointWriter:
+    """在后台线程中写入爬虫检查点和搜索索引等附带更新，爬虫线程不等待磁盘。
+
+    submit 把任务标记为脏并记住最新的状态；距上次快照超过 interval 秒或已积累
+    max_dirty 次保存时立即生成快照（复制任务状态和摘要，不做序列化）交给后台线程，
+    否则由后台线程在 interval 到期时自己生成，因此任何修改最多延迟 interval 秒落盘。
+    后台线程还没写出的旧快照直接被新快照替换。run_later 提交的函数按顺序在写检查点
+    之前执行。爬虫结束时 flush 立即生成快照并等待它和之前提交的函数都执行完。
+    """
+
+    def __init__(self, task_manager, interval=CHECKPOINT_INTERVAL,
+                 max_dirty=CHECKPOINT_MAX_DIRTY):
+        self.task_manager = task_manager
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self._cond = threading.Condition()
+        # 文件名 -> (序号, 快照, 摘要)，每个任务最多一个待写快照
+        self._pending = {}
+        # 文件名 -> 最新状态 / 上次快照后的保存次数 / 上次快照时间 / 已写出的最大序号
+        self._states = {}
+        self._dirty = {}
+        self._last = {}
+        self._written = {}
+        # 按提交顺序执行的 (函数, 参数)
+        self._tasks = deque()
+        self._seq = 0
+        self.thread = threading.Thread(target=self._run, name='checkpoint-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, filename, state):
+        now = time.monotonic()
+        with self._cond:
+            self._states[filename] = state
+            dirty = self._dirty.get(filename, 0) + 1
+            self._dirty[filename] = dirty
+            if dirty < self.max_dirty and now - self._last.get(filename, 0) < self.interval:
+                CHECKPOINTS.inc(outcome='deferred')
+                # 唤醒后台线程按新的到期时间等待
+                self._cond.notify_all()
+                return
+        self._enqueue(filename, state, now)
+
+    def run_later(self, fn, *args):
+        """在后台线程中按顺序执行 fn(*args)，异常只打印。"""
+        with self._cond:
+            self._tasks.append((fn, args))
+            self._cond.notify_all()
+
+    def flush(self, filename, state):
+        """立即写入当前状态，返回时已落盘。"""
+        seq = self._enqueue(filename, state, time.monotonic())
+        with self._cond:
+            while self._written.get(filename, 0) < seq:
+                self._cond.wait()
+            # 爬虫已结束，不再持有任务状态
+            self._states.pop(filename, None)
+            self._dirty.pop(filename, None)
+
+    def _enqueue(self, filename, state, now):
+        # 快照只复制各集合（TaskState.to_dict 可在其他线程调用），
+        # 写入时任务状态可以继续变化
+        if isinstance(state, TaskState):
+            data = state.to_dict(rows=not self.task_manager.backend.incremental)
+        else:
+            data = dict(state)
+        summary = summarize_task(filename, state)
+        with self._cond:
+            self._seq += 1
+            if filename in self._pending:
+                CHECKPOINTS.inc(outcome='coalesced')
+            self._pending[filename] = (self._seq, data, summary)
+            self._dirty[filename] = 0
+            self._last[filename] = now
+            self._cond.notify_all()
+            return self._seq
+
+    def _due(self, now):
+        """(到期的脏任务, 下一个到期前的等待秒数)，调用时持有锁。"""
+        due = []
+        wait = None
+        for filename, dirty in self._dirty.items():
+            if dirty <= 0 or filename not in self._states:
+                continue
+            remaining = self._last.get(filename, 0) + self.interval - now
+            if remaining <= 0:
+                due.append((filename, self._states[filename]))
+            else:
+                wait = remaining if wait is None else min(wait, remaining)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._tasks or self._pending:
+                        due = []
+                        break
+                    due, wait = self._due(time.monotonic())
+                    if due:
+                        break
+                    self._cond.wait(wait)
+                tasks = list(self._tasks)
+                self._tasks.clear()
+
+            for filename, state in due:
+                try:
+                    CHECKPOINTS.inc(outcome='timed')
+                    self._enqueue(filename, state, time.monotonic())
+                except Exception as e:
+                    print(f"Error saving task {filename}: {e}")
+            if due:
+                continue
+
+            for fn, args in tasks:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"Error in background write {getattr(fn, '__name__', fn)}: {e}")
+
+            with self._cond:
+                # 先执行完之前提交的函数，flush 返回时它们也已执行
+                if self._tasks or not self._pending:
+                    continue
+                filename = next(iter(self._pending))
+                seq, data, summary = self._pending.pop(filename)
+            try:
+                self.task_manager.checkpoint_task(filename, data, summary)
+                CHECKPOINTS.inc(outcome='written')
+            except Exception as e:
+                print(f"Error saving task {filename}: {e}")
+            with self._cond:
+                self._written[filename] = seq
+                self._cond.notify_all()
+
+
+def migrate(tasks_dir, source, target, task_format='json'):
+    """在两种后端之间复制全部任务，例如 json -> sqlite。
+
+    JSON 文件按日志后端读写：读取时回放未合并的 .journal，写入时清掉旧日志，
+    否则最近一次合并之后的记录会丢失（或在之后被回放到新快照上）。
+    """
+    src = TaskManager(tasks_dir, backend='journal' if source == 'json' else source)
+    dst = TaskManager(tasks_dir, backend='journal' if target == 'json' else target,
+                      task_format=task_format)
+    count = 0
+    for filename in src.backend.list_filenames():
+        data = src.load_task(filename)
+        if data is None:
+            continue
+        dst.save_task(filename, data)
+        count += 1
+        print(f"{filename}: {len(data.get('data', []))} games")
+    print(f"Migrated {count} tasks from {source} to {target}.")
+
+
+def convert(tasks_dir, task_format, filenames=None):
+    """把 JSON 任务文件改写为指定格式（旧文件格式自动识别）。
+
+    按日志后端加载，未合并的 .journal 会一并写入快照。
+    """
+    manager = TaskManager(tasks_dir, backend='journal', task_format=task_format)
+    before = after = 0
+    for filename in filenames or manager.backend.list_filenames():
+        path = manager.backend._get_file_path(filename)
+        if not os.path.exists(path):
+            print(f"{filename}: not found")
+            continue
+        size = os.path.getsize(path) + sum(
+            os.path.getsize(p) for p in (path + '.journal', path + '.journal.compacting')
+            if os.path.exists(p))
+        manager.save_task(filename, manager.load_task(filename))
+        new_size = os.path.getsize(path)
+        before += size
+        after += new_size
+        print(f"{filename}: {size / 1024:.0f} KB -> {new_size / 1024:.0f} KB")
+    if after:
+        print(f"Total {before / 1024:.0f} KB -> {after / 1024:.0f} KB "
+              f"({before / after:.1f}x smaller, format {task_format}).")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Migrate tasks between storage backends or convert task file formats.')
+    parser.add_argument('command', choices=['migrate', 'export', 'convert'],
+                        help='migrate: tasks/*.json -> SQLite; export: SQLite -> tasks/*.json; '
+                             'convert: rewrite tasks/*.json in --format')
+    parser.add_argument('filenames', nargs='*', help='convert: task files (default: all tasks)')
+    parser.add_argument('--tasks-dir', default=TASKS_DIR)
+    parser.add_argument('--format', choices=TASK_FORMATS,
+                        default=os.environ.get('TASK_FORMAT', 'json'),
+                        help='file format for export and convert')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate(args.tasks_dir, 'json', 'sqlite')
+    elif args.command == 'export':
+        migrate(args.tasks_dir, 'sqlite', 'json', args.format)
+    else:
+        convert(args.tasks_dir, args.format, args.filenames)
@@ -0,0 +1,232 @@
+import heapq
+from collections import deque
+
+# 按行存储的字段，其余字段是任务头信息
+ROW_FIELDS = ('data', 'discovered_ids', 'failed_ids',
+              'failed_pages', 'custom_queue')
+
+# 自动重试的状态随任务头保存，但只能通过 TaskState 的方法修改
+RETRY_FIELDS = ('retry_schedule', 'dead_ids')
+
+
+class TaskState:
+    """任务的内存状态，带索引，供爬虫和 API 共同使用。
+
+    游戏记录按ID索引，失败ID/已发现ID/失败页是有序集合，重试队列是 deque，
+    所有增删查都是 O(1)。头信息字段仍可用 task['delay'] / task.get(...) 访问，
+    行字段通过 get/[] 返回只读视图（支持 len、in、迭代），
+    to_dict() 序列化为原有的 JSON 结构。
+
+    自动重试：retries 记录每个失败ID的失败次数和下次重试时间，最小堆按时间
+    取出到期的ID；超过最大次数的ID移入死信 dead，不再自动重试。
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        self._order = list(data.keys()) + \
+            [f for f in ROW_FIELDS + RETRY_FIELDS if f not in data]
+        self.header = {k: v for k, v in data.items()
+                       if k not in ROW_FIELDS + RETRY_FIELDS}
+
+        # dict 保持插入顺序，用作有序集合
+        self.records = {item['ID']: item for item in data.get('data', [])}
+        self.discovered = dict.fromkeys(data.get('discovered_ids', []))
+        self.failed = dict.fromkeys(data.get('failed_ids', []))
+        self.failed_pages = dict.fromkeys(data.get('failed_pages', []))
+        self.queue = deque(data.get('custom_queue', []))
+
+        # {ID: [失败次数, 下次重试时间]}，JSON 中键为字符串；
+        # 时间为 None 表示已取出但未完成，重新加载后立即重试
+        self.retries = {int(gid): [attempts, due or 0] for gid, (attempts, due) in
+                        (data.get('retry_schedule') or {}).items()}
+        self._retry_heap = [(due, gid) for gid, (_, due) in self.retries.items()]
+        heapq.heapify(self._retry_heap)
+        self.dead = dict.fromkeys(data.get('dead_ids', []))
+
+    # --- 头信息 / 兼容 dict 的访问 ---
+
+    def _row_view(self, key):
+        return {
+            'data': self.records.values(),
+            'discovered_ids': self.discovered.keys(),
+            'failed_ids': self.failed.keys(),
+            'failed_pages': self.failed_pages.keys(),
+            'custom_queue': self.queue,
+            'retry_schedule': self.retries,
+            'dead_ids': self.dead.keys(),
+        }[key]
+
+    def __getitem__(self, key):
+        if key in ROW_FIELDS + RETRY_FIELDS:
+            return self._row_view(key)
+        return self.header[key]
+
+    def __setitem__(self, key, value):
+        if key in ROW_FIELDS + RETRY_FIELDS:
+            raise KeyError(f"{key} is managed by TaskState methods")
+        self.header[key] = value
+
+    def __contains__(self, key):
+        return key in ROW_FIELDS + RETRY_FIELDS or key in self.header
+
+    def get(self, key, default=None):
+        if key in ROW_FIELDS + RETRY_FIELDS:
+            return self._row_view(key)
+        return self.header.get(key, default)
+
+    # --- 游戏记录 ---
+
+    def upsert(self, item):
+        """插入或替换一条记录，返回该ID之前是否已存在。"""
+        existed = item['ID'] in self.records
+        self.records[item['ID']] = item
+        return existed
+
+    def has_record(self, target_id):
+        return target_id in self.records
+
+    # --- 已发现ID ---
+
+    def add_discovered(self, ids):
+        """返回本次新增的ID（保持顺序）。"""
+        new_ids = [gid for gid in ids if gid not in self.discovered]
+        self.discovered.update(dict.fromkeys(new_ids))
+        return new_ids
+
+    # --- 失败ID / 失败页 ---
+
+    def add_failed(self, target_id):
+        if target_id in self.failed:
+            return False
+        self.failed[target_id] = None
+        return True
+
+    def remove_failed(self, target_id):
+        if target_id not in self.failed:
+            return False
+        del self.failed[target_id]
+        return True
+
+    def add_failed_page(self, page):
+        self.failed_pages[page] = None
+
+    def remove_failed_page(self, page):
+        self.failed_pages.pop(page, None)
+
+    # --- 重试队列 ---
+
+    def enqueue(self, ids):
+        """追加到重试队列，已在队列中的ID跳过，返回新增数量。"""
+        queued = set(self.queue)
+        added = 0
+        for gid in ids:
+            if gid not in queued:
+                queued.add(gid)
+                self.queue.append(gid)
+                added += 1
+        return added
+
+    def push_front(self, target_id):
+        self.queue.appendleft(target_id)
+
+    def pop_queue(self):
+        return self.queue.popleft()
+
+    def remove_queued(self, target_id):
+        """从重试队列中移除（已由分片处理完），返回是否在队列中。"""
+        try:
+            self.queue.remove(target_id)
+            return True
+        except ValueError:
+            return False
+
+    # --- 自动重试 ---
+
+    def schedule_retry(self, target_id, delay_fn, max_attempts, now):
+        """记录一次失败并安排下次重试，返回 (失败次数, 重试时间)。
+
+        失败次数达到 max_attempts 时移入死信，重试时间为 None。
+        """
+        attempts = self.retries.get(target_id, (0, 0))[0] + 1
+        if attempts >= max_attempts:
+            self.retries.pop(target_id, None)
+            self.dead[target_id] = None
+            return attempts, None
+        due = now + delay_fn(attempts)
+        self.retries[target_id] = [attempts, due]
+        heapq.heappush(self._retry_heap, (due, target_id))
+        return attempts, due
+
+    def pop_due_retries(self, now, limit):
+        """按到期时间取出最多 limit 个已到期的重试ID。"""
+        due_ids = []
+        while self._retry_heap and len(due_ids) < limit:
+            due, gid = self._retry_heap[0]
+            if due > now:
+                break
+            heapq.heappop(self._retry_heap)
+            entry = self.retries.get(gid)
+            # 堆中的旧条目（已成功或已重新安排）直接丢弃
+            if entry is None or entry[1] != due:
+                continue
+            entry[1] = None
+            due_ids.append(gid)
+        return due_ids
+
+    def requeue_in_flight(self):
+        """把已取出但未完成的重试（上次运行被停止时）重新标记为立即到期。"""
+        for gid, entry in self.retries.items():
+            if entry[1] is None:
+                entry[1] = 0
+                heapq.heappush(self._retry_heap, (0, gid))
+
+    def next_retry_at(self):
+        """最早的待重试时间，没有待重试的ID时返回 None。"""
+        while self._retry_heap:
+            due, gid = self._retry_heap[0]
+            entry = self.retries.get(gid)
+            if entry is not None and entry[1] == due:
+                return due
+            heapq.heappop(self._retry_heap)
+        return None
+
+    def clear_retry(self, target_id):
+        """抓取成功或手动重试时清除失败次数和死信标记。"""
+        found = self.retries.pop(target_id, None) is not None
+        if target_id in self.dead:
+            del self.dead[target_id]
+            found = True
+        return found
+
+    # --- 序列化 ---
+
+    def to_dict(self, rows=True):
+        """转换为 JSON 结构。rows=False 时省略 data/discovered_ids/failed_ids（用于检查点）。
+
+        各集合都先用 list() 整体复制，爬虫线程同时修改状态时也可以在其他线程调用。
+        头信息（current_page、重试队列等）先于记录行复制：爬虫总是先写入记录再推进
+        进度，所以快照中的进度不会超前于其中的记录，从快照恢复时不会跳过游戏。
+        """
+        header = dict(self.header)
+        values = {
+            'failed_pages': list(self.failed_pages),
+            'custom_queue': list(self.queue),
+            'retry_schedule': {str(gid): list(entry)
+                               for gid, entry in list(self.retries.items())},
+            'dead_ids': list(self.dead),
+        }
+        if rows:
+            values['data'] = sorted(
+                list(self.records.values()), key=lambda x: x.get('ID', 0))
+            values['discovered_ids'] = list(self.discovered)
+            values['failed_ids'] = list(self.failed)
+
+        data = {}
+        for key in self._order:
+            if key in values:
+                data[key] = values[key]
+            elif key in header:
+                data[key] = header[key]
+        for key, value in header.items():
+            data.setdefault(key, value)
+        return data
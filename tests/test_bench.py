@@ -0,0 +1,27 @@
+import pytest
+
+crawler = pytest.importorskip('crawler')
+bench = pytest.importorskip('bench')
+
+
+@pytest.fixture
+def site():
+    site = bench.MockSite(pages=3, per_page=10, latency=0.005, error_rate=0.2, seed=1)
+    site.start()
+    yield site
+    site.stop()
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+@pytest.mark.parametrize('strategy', ['http', 'auto'])
+def test_http_crawl_of_mock_site(site, monkeypatch, strategy, concurrency):
+    # 模拟站点在服务端渲染，列表页和详情页都通过 HTTP 读取，不需要 Chromium；
+    # 503 的页面很快被自动重试
+    monkeypatch.setattr(crawler, 'RETRY_BASE_DELAY', 0.05)
+    result = bench.run_benchmark(site.base_url, 3, strategy, concurrency,
+                                 delay=0.0, timeout=60)
+    assert result['error'] is None
+    assert result['status'] == 'completed'
+    assert result['games'] == 30
+    assert result['failed'] == 0
+    assert result['browser'] == 0
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from storage import CheckpointWriter, TaskManager
+
+
+@pytest.fixture(params=['json', 'journal', 'sqlite'])
+def manager(request, tmp_path):
+    manager = TaskManager(str(tmp_path), backend=request.param)
+    manager.save_task('t.json', {'name': 'T', 'current_page': 0, 'data': []})
+    writes = []
+    checkpoint_task = manager.checkpoint_task
+
+    def counting(filename, data, summary=None):
+        writes.append(data['current_page'])
+        checkpoint_task(filename, data, summary)
+
+    manager.checkpoint_task = counting
+    manager.writes = writes
+    return manager
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_flush_writes_latest_state(manager):
+    writer = CheckpointWriter(manager, interval=60)
+    state = manager.load_state('t.json')
+    for page in range(1, 6):
+        state['current_page'] = page
+        writer.submit('t.json', state)
+        wait_for(lambda: manager.writes == [1])
+    state.upsert({'ID': 1, 'Title': 'A', 'URL': 'https://zaixianwan.app/games/1'})
+    manager.record('t.json', 'game', state.records[1])
+    writer.flush('t.json', state)
+
+    # 第一次保存立即写入，其余在间隔内推迟，flush 写出最新状态
+    assert manager.writes == [1, 5]
+    loaded = manager.load_task('t.json')
+    assert loaded['current_page'] == 5
+    assert [item['ID'] for item in loaded['data']] == [1]
+    assert manager.get_summary('t.json')['count'] == 1
+
+
+def test_max_dirty_forces_write(manager):
+    writer = CheckpointWriter(manager, interval=60, max_dirty=3)
+    state = manager.load_state('t.json')
+    expected = []
+    for page in range(1, 8):
+        state['current_page'] = page
+        writer.submit('t.json', state)
+        if page % 3 == 1:
+            expected.append(page)
+        wait_for(lambda: manager.writes == expected)
+    writer.flush('t.json', state)
+    assert manager.writes == [1, 4, 7, 7]
+
+
+def test_pending_snapshots_coalesce(manager):
+    writer = CheckpointWriter(manager, interval=60, max_dirty=1)
+    release = threading.Event()
+    writer.run_later(release.wait)
+    state = manager.load_state('t.json')
+    for page in range(1, 6):
+        state['current_page'] = page
+        writer.submit('t.json', state)
+    release.set()
+    writer.flush('t.json', state)
+    # 后台线程忙时提交的快照只保留最新一个
+    assert manager.writes == [5]
+
+
+def test_deferred_change_written_after_interval(manager):
+    writer = CheckpointWriter(manager, interval=0.2)
+    state = manager.load_state('t.json')
+    state['current_page'] = 1
+    writer.submit('t.json', state)
+    state['current_page'] = 2
+    writer.submit('t.json', state)
+    wait_for(lambda: manager.writes == [1])
+
+    # 之后不再提交，推迟的修改在间隔到期时写出
+    wait_for(lambda: manager.writes == [1, 2])
+    assert manager.load_task('t.json')['current_page'] == 2
+    time.sleep(0.3)
+    assert manager.writes == [1, 2]
+
+
+def test_run_later_order_and_flush(manager):
+    writer = CheckpointWriter(manager, interval=60)
+    calls = []
+    writer.run_later(calls.append, 1)
+    writer.run_later(lambda: 1 / 0)
+    writer.run_later(calls.append, 2)
+    state = manager.load_state('t.json')
+    writer.flush('t.json', state)
+    # 函数的异常不影响后续写入，flush 返回时之前提交的函数都已执行
+    assert calls == [1, 2]
+    assert manager.writes == [0]
@@ -0,0 +1,112 @@
+import pytest
+
+crawler = pytest.importorskip('crawler')
+
+from task_state import TaskState
+
+
+def discover(last_page, repeat_last, first=1, end_page=2):
+    """在模拟的列表页上运行自动页数探测，返回 (新终止页, 列出的页, 探测的页)。"""
+    c = crawler.Crawler()
+    c.task_data = TaskState({'name': 'T', 'start_page': 1, 'current_page': first,
+                             'end_page': end_page, 'data': []})
+    c.running = True
+    c.acquire_slot = lambda: None
+    c.log_callback = None
+    probes = []
+
+    def probe(session, page):
+        probes.append(page)
+        if page > last_page:
+            if not repeat_last:
+                return []
+            page = last_page
+        return [page * 100 + i for i in range(3)]
+
+    c._probe_list_page = probe
+    listed = c._discover_range(None)
+    return c.task_data['end_page'], listed, probes
+
+
+@pytest.mark.parametrize('repeat_last', [False, True], ids=['empty', 'repeat'])
+@pytest.mark.parametrize('last_page', [1, 2, 3, 5, 13, 100])
+def test_discover_range(last_page, repeat_last):
+    end_page, listed, probes = discover(last_page, repeat_last)
+    assert end_page == last_page
+    assert sorted(listed) == sorted(p for p in set(probes) if p <= last_page)
+    assert all(ids == [p * 100 + i for i in range(3)] for p, ids in listed.items())
+    # 每页最多请求一次
+    assert len(probes) == len(set(probes))
+
+
+def test_discover_range_from_current_page():
+    end_page, listed, _ = discover(13, True, first=7)
+    assert end_page == 13
+    assert min(listed) == 7
+
+
+@pytest.mark.parametrize('repeat_last', [False, True], ids=['empty', 'repeat'])
+def test_discover_range_past_last_page(repeat_last):
+    # 当前页已超出范围：不再有剩余的页
+    end_page, listed, _ = discover(3, repeat_last, first=5)
+    assert end_page == 4
+    assert listed == {}
+
+
+class FakeSession:
+    def close(self):
+        pass
+
+
+class FakeCrawler:
+    """GameFetchPool 需要的最小爬虫接口，抓取结果直接由 ID 生成。"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.processing_id = None
+
+    def _new_browser_session(self):
+        return FakeSession()
+
+    def wait_until_runnable(self):
+        return True
+
+    def begin_fetch(self):
+        pass
+
+    def end_fetch(self):
+        pass
+
+    def acquire_slot(self):
+        pass
+
+    def _timed_fetch(self, session, target_id):
+        import time
+        time.sleep(self.delay)
+        if target_id < 0:
+            raise Exception('fetch failed')
+        return {'ID': target_id}, self.delay
+
+
+def test_fetch_pool_results():
+    pool = crawler.GameFetchPool(FakeCrawler(), 3)
+    try:
+        results = list(pool.run([1, 2, -3, 4]))
+    finally:
+        pool.close()
+    assert sorted(r[0] for r in results) == [-3, 1, 2, 4]
+    assert [r[1] for r in results if r[0] == 4] == [{'ID': 4}]
+    assert [str(r[2]) for r in results if r[0] == -3] == ['fetch failed']
+
+
+def test_fetch_pool_abandoned_batch():
+    pool = crawler.GameFetchPool(FakeCrawler(), 2)
+    try:
+        results = pool.run(list(range(1, 21)))
+        first = [next(results) for _ in range(2)]
+        # 调用方写入出错时放弃这一批，下一批只收到自己的结果
+        results.close()
+        assert all(r[1] for r in first)
+        assert sorted(r[0] for r in pool.run([101, 102, 103])) == [101, 102, 103]
+    finally:
+        pool.close()
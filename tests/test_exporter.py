@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+import pytest
+
+from exporter import stream_export
+
+RECORDS = [
+    {'ID': 1, 'Title': '超级马里奥', 'URL': 'https://zaixianwan.app/games/1'},
+    {'ID': 2, 'Title': 'Contra', 'Description': 'Run and gun', 'Year': 1987},
+    {'Extra': 'x', 'ID': 3, 'Title': 'Tetris', 'URL': 'https://zaixianwan.app/games/3'},
+]
+
+
+def read_csv(chunks):
+    text = b''.join(chunks).decode('utf-8')
+    assert text.startswith('\ufeff')
+    return list(csv.reader(io.StringIO(text[1:])))
+
+
+def test_csv_columns_from_all_records():
+    rows = read_csv(stream_export(RECORDS, 'csv'))
+    # 预期列在前，其余列按首次出现的顺序
+    assert rows[0] == ['ID', 'Title', 'URL', 'Description', 'Year', 'Extra']
+    assert rows[2] == ['2', 'Contra', '', 'Run and gun', '1987', '']
+    assert rows[3] == ['3', 'Tetris', 'https://zaixianwan.app/games/3', '', '', 'x']
+
+
+@pytest.mark.parametrize('wrap', [iter, lambda r: (item for item in r), lambda r: lambda: iter(r)],
+                         ids=['iterator', 'generator', 'callable'])
+def test_one_shot_and_callable_sources(wrap):
+    rows = read_csv(stream_export(wrap(RECORDS), 'csv'))
+    assert len(rows) == 4
+    assert rows[0][-1] == 'Extra'
+
+
+def test_xlsx_columns():
+    from openpyxl import load_workbook
+
+    data = b''.join(stream_export(RECORDS, 'xlsx'))
+    ws = load_workbook(io.BytesIO(data), read_only=True)['Games']
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0] == ('ID', 'Title', 'URL', 'Description', 'Year', 'Extra')
+    assert rows[1][:2] == (1, '超级马里奥')
+    assert rows[2][4] == 1987
+    assert len(rows) == 4
+
+
+def test_jsonl_keeps_records_as_is():
+    lines = b''.join(stream_export(iter(RECORDS), 'jsonl')).decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS
+
+
+def test_parquet_columns():
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    table = pq.read_table(io.BytesIO(b''.join(stream_export(RECORDS, 'parquet'))))
+    assert table.column_names == ['ID', 'Title', 'URL', 'Description', 'Year', 'Extra']
+    assert table.column('ID').to_pylist() == [1, 2, 3]
+    # 除 ID 外都是字符串列，数字值写为文本
+    assert table.column('Year').to_pylist() == [None, '1987', None]
+
+
+@pytest.mark.parametrize('fmt', ['xlsx', 'csv', 'jsonl'])
+def test_empty_export(fmt):
+    assert stream_export([], fmt) is None
+    assert stream_export(iter([]), fmt) is None
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        stream_export(RECORDS, 'xml')
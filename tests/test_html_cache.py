@@ -0,0 +1,29 @@
+from html_cache import HtmlCache
+
+
+def test_put_and_get(tmp_path):
+    cache = HtmlCache(str(tmp_path))
+    digest = cache.put('u1', '<h1>超级马里奥</h1>', 'game')
+    assert cache.put('u2', '<h1>超级马里奥</h1>', 'game') == digest
+    assert cache.get('u1') == cache.get('u2') == '<h1>超级马里奥</h1>'
+    cache.put('u1', '<h1>new</h1>', 'game')
+    assert cache.get('u1') == '<h1>new</h1>'
+    assert cache.get('missing') is None
+
+
+def test_sample_pages_most_recent_first(tmp_path, monkeypatch):
+    import html_cache
+    from types import SimpleNamespace
+
+    cache = HtmlCache(str(tmp_path))
+    now = [0.0]
+    monkeypatch.setattr(html_cache, 'time', SimpleNamespace(time=lambda: now[0]))
+    for t, url, html in ((1, 'u1', 'a'), (2, 'u2', 'b'), (3, 'u3', 'c'),
+                         (4, 'u1', 'a'), (5, 'l1', 'list')):
+        now[0] = t
+        cache.put(url, html, 'list' if url == 'l1' else 'game')
+
+    # 相同内容只返回一次，按最近一次抓取排序
+    assert cache.sample_pages() == ['a', 'c', 'b']
+    assert cache.sample_pages(limit=2) == ['a', 'c']
+    assert cache.sample_pages('list') == ['list']
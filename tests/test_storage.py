@@ -0,0 +1,253 @@
+import pytest
+
+from storage import TaskManager
+
+
+def make_task(n=5):
+    return {
+        'name': 'Test',
+        'task_type': 'series',
+        'target_name': 'mario',
+        'start_page': 1,
+        'end_page': 2,
+        'current_page': 2,
+        'status': 'paused',
+        'created_at': '20240101_120000',
+        'delay': 0.5,
+        'data': [{'ID': i, 'Title': f'Game {i}',
+                  'URL': f'https://zaixianwan.app/games/{i}',
+                  'Description': '中文简介'} for i in range(n, 0, -1)],
+        'discovered_ids': list(range(1, n + 3)),
+        'failed_ids': [n + 1, n + 2],
+        'failed_pages': [2],
+        'custom_queue': [n + 2, n + 1],
+        'retry_schedule': {str(n + 1): [1, 123.5]},
+        'dead_ids': [n + 2],
+    }
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_save_load_round_trip(tmp_path, backend):
+    manager = TaskManager(str(tmp_path), backend=backend)
+    task = make_task()
+    manager.save_task('t.json', task)
+
+    loaded = manager.load_task('t.json')
+    assert [item['ID'] for item in loaded['data']] == [1, 2, 3, 4, 5]
+    assert loaded['data'][0] == {'ID': 1, 'Title': 'Game 1',
+                                 'URL': 'https://zaixianwan.app/games/1',
+                                 'Description': '中文简介'}
+    for key in ('name', 'status', 'delay', 'discovered_ids', 'failed_ids',
+                'failed_pages', 'custom_queue', 'retry_schedule', 'dead_ids'):
+        assert loaded[key] == task[key], key
+    assert [item['ID'] for item in manager.iter_records('t.json')] == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_state_round_trip(tmp_path, backend):
+    manager = TaskManager(str(tmp_path), backend=backend)
+    manager.save_task('t.json', make_task())
+    state = manager.load_state('t.json')
+    state.upsert({'ID': 9, 'Title': 'New', 'URL': 'https://zaixianwan.app/games/9'})
+    state.remove_failed(6)
+    manager.save_task('t.json', state)
+
+    loaded = manager.load_state('t.json')
+    assert loaded.has_record(9)
+    assert list(loaded.failed) == [7]
+    assert loaded.to_dict() == state.to_dict()
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_record_and_checkpoint(tmp_path, backend):
+    manager = TaskManager(str(tmp_path), backend=backend)
+    manager.save_task('t.json', make_task())
+    state = manager.load_state('t.json')
+
+    # 爬虫的写入顺序：单条事件 + 周期性检查点
+    game = {'ID': 10, 'Title': 'Game 10', 'URL': 'https://zaixianwan.app/games/10'}
+    state.upsert(game)
+    manager.record('t.json', 'game', game)
+    state.add_discovered([10, 11])
+    manager.record('t.json', 'discovered', [10, 11])
+    state.add_failed(11)
+    manager.record('t.json', 'failed', 11)
+    state.remove_failed(6)
+    manager.record('t.json', 'recovered', 6)
+    state['current_page'] = 3
+    manager.checkpoint_task('t.json', state)
+
+    loaded = manager.load_task('t.json')
+    assert loaded['current_page'] == 3
+    assert loaded['data'][-1] == game
+    assert loaded['discovered_ids'][-2:] == [10, 11]
+    assert loaded['failed_ids'] == [7, 11]
+    assert manager.get_summary('t.json')['count'] == 6
+
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_list_and_delete(tmp_path, backend):
+    manager = TaskManager(str(tmp_path), backend=backend)
+    manager.save_task('a.json', make_task(2))
+    manager.save_task('b.json', make_task(3))
+    assert sorted(t['filename'] for t in manager.list_tasks()) == ['a.json', 'b.json']
+
+    assert manager.delete_task('a.json')
+    assert manager.load_task('a.json') is None
+    assert not manager.delete_task('a.json')
+    assert [t['count'] for t in manager.list_tasks()] == [3]
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    from storage import migrate
+
+    source = TaskManager(str(tmp_path), backend='json')
+    source.save_task('t.json', make_task())
+    migrate(str(tmp_path), 'json', 'sqlite')
+
+    target = TaskManager(str(tmp_path), backend='sqlite')
+    assert target.load_state('t.json').to_dict() == source.load_state('t.json').to_dict()
+
+
+def journal_task(tmp_path):
+    manager = TaskManager(str(tmp_path), backend='journal')
+    manager.save_task('t.json', make_task())
+    state = manager.load_state('t.json')
+    for gid in (6, 7):
+        game = {'ID': gid, 'Title': f'Game {gid}',
+                'URL': f'https://zaixianwan.app/games/{gid}'}
+        state.upsert(game)
+        manager.record('t.json', 'game', game)
+    state.remove_failed(6)
+    manager.record('t.json', 'recovered', 6)
+    state['current_page'] = 3
+    manager.checkpoint_task('t.json', state)
+    return manager, state
+
+
+def test_journal_replay(tmp_path):
+    manager, state = journal_task(tmp_path)
+    journal = tmp_path / 't.json.journal'
+    assert journal.exists()
+    # 快照本身还没有变化，加载时回放日志
+    assert len(TaskManager(str(tmp_path)).load_task('t.json')['data']) == 5
+    assert manager.load_state('t.json').to_dict() == state.to_dict()
+
+    # 崩溃时写了一半的最后一行被跳过
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write('{"k": "game", "v": {"ID"')
+    assert manager.load_state('t.json').to_dict() == state.to_dict()
+
+
+def test_journal_compact(tmp_path):
+    manager, state = journal_task(tmp_path)
+    manager.backend.compact('t.json')
+
+    assert not (tmp_path / 't.json.journal').exists()
+    assert not (tmp_path / 't.json.journal.compacting').exists()
+    snapshot = TaskManager(str(tmp_path)).load_task('t.json')
+    assert [item['ID'] for item in snapshot['data']] == [1, 2, 3, 4, 5, 6, 7]
+    assert snapshot['current_page'] == 3
+    assert manager.load_state('t.json').to_dict() == state.to_dict()
+
+
+def test_journal_compacting_left_over(tmp_path):
+    # 合并中途崩溃：.compacting 中的旧日志先于新日志回放
+    manager, state = journal_task(tmp_path)
+    journal = tmp_path / 't.json.journal'
+    journal.rename(tmp_path / 't.json.journal.compacting')
+    state['current_page'] = 4
+    manager.checkpoint_task('t.json', state)
+    assert manager.load_task('t.json')['current_page'] == 4
+
+    # 先只合并旧日志，新日志留到下一次
+    manager.backend.compact('t.json')
+    assert (tmp_path / 't.json.journal').exists()
+    assert TaskManager(str(tmp_path)).load_task('t.json')['current_page'] == 3
+    assert manager.load_task('t.json')['current_page'] == 4
+    manager.backend.compact('t.json')
+    assert not (tmp_path / 't.json.journal').exists()
+    assert manager.load_state('t.json').to_dict() == state.to_dict()
+
+
+def test_journal_save_clears_journal(tmp_path):
+    manager, state = journal_task(tmp_path)
+    manager.save_task('t.json', state)
+    assert not (tmp_path / 't.json.journal').exists()
+    assert manager.load_state('t.json').to_dict() == state.to_dict()
+
+
+@pytest.mark.parametrize('task_format', ['json', 'compact', 'gzip', 'xz'])
+@pytest.mark.parametrize('backend', ['json', 'journal'])
+def test_task_format_round_trip(tmp_path, backend, task_format):
+    from storage import detect_format
+
+    manager = TaskManager(str(tmp_path), backend=backend, task_format=task_format)
+    task = make_task()
+    # 与按 ID 生成的不同的 URL 原样保存
+    task['data'][0]['URL'] = 'https://example.com/games/5?ref=1'
+    manager.save_task('t.json', task)
+
+    raw = (tmp_path / 't.json').read_bytes()
+    assert detect_format(raw) == ('json' if task_format == 'compact' else task_format)
+    loaded = manager.load_task('t.json')
+    assert loaded['data'] == sorted(task['data'], key=lambda x: x['ID'])
+    # 其他格式的文件也能被默认格式的管理器读取
+    assert TaskManager(str(tmp_path), backend=backend).load_task('t.json') == loaded
+
+
+@pytest.mark.parametrize('task_format', ['compact', 'gzip', 'xz'])
+def test_compact_formats_omit_derived_urls(task_format):
+    import gzip
+    import json
+    import lzma
+    from storage import decode_task, encode_task
+
+    task = make_task(3)
+    task['base_url'] = 'http://127.0.0.1:8000/'
+    task['data'][1]['URL'] = 'http://127.0.0.1:8000/games/2'
+    raw = encode_task(task, task_format)
+    plain = {'gzip': gzip.decompress, 'xz': lzma.decompress}.get(task_format, bytes)(raw)
+    packed = json.loads(plain)
+    # 只有与 base_url + ID 一致的 URL 被省略
+    assert ['URL' in item for item in packed['data']] == [True, False, True]
+    assert b'\n' not in plain
+
+    loaded = decode_task(raw)
+    assert loaded['data'][1]['URL'] == 'http://127.0.0.1:8000/games/2'
+    assert loaded == task
+
+
+def test_convert(tmp_path, capsys):
+    from storage import convert, detect_format
+
+    manager = TaskManager(str(tmp_path), backend='journal')
+    manager.save_task('t.json', make_task())
+    manager.record('t.json', 'game', {'ID': 6, 'Title': 'Game 6',
+                                      'URL': 'https://zaixianwan.app/games/6'})
+    expected = manager.load_task('t.json')
+
+    convert(str(tmp_path), 'xz')
+    assert detect_format((tmp_path / 't.json').read_bytes()) == 'xz'
+    assert not (tmp_path / 't.json.journal').exists()
+    assert TaskManager(str(tmp_path)).load_task('t.json') == expected
+    assert 'format xz' in capsys.readouterr().out
+
+
+def test_migrate_replays_journal(tmp_path):
+    from storage import migrate
+
+    journal = TaskManager(str(tmp_path), backend='journal')
+    journal.save_task('t.json', make_task())
+    game = {'ID': 6, 'Title': 'Game 6', 'URL': 'https://zaixianwan.app/games/6'}
+    journal.record('t.json', 'game', game)
+    migrate(str(tmp_path), 'json', 'sqlite')
+
+    sqlite = TaskManager(str(tmp_path), backend='sqlite')
+    assert sqlite.load_task('t.json')['data'][-1] == game
+
+    # 导出回 JSON 时清掉旧日志，之后不会被重复回放
+    sqlite.record('t.json', 'recovered', 6)
+    migrate(str(tmp_path), 'sqlite', 'json')
+    assert not (tmp_path / 't.json.journal').exists()
+    assert journal.load_task('t.json')['failed_ids'] == [7]
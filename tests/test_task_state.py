@@ -0,0 +1,108 @@
+from task_state import TaskState
+
+
+def delay(attempts):
+    return 10 * 2 ** (attempts - 1)
+
+
+def test_row_operations():
+    state = TaskState({'name': 'T', 'data': [{'ID': 2}, {'ID': 1}],
+                       'custom_queue': [5]})
+    assert not state.upsert({'ID': 3})
+    assert state.upsert({'ID': 1, 'Title': 'new'})
+    assert state.add_discovered([1, 2, 4]) == [1, 2, 4]
+    assert state.add_discovered([4, 6]) == [6]
+    assert state.add_failed(7) and not state.add_failed(7)
+    assert state.remove_failed(7) and not state.remove_failed(7)
+    assert state.enqueue([5, 6, 7]) == 2
+    assert state.remove_queued(6) and not state.remove_queued(6)
+    assert state.pop_queue() == 5
+
+    data = state.to_dict()
+    assert [item['ID'] for item in data['data']] == [1, 2, 3]
+    assert data['data'][0]['Title'] == 'new'
+    assert data['custom_queue'] == [7]
+    assert list(data)[0] == 'name'
+
+
+def test_retry_backoff_and_dead_letter():
+    state = TaskState()
+    assert state.next_retry_at() is None
+    assert state.schedule_retry(1, delay, 3, now=100) == (1, 110)
+    assert state.schedule_retry(2, delay, 3, now=105) == (1, 115)
+    assert state.next_retry_at() == 110
+
+    assert state.pop_due_retries(now=109, limit=10) == []
+    assert state.pop_due_retries(now=120, limit=10) == [1, 2]
+    # 取出后未完成的不会再次到期
+    assert state.pop_due_retries(now=1000, limit=10) == []
+    assert state.next_retry_at() is None
+
+    assert state.schedule_retry(1, delay, 3, now=120) == (2, 140)
+    assert state.schedule_retry(1, delay, 3, now=140) == (3, None)
+    assert list(state.dead) == [1]
+    assert 1 not in state.retries
+    assert state.pop_due_retries(now=1000, limit=10) == []
+
+
+def test_pop_due_retries_limit_and_order():
+    state = TaskState()
+    for gid, now in ((3, 30), (1, 10), (2, 20)):
+        state.schedule_retry(gid, delay, 5, now=now)
+    assert state.pop_due_retries(now=100, limit=2) == [1, 2]
+    assert state.pop_due_retries(now=100, limit=2) == [3]
+
+
+def test_rescheduled_entry_replaces_old_one():
+    state = TaskState()
+    state.schedule_retry(1, delay, 5, now=0)
+    state.schedule_retry(1, delay, 5, now=5)
+    assert state.retries[1] == [2, 25]
+    # 堆中 10 秒到期的旧条目被丢弃
+    assert state.pop_due_retries(now=20, limit=10) == []
+    assert state.next_retry_at() == 25
+    assert state.pop_due_retries(now=25, limit=10) == [1]
+
+
+def test_clear_retry():
+    state = TaskState()
+    state.schedule_retry(1, delay, 5, now=0)
+    state.schedule_retry(2, delay, 1, now=0)
+    assert list(state.dead) == [2]
+    assert state.clear_retry(1)
+    assert state.clear_retry(2)
+    assert not state.clear_retry(3)
+    assert state.retries == {} and list(state.dead) == []
+    assert state.pop_due_retries(now=100, limit=10) == []
+
+
+def test_retry_state_survives_serialization():
+    state = TaskState({'name': 'T'})
+    state.schedule_retry(1, delay, 5, now=0)
+    state.schedule_retry(2, delay, 5, now=0)
+    state.schedule_retry(3, delay, 1, now=0)
+    assert state.pop_due_retries(now=10, limit=1) == [1]
+
+    data = state.to_dict(rows=False)
+    assert data['retry_schedule'] == {'1': [1, None], '2': [1, 10]}
+    assert data['dead_ids'] == [3]
+
+    loaded = TaskState(data)
+    assert loaded.retries == {1: [1, 0], 2: [1, 10]}
+    assert list(loaded.dead) == [3]
+    # 上次取出但未完成的重试在重新加载后立即到期
+    assert loaded.next_retry_at() == 0
+    assert loaded.pop_due_retries(now=10, limit=10) == [1, 2]
+
+
+def test_requeue_in_flight():
+    state = TaskState()
+    state.schedule_retry(1, delay, 5, now=0)
+    state.schedule_retry(2, delay, 5, now=50)
+    assert state.pop_due_retries(now=10, limit=10) == [1]
+    assert state.next_retry_at() == 60
+
+    state.requeue_in_flight()
+    assert state.retries[1] == [1, 0]
+    assert state.pop_due_retries(now=10, limit=10) == [1]
+    assert state.pop_due_retries(now=60, limit=10) == [2]